@@ -0,0 +1,7 @@
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'achareh.settings')
+# serve the read-heavy endpoints from their async variants (see core.async_views)
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
+application = get_asgi_application()
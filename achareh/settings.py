@@ -26,10 +26,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.traffic.TrafficCaptureMiddleware',
+    'core.nplusone.NPlusOneMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -53,11 +56,93 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'achareh.wsgi.application'
+ASGI_APPLICATION = 'achareh.asgi.application'
+# achareh/asgi.py turns this on: GETs on the read-heavy endpoints use core.async_views
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', '0') == '1'
 
-DATABASES = {
-    'default': {
+# Database: SQLite by default. Set DB_ENGINE=postgres (plus DB_NAME, DB_USER,
+# DB_PASSWORD, DB_HOST, DB_PORT) for the Postgres primary, and
+# DB_REPLICA_HOSTS=host1,host2 for read replicas. With SQLite, DB_REPLICA_HOSTS
+# lists replica database files instead, which is enough to exercise the router
+# locally.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+# Production profile for SQLite deployments: these pragmas on every connection,
+# and transactions that take the write lock up front (BEGIN IMMEDIATE) so a
+# read-then-write transaction waits out the busy timeout instead of failing with
+# "database is locked" when it upgrades. `python manage.py benchmark_sqlite`
+# compares it with the stock settings.
+SQLITE_PRODUCTION = os.environ.get('SQLITE_PRODUCTION', '0') == '1'
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # negative: KiB rather than pages
+    'cache_size': -int(os.environ.get('SQLITE_CACHE_KIB', 64 * 1024)),
+}
+SQLITE_PRODUCTION_OPTIONS = {
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)) / 1000,
+    'init_command': ';'.join(f'PRAGMA {name} = {value}' for name, value in SQLITE_PRAGMAS.items()),
+}
+
+if DB_ENGINE == 'postgres':
+    _primary = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'achareh'),
+        'USER': os.environ.get('DB_USER', 'achareh'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+    }
+    _replica_key = 'HOST'
+else:
+    _primary = {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'NAME': os.environ.get('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        'OPTIONS': SQLITE_PRODUCTION_OPTIONS if SQLITE_PRODUCTION else {},
+    }
+    _replica_key = 'NAME'
+
+DATABASES = {'default': _primary}
+for _i, _target in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica{_i + 1}'] = {**_primary, _replica_key: _target.strip(), 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+# how long a user's reads stick to the primary after they write
+DB_PIN_SECONDS = int(os.environ.get('DB_PIN_SECONDS', 5))
+
+# Optional per-city sharding of ads and their proposals, comments and ratings
+# (see core.sharding). DB_SHARDS=tehran,mashhad adds the shard_tehran and
+# shard_mashhad databases: db_shard_<name>.sqlite3 files with SQLite, or
+# name=host entries for Postgres hosts. Cities are matched by shard name or
+# DB_SHARD_CITIES=تهران=tehran,karaj=tehran; any other city is hashed onto a
+# shard. Users, tickets, jobs and the id->shard map stay on ``default``.
+DB_SHARDS = []
+for _entry in filter(None, os.environ.get('DB_SHARDS', '').split(',')):
+    _name, _, _target = (part.strip() for part in _entry.partition('='))
+    if DB_ENGINE == 'postgres':
+        DATABASES[f'shard_{_name}'] = {**_primary, 'HOST': _target or _primary['HOST']}
+    else:
+        DATABASES[f'shard_{_name}'] = {**_primary, 'NAME': _target or os.path.join(BASE_DIR, f'db_shard_{_name}.sqlite3')}
+    DB_SHARDS.append(f'shard_{_name}')
+DB_SHARD_CITIES = {
+    _city.strip(): f'shard_{_name.strip()}'
+    for _city, _, _name in (_pair.partition('=') for _pair in filter(None, os.environ.get('DB_SHARD_CITIES', '').split(',')))
+}
+if DB_SHARDS:
+    DATABASE_ROUTERS = ['core.sharding.ShardRouter'] + DATABASE_ROUTERS
+
+# Shared cache for counters, throttles and snapshots. Defaults to per-process
+# memory; point CACHE_BACKEND/CACHE_LOCATION at Redis or Memcached when running
+# several workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
@@ -94,6 +179,83 @@ REST_FRAMEWORK.update({
     'PAGE_SIZE': 10,
 })
 
+# Rate limits (core.throttling): sliding windows counted in the shared cache, so
+# point CACHE_BACKEND at Redis/memcached when running several processes.
+# Rates are per client; ``<scope>.<role>`` overrides ``<scope>``; None is unlimited.
+REST_FRAMEWORK.update({
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.RoleRateThrottle',
+        'core.throttling.EndpointRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': os.environ.get('THROTTLE_ANON_RATE', '120/min'),
+        'customer': '600/min',
+        'contractor': '600/min',
+        'support': '2000/min',
+        'staff': None,
+        'search': '60/min',
+        'search.anon': '20/min',
+        'batch': '60/min',
+        'login.ip': '30/min',
+        # failed logins only, see LoginIdentifierThrottle
+        'login.identifier': '10/h',
+    },
+    'NUM_PROXIES': int(os.environ['NUM_PROXIES']) if os.environ.get('NUM_PROXIES') else None,
+})
+
+# /api/batch/ limits
+BATCH_API_MAX_REQUESTS = int(os.environ.get('BATCH_API_MAX_REQUESTS', 20))
+BATCH_API_MAX_WORKERS = int(os.environ.get('BATCH_API_MAX_WORKERS', 4))
+
+# /api/tickets/<id>/messages/stream/ limits
+TICKET_STREAM_MAX_CONNECTIONS = int(os.environ.get('TICKET_STREAM_MAX_CONNECTIONS', 100))
+TICKET_STREAM_HEARTBEAT_SECONDS = 15
+TICKET_STREAM_MAX_SECONDS = 300
+TICKET_STREAM_POLL_MAX_SECONDS = 30
+
+# Background jobs (manage.py run_workers). Eager mode runs them in-process on commit.
+JOBS_RUN_EAGERLY = os.environ.get('JOBS_RUN_EAGERLY', '0') == '1'
+JOBS_RETRY_BASE_SECONDS = 5
+JOBS_RETRY_MAX_SECONDS = 3600
+# running jobs refresh their heartbeat this often; run_workers --stale-after must be longer
+JOBS_HEARTBEAT_SECONDS = 30
+
+# Idempotency-Key replay (core.idempotency); purge with `manage.py purge_idempotency_keys`
+IDEMPOTENCY_KEY_TTL_SECONDS = 24 * 3600
+# a duplicate waits this long for the first request before getting 409
+IDEMPOTENCY_WAIT_SECONDS = 10
+# a pending key older than this is treated as abandoned (its request crashed)
+IDEMPOTENCY_LOCK_SECONDS = 60
+
+# estimated title/description similarity above which a new ad is linked to an
+# open ad as its duplicate (core.dedup)
+AD_DUPLICATE_THRESHOLD = float(os.environ.get('AD_DUPLICATE_THRESHOLD', 0.7))
+
+# N+1 detection (core.nplusone): a request running one statement shape more
+# than NPLUSONE_THRESHOLD times is logged with the serializer field and line
+# that issued it; NPLUSONE_RAISE=1 turns that into an error (CI). In tests use
+# `pytest -p core.pytest_nplusone`. On by default only with DEBUG.
+NPLUSONE_ENABLED = os.environ.get('NPLUSONE_ENABLED', '1' if DEBUG else '0') == '1'
+NPLUSONE_THRESHOLD = int(os.environ.get('NPLUSONE_THRESHOLD', 5))
+NPLUSONE_RAISE = os.environ.get('NPLUSONE_RAISE', '0') == '1'
+
+# Traffic capture for `manage.py replay` (core.traffic): a sample of /api/
+# requests is written to a size-rotated NDJSON log. Values of the fields below
+# (query parameters and JSON body keys) are replaced by keyed word hashes, as
+# are the ids in request paths.
+TRAFFIC_CAPTURE_ENABLED = os.environ.get('TRAFFIC_CAPTURE_ENABLED', '0') == '1'
+TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.environ.get('TRAFFIC_CAPTURE_SAMPLE_RATE', 0.1))
+TRAFFIC_CAPTURE_PATH = os.environ.get('TRAFFIC_CAPTURE_PATH', os.path.join(BASE_DIR, 'traffic.ndjson'))
+TRAFFIC_CAPTURE_MAX_BYTES = 50 * 1024 * 1024
+TRAFFIC_CAPTURE_BACKUPS = 5
+TRAFFIC_CAPTURE_PREFIX = '/api/'
+TRAFFIC_CAPTURE_MASK_FIELDS = [
+    'username', 'identifier', 'password', 'email', 'phone_number', 'token',
+    'title', 'description', 'message', 'text', 'comment', 'search', 'q',
+    # user ids
+    'creator__id', 'contractor', 'assignee', 'creator', 'user',
+]
+
 # drf-spectacular OpenAPI / Swagger settings
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Achareh API',
@@ -1,26 +1,163 @@
-from django.contrib import admin
-from .models import Ad, Proposal, Comment, Rating, Ticket
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import Ad, Category, City, Proposal, Comment, Rating, Ticket, TicketMessage, Schedule, SupportAgentLoad
+from .search import normalize_text
+from . import snapshots
+
+
+class EstimatedCountPaginator(Paginator):
+    """Uses the planner's row estimate instead of ``COUNT(*)`` for unfiltered
+    changelists on large Postgres tables; exact everywhere else."""
+
+    # below this many rows an exact count is cheap and more useful
+    exact_count_limit = 100000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where:
+            return super().count
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [query.model._meta.db_table])
+            row = cursor.fetchone()
+        estimate = row[0] if row else -1
+        if estimate < self.exact_count_limit:
+            # -1 means the table has never been analyzed
+            return super().count
+        return estimate
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Defaults for changelists over very large tables.
+
+    Related users and ads are joined in the changelist query and edited by id,
+    searches only use indexed lookups, and the total count is estimated.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    @staticmethod
+    def _is_id_lookup(name):
+        return name.endswith('__exact') and name.removesuffix('__exact').split('__')[-1] in ('id', 'pk')
+
+    def get_search_fields(self, request):
+        # the stock search casts integer columns to text for __exact, which no index serves
+        return [name for name in super().get_search_fields(request) if not self._is_id_lookup(name)]
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        id_lookups = [name for name in self.search_fields if self._is_id_lookup(name)]
+        if id_lookups and search_term.strip():
+            if not self.get_search_fields(request):
+                results = queryset.none()
+            if search_term.strip().isdigit():
+                results |= queryset.filter(Q.create([(name, int(search_term)) for name in id_lookups], connector=Q.OR))
+        return results, may_have_duplicates
+
 
 @admin.register(Ad)
-class AdAdmin(admin.ModelAdmin):
+class AdAdmin(ScalableAdmin):
     list_display = ('id', 'title', 'creator', 'status', 'created_at')
+    list_select_related = ('creator',)
+    list_filter = ('status',)
+    raw_id_fields = ('creator',)
+    # search_text is trigram-indexed on Postgres (migration 0009)
+    search_fields = ('id__exact', 'search_text__contains')
+    actions = ('cancel_ads',)
+
+    def get_search_results(self, request, queryset, search_term):
+        return super().get_search_results(request, queryset, normalize_text(search_term))
+
+    @admin.action(description='Cancel selected open ads')
+    def cancel_ads(self, request, queryset):
+        open_ads = queryset.filter(status='open')
+        with transaction.atomic():
+            ad_ids = list(open_ads.values_list('id', flat=True))
+            canceled = open_ads.update(status='canceled')
+            # the UPDATE bypasses the post_save signal that refreshes snapshots
+            snapshots.invalidate(ad_ids)
+        self.message_user(request, f'{canceled} ads canceled.', messages.SUCCESS)
 
 
 @admin.register(Proposal)
-class ProposalAdmin(admin.ModelAdmin):
+class ProposalAdmin(ScalableAdmin):
     list_display = ('id', 'ad', 'contractor', 'price', 'accepted')
+    list_select_related = ('ad', 'contractor')
+    raw_id_fields = ('ad', 'contractor')
+    search_fields = ('id__exact', 'ad__id__exact', 'contractor__username__exact')
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ScalableAdmin):
     list_display = ('id', 'ad', 'author', 'created_at')
+    list_select_related = ('ad', 'author')
+    raw_id_fields = ('ad', 'author')
+    search_fields = ('id__exact', 'ad__id__exact', 'author__username__exact')
 
 
 @admin.register(Rating)
-class RatingAdmin(admin.ModelAdmin):
+class RatingAdmin(ScalableAdmin):
     list_display = ('id', 'contractor', 'rater', 'score')
+    list_select_related = ('contractor', 'rater')
+    raw_id_fields = ('contractor', 'rater', 'ad')
+    search_fields = ('id__exact', 'contractor__username__exact', 'rater__username__exact')
 
 
 @admin.register(Ticket)
-class TicketAdmin(admin.ModelAdmin):
+class TicketAdmin(ScalableAdmin):
     list_display = ('id', 'title', 'creator', 'assignee', 'status')
+    list_select_related = ('creator', 'assignee')
+    list_filter = ('status',)
+    raw_id_fields = ('creator', 'assignee')
+    search_fields = ('id__exact', 'creator__username__exact', 'assignee__username__exact')
+    actions = ('close_tickets',)
+
+    @admin.action(description='Close selected tickets')
+    def close_tickets(self, request, queryset):
+        open_tickets = queryset.filter(status__in=Ticket.OPEN_STATUSES)
+        with transaction.atomic():
+            agent_ids = list(open_tickets.filter(assignee__isnull=False).values_list('assignee_id', flat=True).distinct())
+            closed = open_tickets.update(status='closed', updated_at=timezone.now())
+            # the UPDATE bypasses the post_save signal that keeps agent load in sync
+            if agent_ids:
+                SupportAgentLoad.recount(agent_ids)
+        self.message_user(request, f'{closed} tickets closed.', messages.SUCCESS)
+
+
+@admin.register(TicketMessage)
+class TicketMessageAdmin(ScalableAdmin):
+    list_display = ('id', 'ticket_id', 'author', 'created_at')
+    list_select_related = ('author',)
+    raw_id_fields = ('ticket', 'author')
+    search_fields = ('id__exact', 'ticket__id__exact', 'author__username__exact')
+
+
+@admin.register(Schedule)
+class ScheduleAdmin(ScalableAdmin):
+    list_display = ('id', 'contractor', 'day_of_week', 'start_time', 'end_time', 'is_available')
+    list_select_related = ('contractor',)
+    raw_id_fields = ('contractor',)
+    search_fields = ('contractor__username__exact',)
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'parent')
+    list_select_related = ('parent',)
+    search_fields = ('name',)
+
+
+@admin.register(City)
+class CityAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name')
+    search_fields = ('name',)
@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from django.db import router, transaction
+from django.utils import timezone
+
+from .models import Ad, AdSignature, AdSignatureBand, AdSnapshot, ArchivedAd, ArchivedComment, ArchivedProposal, Comment, Proposal, Rating
+from .search import autocomplete_index
+
+
+FINISHED_STATUSES = ('done', 'canceled')
+
+AD_FIELDS = ['id', 'title', 'description', 'budget', 'category_id', 'location', 'city_id', 'start_date', 'end_date',
+             'hours_per_day', 'creator_id', 'created_at', 'status']
+PROPOSAL_FIELDS = ['id', 'ad_id', 'contractor_id', 'price', 'message', 'created_at', 'accepted', 'accepted_at', 'completed']
+COMMENT_FIELDS = ['id', 'ad_id', 'author_id', 'text', 'created_at']
+
+
+def candidates(older_than_days):
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    return Ad.objects.filter(status__in=FINISHED_STATUSES, created_at__lt=cutoff)
+
+
+def archive_batch(ids):
+    """Move the given ads and their proposals/comments to the archive in one transaction.
+
+    Ratings stay in the hot table (contractor averages read them); their ``ad_id``
+    keeps pointing at the archived ad's id.
+    """
+    with transaction.atomic(using=router.db_for_write(Ad)):
+        ads = list(Ad.objects.select_for_update().filter(id__in=ids, status__in=FINISHED_STATUSES).values(*AD_FIELDS))
+        if not ads:
+            return 0
+        ids = [ad['id'] for ad in ads]
+        ArchivedAd.objects.bulk_create([ArchivedAd(**ad) for ad in ads])
+        ArchivedProposal.objects.bulk_create([
+            ArchivedProposal(**row) for row in Proposal.objects.filter(ad_id__in=ids).values(*PROPOSAL_FIELDS)
+        ])
+        ArchivedComment.objects.bulk_create([
+            ArchivedComment(**row) for row in Comment.objects.filter(ad_id__in=ids).values(*COMMENT_FIELDS)
+        ])
+        Proposal.objects.filter(ad_id__in=ids)._raw_delete(Proposal.objects.db)
+        Comment.objects.filter(ad_id__in=ids)._raw_delete(Comment.objects.db)
+        AdSnapshot.objects.filter(ad_id__in=ids)._raw_delete(AdSnapshot.objects.db)
+        AdSignatureBand.objects.filter(ad_id__in=ids)._raw_delete(AdSignatureBand.objects.db)
+        AdSignature.objects.filter(ad_id__in=ids)._raw_delete(AdSignature.objects.db)
+        # raw delete so the ORM does not cascade into the ratings we keep
+        Ad.objects.filter(id__in=ids)._raw_delete(Ad.objects.db)
+        # the raw delete skips the post_delete signal that keeps autocomplete counts
+        autocomplete_index.count_titles([ad['title'] for ad in ads], -1)
+    return len(ads)
+
+
+def hot_table_sizes():
+    return {
+        'ads': Ad.objects.count(),
+        'proposals': Proposal.objects.count(),
+        'comments': Comment.objects.count(),
+        'ratings': Rating.objects.count(),
+        'archived_ads': ArchivedAd.objects.count(),
+    }
@@ -0,0 +1,207 @@
+"""Async variants of the read-heavy endpoints, used when served over ASGI.
+
+GET requests are answered here. The async ORM runs every query on the one
+thread shared by all sync code, so queries that do not depend on each other
+are instead sent to the default executor, each on its own thread and
+connection, and awaited together. Serialization happens off the event loop.
+Every other method is passed on to the regular DRF view.
+"""
+import asyncio
+import functools
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.models import Avg, Count
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import snapshots
+from .models import Ad, ArchivedAd
+from .serializers import AdSerializer, ArchivedAdSerializer, ContractorListSerializer
+from .views import AdDetailView, AdListCreateView, ContractorListView, ContractorProfileView
+
+
+def _query(fn):
+    """Await ``fn()`` on an executor thread, so several can run at once."""
+    def run():
+        try:
+            return fn()
+        finally:
+            # executor threads are reused by unrelated work; do not leave connections open on them
+            connections.close_all()
+    return sync_to_async(run, thread_sensitive=False)()
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+def _not_found(detail='Not found.'):
+    return _json({'detail': detail}, status=404)
+
+
+def _view(view_class, request, **kwargs):
+    """A DRF view instance bound to ``request``, used to build querysets and run throttles."""
+    view = view_class()
+    view.args = ()
+    view.kwargs = kwargs
+    view.request = view.initialize_request(request)
+    view.format_kwarg = None
+    view.headers = {}
+    return view
+
+
+def _check_throttles(view_class, request, kwargs):
+    view = _view(view_class, request, **kwargs)
+    try:
+        view.check_throttles(view.request)
+    except Throttled as exc:
+        response = _json({'detail': exc.detail}, status=exc.status_code)
+        if exc.wait is not None:
+            response['Retry-After'] = str(math.ceil(exc.wait))
+        return response
+    return None
+
+
+async def _page(request, qs):
+    """``(envelope, rows)`` for the requested page, emulating PageNumberPagination; None if out of range."""
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 10)
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    offset = (page - 1) * page_size
+    count, rows = await asyncio.gather(_query(qs.count), _query(lambda: list(qs[offset:offset + page_size])))
+    if page > 1 and not rows:
+        return None
+    url = request.build_absolute_uri()
+    envelope = {
+        'count': count,
+        'next': replace_query_param(url, 'page', page + 1) if offset + page_size < count else None,
+        'previous': None if page == 1 else (remove_query_param(url, 'page') if page == 2 else replace_query_param(url, 'page', page - 1)),
+    }
+    return envelope, rows
+
+
+def _invalid_page():
+    return _json({'detail': 'Invalid page.'}, status=404)
+
+
+async def ad_list(request):
+    view = _view(AdListCreateView, request)
+    try:
+        qs = view.filter_queryset(view.get_queryset()).prefetch_related(None)
+    except APIException as exc:
+        return _json(exc.detail, status=exc.status_code)
+    page = await _page(request, qs.values_list('id', flat=True))
+    if page is None:
+        return _invalid_page()
+    envelope, ids = page
+    items = await sync_to_async(snapshots.bodies)(ids, {'request': view.request})
+    return HttpResponse(snapshots.splice_page(envelope, items), content_type='application/json')
+
+
+async def ad_detail(request, pk):
+    view = _view(AdDetailView, request, pk=pk)
+    context = {'request': view.request}
+
+    def load():
+        ad = Ad.objects.filter(pk=pk).first()
+        if ad is not None:
+            # as in AdDetailView.retrieve, permissions come before the stored bytes
+            view.check_object_permissions(view.request, ad)
+            body = snapshots.with_proposals(snapshots.fresh_bodies([pk]), context).get(pk)
+            if body is not None:
+                return body
+            ad = AdSerializer.prefetch_children(Ad.objects.filter(pk=pk)).first()
+        if ad is not None:
+            return snapshots.render(AdSerializer(ad, context=context).data)
+        archived = ArchivedAdSerializer.prefetch_children(ArchivedAd.objects.filter(pk=pk)).first()
+        if archived is not None:
+            return snapshots.render(ArchivedAdSerializer(archived, context=context).data)
+        return None
+
+    try:
+        body = await sync_to_async(load)()
+    except APIException as exc:
+        return _json({'detail': exc.detail}, status=exc.status_code)
+    if body is None:
+        # same message as the 404 raised by get_object_or_404 in AdDetailView
+        return _not_found('No Ad matches the given query.')
+    return HttpResponse(body, content_type='application/json')
+
+
+async def contractor_list(request):
+    view = _view(ContractorListView, request)
+    # ContractorListView.get applies its own filters in get_queryset only
+    page = await _page(request, view.get_queryset())
+    if page is None:
+        return _invalid_page()
+    envelope, contractors = page
+    results = await sync_to_async(lambda: ContractorListSerializer(contractors, many=True, context={'request': view.request}).data)()
+    return _json(dict(envelope, results=results))
+
+
+async def contractor_profile(request, pk):
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
+    context = {'request': Request(request)}
+
+    # the user row, the rating aggregate and both ad histories are independent
+    user, ratings, live_ads, archived_ads = await asyncio.gather(
+        _query(User.objects.filter(pk=pk).first),
+        _query(lambda: User.objects.filter(pk=pk).aggregate(avg_rating=Avg('ratings_received__score'), ratings_count=Count('ratings_received'))),
+        _query(lambda: list(AdSerializer.prefetch_children(Ad.objects.filter(creator_id=pk).order_by('-created_at')))),
+        _query(lambda: list(ArchivedAdSerializer.prefetch_children(ArchivedAd.objects.filter(creator_id=pk).order_by('-created_at')))),
+    )
+    if user is None:
+        return _not_found()
+
+    def render():
+        # same keys and order as ContractorProfileSerializer
+        return {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'role': user.role,
+            'avg_rating': float(ratings['avg_rating']) if ratings['avg_rating'] is not None else None,
+            'ratings_count': ratings['ratings_count'],
+            'ads': (
+                AdSerializer(live_ads, many=True, context=context).data
+                + ArchivedAdSerializer(archived_ads, many=True, context=context).data
+            ),
+        }
+
+    return _json(await sync_to_async(render)())
+
+
+def _with_async_get(view_class, async_get):
+    """Route GET/HEAD to ``async_get`` and everything else to the DRF ``view_class``."""
+    sync_view = sync_to_async(view_class.as_view())
+
+    @csrf_exempt
+    @functools.wraps(async_get)
+    async def view(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            throttled = await sync_to_async(_check_throttles)(view_class, request, kwargs)
+            if throttled is not None:
+                return throttled
+            return await async_get(request, *args, **kwargs)
+        return await sync_view(request, *args, **kwargs)
+
+    # lets drf-spectacular document the endpoint from the DRF view
+    view.cls = view_class
+    view.initkwargs = {}
+    return view
+
+
+ad_list_view = _with_async_get(AdListCreateView, ad_list)
+ad_detail_view = _with_async_get(AdDetailView, ad_detail)
+contractor_list_view = _with_async_get(ContractorListView, contractor_list)
+contractor_profile_view = _with_async_get(ContractorProfileView, contractor_profile)
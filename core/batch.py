@@ -0,0 +1,121 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+
+# only API views may be called from a batch; the admin and the schema pages are
+# not, nor the batch endpoint itself
+API_PREFIX = '/api/'
+_DOC_VIEWS = {'schema', 'swagger-ui', 'redoc'}
+
+# Environ keys of the outer request that sub-requests must not inherit.
+_PER_REQUEST_KEYS = (
+    'CONTENT_TYPE', 'CONTENT_LENGTH', 'QUERY_STRING', 'PATH_INFO', 'REQUEST_METHOD', 'wsgi.input',
+    'HTTP_IDEMPOTENCY_KEY',
+)
+
+
+def max_batch_size():
+    return getattr(settings, 'BATCH_API_MAX_REQUESTS', 20)
+
+
+def max_workers():
+    return getattr(settings, 'BATCH_API_MAX_WORKERS', 4)
+
+
+def build_subrequest(request, method, path, body=None):
+    """Build a WSGIRequest for ``path`` that carries the caller's credentials."""
+    outer = getattr(request, '_request', request)
+    parts = urlsplit(path)
+    payload = json.dumps(body).encode() if body is not None else b''
+    environ = {key: value for key, value in outer.META.items() if key not in _PER_REQUEST_KEYS}
+    environ.update({
+        'REQUEST_METHOD': method.upper(),
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': BytesIO(payload),
+    })
+    sub = WSGIRequest(environ)
+    # session-authenticated callers: reuse the user the middleware resolved for
+    # the outer request, which already passed the CSRF check
+    if hasattr(outer, 'session'):
+        # a store of its own, loaded lazily, so pooled sub-requests share no state
+        sub.session = type(outer.session)(outer.session.session_key)
+    if hasattr(outer, 'user'):
+        sub.user = outer.user
+    sub._dont_enforce_csrf_checks = True
+    return sub
+
+
+def _render(response):
+    if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+        response.render()
+    content = response.content if not getattr(response, 'streaming', False) else b''
+    if response.get('Content-Type', '').startswith('application/json') and content:
+        body = json.loads(content)
+    else:
+        body = content.decode(response.charset or 'utf-8', errors='replace') if content else None
+    return {'status': response.status_code, 'body': body}
+
+
+def dispatch(request, item):
+    """Resolve and run one sub-request, returning ``{'status', 'body'}``."""
+    path = item['path']
+    not_batchable = {'status': 400, 'body': {'detail': 'Only API endpoints can be batched.'}}
+    if not urlsplit(path).path.startswith(API_PREFIX):
+        return not_batchable
+    try:
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        return {'status': 404, 'body': {'detail': 'Not found.'}}
+    if match.url_name == 'batch':
+        return {'status': 400, 'body': {'detail': 'Batch requests cannot be nested.'}}
+    if match.url_name in _DOC_VIEWS:
+        return not_batchable
+    sub = build_subrequest(request, item['method'], path, item.get('body'))
+    sub.resolver_match = match
+    try:
+        return _render(match.func(sub, *match.args, **match.kwargs))
+    except Exception as exc:  # a failing sub-request must not fail the batch
+        return {'status': 500, 'body': {'detail': str(exc) if settings.DEBUG else 'Server error.'}}
+
+
+def _dispatch_in_thread(request, item):
+    try:
+        return dispatch(request, item)
+    finally:
+        connections.close_all()
+
+
+def run_batch(request, items, parallel=False):
+    """Run ``items`` in order; with ``parallel`` consecutive GETs share a thread pool.
+
+    Writes act as barriers so a GET listed after a write still sees it.
+    """
+    results = [None] * len(items)
+    if not parallel:
+        for index, item in enumerate(items):
+            results[index] = dispatch(request, item)
+        return results
+
+    with ThreadPoolExecutor(max_workers=max_workers()) as pool:
+        pending = []
+        for index, item in enumerate(items):
+            if item['method'].upper() == 'GET':
+                pending.append((index, pool.submit(_dispatch_in_thread, request, item)))
+                continue
+            for pending_index, future in pending:
+                results[pending_index] = future.result()
+            pending = []
+            results[index] = dispatch(request, item)
+        for pending_index, future in pending:
+            results[pending_index] = future.result()
+    return results
@@ -0,0 +1,124 @@
+import contextvars
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# credentials created at login must be readable on the very next request
+PRIMARY_ONLY_APPS = ('sessions', 'authtoken')
+
+_current = contextvars.ContextVar('db_routing', default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+def _pin_key(user_id):
+    return f'db:pinned:{user_id}'
+
+
+def pin_to_primary(user):
+    """Send ``user``'s reads to the primary for ``DB_PIN_SECONDS`` after a write."""
+    if user is not None and user.is_authenticated:
+        cache.set(_pin_key(user.pk), True, getattr(settings, 'DB_PIN_SECONDS', 5))
+
+
+class RoutingState:
+    """Per-request routing decision, resolved lazily on the first read."""
+
+    def __init__(self, request):
+        self.request = request
+        self.safe = request.method in SAFE_METHODS
+        self._pinned = None
+        self._replica = None
+        self._resolving = False
+
+    def pinned(self):
+        if self._pinned is not None:
+            return self._pinned
+        if self._resolving:
+            # request.user is being loaded (session auth) by this very query
+            return False
+        self._resolving = True
+        try:
+            user = getattr(self.request, 'user', None)
+            if user is None or not user.is_authenticated:
+                # token auth has not run yet; decide again on the next query
+                return False
+            self._pinned = bool(cache.get(_pin_key(user.pk)))
+        finally:
+            self._resolving = False
+        return self._pinned
+
+    def replica(self):
+        if self._replica is None:
+            self._replica = random.choice(replica_aliases())
+        return self._replica
+
+
+class ReplicaRoutingMiddleware:
+    """Marks safe requests as replica-readable and pins writers to the primary."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _current.set(RoutingState(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(getattr(request, 'user', None))
+        return response
+
+    async def __acall__(self, request):
+        token = _current.set(RoutingState(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            await sync_to_async(pin_to_primary)(getattr(request, 'user', None))
+        return response
+
+
+class ReplicaRouter:
+    """Reads from safe-method API requests go to a replica, everything else to ``default``.
+
+    Reads stay on the primary inside transactions, outside a request (commands,
+    workers), and for users who wrote within the last ``DB_PIN_SECONDS``.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is None or not state.safe or not replica_aliases():
+            return 'default'
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return 'default'
+        if connections['default'].in_atomic_block or state.pinned():
+            return 'default'
+        return state.replica()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
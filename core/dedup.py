@@ -0,0 +1,127 @@
+"""Near-duplicate ad detection with MinHash and LSH banding.
+
+Each ad's normalized title and description are cut into overlapping word
+shingles and summarized by a MinHash signature of ``NUM_PERM`` values; the
+fraction of equal values estimates the Jaccard similarity of two shingle
+sets. The signature is split into ``BANDS`` bands of ``ROWS`` values and each
+band is hashed into an indexed ``(band, bucket)`` row. Two ads are only
+compared when they share a bucket, which happens with high probability above
+roughly ``(1 / BANDS) ** (1 / ROWS)`` similarity (~0.42 here), so a lookup
+touches a handful of candidates instead of every open ad.
+"""
+import hashlib
+import random
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+
+from .models import Ad, AdSignature, AdSignatureBand
+from .search import normalize_text
+
+
+SHINGLE_SIZE = 2
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240517)  # fixed: signatures must be comparable across processes and deploys
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+def source_text(ad):
+    return normalize_text(f'{ad.title} {ad.description}')
+
+
+def shingles(text):
+    words = text.split()
+    if len(words) <= SHINGLE_SIZE:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    hashes = [_hash64(shingle) for shingle in shingles(text)]
+    if not hashes:
+        return []
+    return [min((a * x + b) % _PRIME for x in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_buckets(signature):
+    """``[(band, bucket)]`` for a signature; buckets are signed 64-bit for BigIntegerField."""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(repr(rows).encode(), digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, 'big', signed=True)))
+    return buckets
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    if not a or not b:
+        return 0.0
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def threshold():
+    return getattr(settings, 'AD_DUPLICATE_THRESHOLD', 0.7)
+
+
+def index_ad(ad, text=None):
+    """Store the signature and band rows of ``ad``; a no-op when its text is unchanged.
+
+    Returns the signature.
+    """
+    text = source_text(ad) if text is None else text
+    digest = hashlib.sha1(text.encode()).hexdigest()
+    current = AdSignature.objects.filter(ad_id=ad.pk).values_list('source_hash', 'minhash').first()
+    if current and current[0] == digest:
+        return current[1]
+    signature = minhash(text)
+    with transaction.atomic(using=router.db_for_write(AdSignature)):
+        AdSignature.objects.update_or_create(ad_id=ad.pk, defaults={'source_hash': digest, 'minhash': signature})
+        AdSignatureBand.objects.filter(ad_id=ad.pk).delete()
+        if signature:
+            AdSignatureBand.objects.bulk_create([
+                AdSignatureBand(ad_id=ad.pk, band=band, bucket=bucket) for band, bucket in band_buckets(signature)
+            ])
+    return signature
+
+
+def find_duplicate(ad, signature):
+    """The open ad of the same creator that ``ad`` most likely reposts, or None."""
+    if not signature:
+        return None
+    in_bucket = Q()
+    for band, bucket in band_buckets(signature):
+        in_bucket |= Q(band=band, bucket=bucket)
+    candidates = set(AdSignatureBand.objects.filter(in_bucket).exclude(ad_id=ad.pk).values_list('ad_id', flat=True))
+    if not candidates:
+        return None
+    # a repost comes from the same account; similar ads by other customers are separate jobs
+    open_ids = Ad.objects.filter(pk__in=candidates, status='open', creator_id=ad.creator_id).values_list('pk', flat=True)
+    scored = [
+        (similarity(signature, other), ad_id)
+        for ad_id, other in AdSignature.objects.filter(ad_id__in=open_ids).values_list('ad_id', 'minhash')
+    ]
+    # highest similarity first; ties go to the older ad, the likely original
+    scored = sorted((item for item in scored if item[0] >= threshold()), key=lambda item: (-item[0], item[1]))
+    best = scored[0][1] if scored else None
+    if best is None:
+        return None
+    # point at the original rather than at another repost
+    return Ad.objects.filter(pk=best).values_list('duplicate_of_id', flat=True).first() or best
+
+
+def flag_duplicate(ad):
+    """Index ``ad`` and link it to the open ad it near-duplicates; returns that ad's id or None."""
+    duplicate_of = find_duplicate(ad, index_ad(ad))
+    if duplicate_of is not None and duplicate_of != ad.duplicate_of_id:
+        ad.duplicate_of_id = duplicate_of
+        ad.save(update_fields=['duplicate_of'])
+    return duplicate_of
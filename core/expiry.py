@@ -0,0 +1,45 @@
+import logging
+import time
+
+from django.db import router, transaction
+from django.utils import timezone
+
+from . import snapshots
+from .models import Ad
+
+logger = logging.getLogger(__name__)
+
+
+def expired_open_ads(today=None):
+    today = today or timezone.localdate()
+    return Ad.objects.filter(status='open', end_date__lt=today)
+
+
+def sweep(today=None, chunk_size=500, max_chunks=None):
+    """Cancel open ads whose end_date has passed, ``chunk_size`` rows per UPDATE.
+
+    Every chunk is its own short transaction and the UPDATE re-checks
+    ``status='open'``, so the sweep is idempotent and two sweepers running at
+    once never cancel an ad twice or touch one that was just assigned.
+    """
+    started = time.monotonic()
+    candidates = expired_open_ads(today)
+    swept = chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        # walks the (status, end_date) index
+        ids = list(candidates.order_by('end_date', 'id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        with transaction.atomic(using=router.db_for_write(Ad)):
+            swept += Ad.objects.filter(id__in=ids, status='open').update(status='canceled')
+            # the UPDATE bypasses the post_save signal
+            snapshots.invalidate(ids)
+        chunks += 1
+    result = {
+        'swept': swept,
+        'chunks': chunks,
+        'remaining': candidates.count() if max_chunks is not None else 0,
+        'seconds': round(time.monotonic() - started, 3),
+    }
+    logger.info('ad expiry sweep: %(swept)s canceled in %(chunks)s chunks (%(seconds)ss)', result, extra={'ad_expiry': result})
+    return result
@@ -0,0 +1,22 @@
+import django_filters
+
+from .models import Ad, CategoryClosure
+from .search import city_of, normalize_text
+
+
+class AdFilter(django_filters.FilterSet):
+    """``?category=`` matches the category and all its subcategories; ``?location=`` matches by city."""
+
+    category = django_filters.CharFilter(method='filter_category')
+    location = django_filters.CharFilter(method='filter_location')
+
+    class Meta:
+        model = Ad
+        fields = ['status', 'creator__id']
+
+    def filter_category(self, queryset, name, value):
+        descendants = CategoryClosure.objects.filter(ancestor__key=normalize_text(value)).values('descendant_id')
+        return queryset.filter(category_id__in=descendants)
+
+    def filter_location(self, queryset, name, value):
+        return queryset.filter(city__key=city_of(value))
@@ -0,0 +1,162 @@
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+POLL_SECONDS = 0.1
+
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    HEADER, OpenApiTypes.STR, OpenApiParameter.HEADER,
+    description='Client-generated unique key. Retries with the same key replay the first response instead of running again.',
+)
+
+
+def ttl_seconds():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL_SECONDS', 24 * 3600)
+
+
+def _cache_key(user_id, key):
+    # client keys may contain characters or lengths memcached rejects
+    return f'idempotency:{user_id}:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def fingerprint(request):
+    payload = json.dumps(request.data, sort_keys=True, cls=JSONEncoder, default=str)
+    raw = f'{request.method} {request.get_full_path()} {payload}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _reused_key():
+    return Response(
+        {'detail': f'This {HEADER} was already used for a different request.'},
+        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    )
+
+
+def _replay(stored_fingerprint, fingerprint, status_code, body):
+    if stored_fingerprint != fingerprint:
+        return _reused_key()
+    response = Response(json.loads(body) if body else None, status=status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _acquire(user, key, fingerprint):
+    """Insert a pending row for ``key``; returns ``(record, owned)``.
+
+    An expired row, or a pending one whose request died, is taken over. Only
+    one of several racing requests ends up owning the key.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=ttl_seconds())
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, key=key, fingerprint=fingerprint, expires_at=expires_at), True
+    except IntegrityError:
+        pass
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is None:
+        return None, False
+    abandoned_before = now - timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 60))
+    if record.expires_at <= now or (record.response_status is None and record.created_at < abandoned_before):
+        taken = IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).update(
+            fingerprint=fingerprint, response_status=None, response_body='', created_at=now, expires_at=expires_at,
+        )
+        if taken:
+            record.refresh_from_db()
+            return record, True
+    return record, False
+
+
+def _execute(user, key, fingerprint, run):
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 10)
+    while True:
+        record, owned = _acquire(user, key, fingerprint)
+        if owned:
+            break
+        if record is not None and record.response_status is not None:
+            return _replay(record.fingerprint, fingerprint, record.response_status, record.response_body)
+        if record is not None and record.fingerprint != fingerprint:
+            return _reused_key()
+        if time.monotonic() >= deadline:
+            return Response(
+                {'detail': f'A request with this {HEADER} is still being processed.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        # a duplicate waits for the first request instead of running in parallel
+        time.sleep(POLL_SECONDS)
+
+    try:
+        response = run()
+    except BaseException:
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+        raise
+    if response.status_code >= 500:
+        # server errors are not final; let the client retry for real
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+        return response
+    body = json.dumps(response.data, cls=JSONEncoder) if response.data is not None else ''
+    IdempotencyKey.objects.filter(pk=record.pk).update(response_status=response.status_code, response_body=body)
+    cache.set(_cache_key(user.pk, key), (fingerprint, response.status_code, body), ttl_seconds())
+    return response
+
+
+def idempotent(handler):
+    """Make a DRF ``post`` handler replay its first response for a repeated ``Idempotency-Key``.
+
+    Keys are scoped to the authenticated user; anonymous requests and requests
+    without the header run normally. Replays are served from the cache when
+    possible and carry an ``Idempotent-Replayed: true`` header.
+    """
+    @extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER])
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        user = request.user
+        if not key or not user.is_authenticated:
+            return handler(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'detail': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        request_fingerprint = fingerprint(request)
+        cached = cache.get(_cache_key(user.pk, key))
+        if cached is not None:
+            return _replay(cached[0], request_fingerprint, cached[1], cached[2])
+        return _execute(user, key, request_fingerprint, lambda: handler(view, request, *args, **kwargs))
+    return wrapper
+
+
+class IdempotentCreateMixin:
+    """Adds ``Idempotency-Key`` support to a generic view's ``post``."""
+
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+
+def purge_expired(chunk_size=1000):
+    """Delete expired keys in chunks; returns how many were removed."""
+    purged = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return purged
+        purged += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,168 @@
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+
+
+def task(name):
+    """Register a function as a job task under ``name``."""
+    def decorator(func):
+        _tasks[name] = func
+        return func
+    return decorator
+
+
+def _run_eagerly():
+    return getattr(settings, 'JOBS_RUN_EAGERLY', False)
+
+
+def enqueue(name, delay=0, max_attempts=5, **payload):
+    """Queue ``name(**payload)`` once the current transaction commits.
+
+    ``payload`` must be JSON serializable. With ``JOBS_RUN_EAGERLY`` the task
+    runs in-process on commit instead, which is handy for tests and for dev
+    setups without a worker.
+    """
+    if name not in _tasks:
+        raise KeyError(f'Unknown job task: {name}')
+    if _run_eagerly():
+        transaction.on_commit(lambda: _tasks[name](**payload))
+        return
+    transaction.on_commit(lambda: Job.objects.create(
+        task=name,
+        payload=payload,
+        max_attempts=max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    ))
+
+
+def backoff_seconds(attempts):
+    base = getattr(settings, 'JOBS_RETRY_BASE_SECONDS', 5)
+    cap = getattr(settings, 'JOBS_RETRY_MAX_SECONDS', 3600)
+    delay = min(cap, base * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def heartbeat_seconds():
+    return getattr(settings, 'JOBS_HEARTBEAT_SECONDS', 30)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_jobs(worker, batch_size):
+    """Atomically move up to ``batch_size`` due jobs to ``running`` for ``worker``."""
+    now = timezone.now()
+    due = Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at')
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            jobs = list(due.select_for_update(skip_locked=True)[:batch_size])
+            Job.objects.filter(id__in=[job.id for job in jobs]).update(status='running', locked_at=now, locked_by=worker, heartbeat_at=now)
+            for job in jobs:
+                job.status, job.locked_at, job.locked_by, job.heartbeat_at = 'running', now, worker, now
+    else:
+        # no row locks (SQLite): claim with a conditional update, then read back what we won
+        ids = list(due.values_list('id', flat=True)[:batch_size])
+        Job.objects.filter(id__in=ids, status='queued').update(status='running', locked_at=now, locked_by=worker, heartbeat_at=now)
+        jobs = list(Job.objects.filter(id__in=ids, status='running', locked_by=worker))
+    return jobs
+
+
+@contextmanager
+def _heartbeat(job):
+    """Refresh ``job.heartbeat_at`` from a side thread until the block exits."""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(heartbeat_seconds()):
+                try:
+                    Job.objects.filter(id=job.id, status='running', locked_by=job.locked_by).update(heartbeat_at=timezone.now())
+                except DatabaseError:
+                    logger.warning('Heartbeat of job %s failed', job.id, exc_info=True)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'job-{job.id}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    func = _tasks.get(job.task)
+    job.attempts += 1
+    try:
+        if func is None:
+            raise KeyError(f'Unknown job task: {job.task}')
+        with _heartbeat(job):
+            func(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()[-4000:]
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            logger.error('Job %s (%s) failed permanently', job.id, job.task)
+        else:
+            job.status = 'queued'
+            job.run_at = timezone.now() + timedelta(seconds=backoff_seconds(job.attempts))
+        job.locked_at = None
+        job.locked_by = ''
+        job.save(update_fields=['status', 'attempts', 'run_at', 'last_error', 'locked_at', 'locked_by'])
+        return False
+    job.status = 'done'
+    job.save(update_fields=['status', 'attempts'])
+    return True
+
+
+def run_batch(worker, batch_size):
+    """Claim and run one batch; returns the number of jobs processed."""
+    jobs = claim_jobs(worker, batch_size)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
+
+
+def requeue_stale(timeout_seconds):
+    """Put back jobs whose worker died while running them; returns how many were requeued.
+
+    A live worker refreshes ``heartbeat_at`` every ``JOBS_HEARTBEAT_SECONDS``,
+    so only jobs whose heartbeat is older than ``timeout_seconds`` are taken
+    back, however long they have been running. The lost run counts as an
+    attempt, so a job that keeps killing its worker fails at ``max_attempts``
+    instead of looping.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status='running', heartbeat_at__lt=now - timedelta(seconds=timeout_seconds))
+    with transaction.atomic():
+        failed = stale.filter(attempts__gte=F('max_attempts') - 1).update(
+            status='failed', attempts=F('attempts') + 1, locked_at=None, locked_by='',
+            last_error='Worker stopped while running the job.',
+        )
+        requeued = stale.update(status='queued', attempts=F('attempts') + 1, run_at=now, locked_at=None, locked_by='')
+    if failed:
+        logger.error('%s stale jobs failed permanently', failed)
+    return requeued
+
+
+def purge_finished(older_than_seconds):
+    cutoff = timezone.now() - timedelta(seconds=older_than_seconds)
+    return Job.objects.filter(status='done', run_at__lt=cutoff).delete()[0]
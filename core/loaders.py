@@ -0,0 +1,106 @@
+from django.db import models
+from drf_spectacular.utils import extend_schema_field
+from rest_framework import serializers
+
+from users.serializers import UserSerializer
+
+
+class UserLoader:
+    """Request-scoped identity map of serialized users.
+
+    Ids are collected with ``prime()`` and fetched together in one ``IN`` query
+    the first time any of them is needed. Each user is serialized once and the
+    resulting dict is handed out for every later occurrence, so it can be
+    reused by the DRF serializers and by hand-built responses alike.
+    """
+
+    def __init__(self):
+        self._cache = {}
+        self._pending = set()
+
+    def prime(self, ids):
+        for user_id in ids:
+            if user_id is not None and user_id not in self._cache:
+                self._pending.add(user_id)
+
+    def load(self, user_id):
+        if user_id is None:
+            return None
+        if user_id not in self._cache:
+            self._pending.add(user_id)
+            self._flush()
+        return self._cache[user_id]
+
+    def load_many(self, ids):
+        self.prime(ids)
+        return [self.load(user_id) for user_id in ids]
+
+    def _flush(self):
+        ids, self._pending = self._pending, set()
+        model = UserSerializer.Meta.model
+        for user in model.objects.filter(pk__in=ids):
+            self._cache[user.pk] = dict(UserSerializer(user).data)
+        for user_id in ids:
+            # remember misses too so a dangling id is not queried again
+            self._cache.setdefault(user_id, None)
+
+
+def get_user_loader(context):
+    """Return the loader shared by everything serialized for this request.
+
+    ``context`` is either a serializer context dict or a request. Without a
+    request the loader lives in the context dict itself.
+    """
+    request = context.get('request') if isinstance(context, dict) else context
+    if request is None:
+        return context.setdefault('user_loader', UserLoader())
+    loader = getattr(request, '_user_loader', None)
+    if loader is None:
+        loader = UserLoader()
+        request._user_loader = loader
+    return loader
+
+
+@extend_schema_field(UserSerializer)
+class LoadedUserField(serializers.Field):
+    """Read-only nested user rendered through the request's ``UserLoader``.
+
+    Reads the ``<source>_id`` column so the related row is never fetched lazily.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return getattr(instance, f'{self.source}_id')
+
+    def to_representation(self, value):
+        return get_user_loader(self.context).load(value)
+
+
+class UserLoaderListSerializer(serializers.ListSerializer):
+    """Primes the loader with every user id on the page before rendering it."""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.prime_users(items)
+        return [self.child.to_representation(item) for item in items]
+
+
+class UserLoaderMixin:
+    """Serializer mixin that batches the users of its ``LoadedUserField``s.
+
+    Pair it with ``Meta.list_serializer_class = UserLoaderListSerializer``.
+    """
+
+    def prime_users(self, instances):
+        user_fields = [field.source for field in self.fields.values() if isinstance(field, LoadedUserField)]
+        get_user_loader(self.context).prime(
+            getattr(instance, f'{source}_id') for instance in instances for source in user_fields
+        )
+
+    def to_representation(self, instance):
+        self.prime_users([instance])
+        return super().to_representation(instance)
+
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import archive, sharding
+from core.models import Ad
+
+
+class Command(BaseCommand):
+    help = "Move finished (done/canceled) ads and their proposals and comments into the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, required=True, help='Only ads created more than this many days ago.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Ads moved per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many ads would be archived.')
+
+    def _report(self, label):
+        sizes = archive.hot_table_sizes()
+        started = time.perf_counter()
+        # the first page of the public ad list, as AdListCreateView runs it
+        list(Ad.objects.filter(status='open').order_by('-created_at')[:10])
+        elapsed = (time.perf_counter() - started) * 1000
+        self.stdout.write(f"{label}: " + ', '.join(f"{name}={count}" for name, count in sizes.items()) + f", list query {elapsed:.1f} ms")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = sum(archive.candidates(options['older_than']).count() for _ in sharding.each_shard())
+            self.stdout.write(f"{count} ads would be archived.")
+            return
+        moved = 0
+        for alias in sharding.each_shard():
+            prefix = f'{alias} ' if alias else ''
+            qs = archive.candidates(options['older_than'])
+            self._report(prefix + 'before')
+            last_id = 0
+            while True:
+                ids = list(qs.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:options['batch_size']])
+                if not ids:
+                    break
+                moved += archive.archive_batch(ids)
+                last_id = ids[-1]
+                self.stdout.write(f"  archived {moved} ads")
+            self._report(prefix + 'after')
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} ads.'))
@@ -0,0 +1,79 @@
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.sketches import QuantileSketch
+
+
+# the GETs core.async_views serves; pass --path for the detail and profile pages
+PATHS = ['/api/ads/', '/api/ads/?page=2', '/api/contractors/']
+
+
+def _run(url, paths, deadline, results):
+    latency = QuantileSketch()
+    counts = {'requests': 0, 'errors': 0}
+    sent = 0
+    while time.monotonic() < deadline:
+        path = paths[sent % len(paths)]
+        sent += 1
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(f'{url}{path}', timeout=30) as response:
+                response.read()
+        except (urllib.error.URLError, OSError):
+            counts['errors'] += 1
+            continue
+        latency.add((time.perf_counter() - started) * 1000)
+        counts['requests'] += 1
+    results.append((counts, latency))
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure GET throughput of the read-heavy endpoints on a WSGI and an ASGI server running this project, "
+        "e.g. gunicorn achareh.wsgi on one port and uvicorn achareh.asgi:application on another. "
+        "Raise the anonymous throttle rate on both, or most requests fail with 429."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', required=True, help='Base URL of the WSGI server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--asgi-url', required=True, help='Base URL of the ASGI server, e.g. http://127.0.0.1:8001')
+        parser.add_argument('--path', action='append', default=[], help=f"Path to request (default: {', '.join(PATHS)}).")
+        parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight at once.')
+        parser.add_argument('--seconds', type=float, default=10.0, help='Duration of each run.')
+
+    def handle(self, *args, **options):
+        paths = options['path'] or PATHS
+        self.stdout.write(f"{options['concurrency']} clients, {options['seconds']}s per run, {len(paths)} paths")
+        for name in ('wsgi', 'asgi'):
+            url = options[f'{name}_url'].rstrip('/')
+            try:
+                urllib.request.urlopen(f'{url}{paths[0]}', timeout=30).read()
+            except (urllib.error.URLError, OSError) as exc:
+                raise CommandError(f'{name.upper()} server at {url} is not answering: {exc}')
+            results = []
+            deadline = time.monotonic() + options['seconds']
+            threads = [
+                threading.Thread(target=_run, args=(url, paths, deadline, results))
+                for _ in range(options['concurrency'])
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self._report(name, results, options['seconds'])
+
+    def _report(self, name, results, seconds):
+        latency = QuantileSketch()
+        requests = errors = 0
+        for counts, sketch in results:
+            requests += counts['requests']
+            errors += counts['errors']
+            latency.merge(sketch)
+        p50, p95 = (latency.quantile(q) for q in (0.5, 0.95))
+        self.stdout.write(
+            f"{name:>5}: {requests / seconds:8.1f} req/s, p50 {p50 or 0:7.1f} ms, p95 {p95 or 0:7.1f} ms, {errors} errors"
+        )
@@ -0,0 +1,106 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+
+
+PROFILES = {
+    'stock': {},
+    'production': settings.SQLITE_PRODUCTION_OPTIONS,
+}
+ROWS = 1000
+
+
+def _run(alias, seconds, write_ratio, results):
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    rng = random.Random()
+    deadline = time.monotonic() + seconds
+    try:
+        while time.monotonic() < deadline:
+            item = rng.randrange(1, ROWS + 1)
+            try:
+                if rng.random() < write_ratio:
+                    # read-then-write, the shape of most of our write paths
+                    with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+                        cursor.execute('SELECT counter FROM bench_item WHERE id = %s', [item])
+                        counter = cursor.fetchone()[0]
+                        cursor.execute('UPDATE bench_item SET counter = %s WHERE id = %s', [counter + 1, item])
+                        cursor.execute('INSERT INTO bench_log (item_id, created) VALUES (%s, %s)', [item, time.time()])
+                    counts['writes'] += 1
+                else:
+                    with connections[alias].cursor() as cursor:
+                        cursor.execute('SELECT id, counter, payload FROM bench_item WHERE id = %s', [item])
+                        cursor.fetchone()
+                        cursor.execute('SELECT COUNT(*) FROM bench_log WHERE item_id = %s', [item])
+                        cursor.fetchone()
+                    counts['reads'] += 1
+            except OperationalError:
+                # "database is locked"
+                counts['locked'] += 1
+    finally:
+        connections[alias].close()
+        results.append(counts)
+
+
+class Command(BaseCommand):
+    help = "Measure concurrent read/write throughput on a scratch SQLite file with the stock settings and the production profile."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run.')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Share of operations that write.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['threads']} threads, {options['seconds']}s per run, {options['write_ratio']:.0%} writes"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for profile, database_options in PROFILES.items():
+                alias = f'benchmark_{profile}'
+                connections.settings[alias] = connections.configure_settings({
+                    'default': {
+                        'ENGINE': 'django.db.backends.sqlite3',
+                        'NAME': os.path.join(directory, f'{profile}.sqlite3'),
+                        'OPTIONS': database_options,
+                    },
+                })['default']
+                try:
+                    self._prepare(alias)
+                    results = []
+                    threads = [
+                        threading.Thread(target=_run, args=(alias, options['seconds'], options['write_ratio'], results))
+                        for _ in range(options['threads'])
+                    ]
+                    for thread in threads:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+                    self._report(profile, results, options['seconds'])
+                finally:
+                    connections[alias].close()
+                    del connections[alias]
+                    del connections.settings[alias]
+
+    def _prepare(self, alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute('CREATE TABLE bench_item (id INTEGER PRIMARY KEY, counter INTEGER NOT NULL, payload TEXT NOT NULL)')
+            cursor.execute('CREATE TABLE bench_log (id INTEGER PRIMARY KEY, item_id INTEGER NOT NULL, created REAL NOT NULL)')
+            cursor.execute('CREATE INDEX bench_log_item ON bench_log (item_id)')
+            cursor.executemany(
+                'INSERT INTO bench_item (id, counter, payload) VALUES (%s, %s, %s)',
+                [(item, 0, 'x' * 200) for item in range(1, ROWS + 1)],
+            )
+
+    def _report(self, profile, results, seconds):
+        reads = sum(counts['reads'] for counts in results)
+        writes = sum(counts['writes'] for counts in results)
+        locked = sum(counts['locked'] for counts in results)
+        self.stdout.write(
+            f"{profile:>10}: {reads / seconds:8.0f} reads/s, {writes / seconds:7.0f} writes/s, "
+            f"{locked} 'database is locked' errors"
+        )
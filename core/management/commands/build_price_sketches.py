@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import sharding
+from core.models import PriceSketch, Proposal
+from core.pricing import sketch_keys
+from core.sketches import QuantileSketch
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-category/location price sketches from all accepted proposals."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        sketches = {}
+        for _ in sharding.each_shard():
+            rows = (
+                Proposal.objects.filter(accepted=True, price__isnull=False)
+                .values_list('ad__category__key', 'ad__city__key', 'price')
+                .iterator(chunk_size=options['chunk_size'])
+            )
+            for category, city, price in rows:
+                for key in sketch_keys(category or '', city or ''):
+                    sketches.setdefault(key, QuantileSketch()).add(price)
+        with transaction.atomic():
+            PriceSketch.objects.all().delete()
+            PriceSketch.objects.bulk_create([
+                PriceSketch(category=key[0], location=key[1], count=sketch.count, sketch=sketch.to_dict())
+                for key, sketch in sketches.items()
+            ], batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f'Built {len(sketches)} price sketches.'))
@@ -0,0 +1,80 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+from django.test.utils import CaptureQueriesContext
+
+from core import sharding, snapshots
+from core.models import Ad, AdSnapshot
+from core.serializers import AdSerializer
+
+
+def _live_bodies(ids):
+    ads = list(AdSerializer.prefetch_children(Ad.objects.filter(pk__in=ids).order_by('pk')))
+    return {ad.pk: snapshots.render(data) for ad, data in zip(ads, AdSerializer(ads, many=True).data)}
+
+
+class Command(BaseCommand):
+    help = "Compare stored ad snapshots with a live render; optionally rebuild the ones that differ or are missing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Ads compared per round trip.')
+        parser.add_argument('--repair', action='store_true', help='Rebuild mismatched, stale and missing snapshots.')
+        parser.add_argument('--benchmark', type=int, default=0, metavar='N',
+                            help='Also time rendering N ads live vs. from snapshots.')
+
+    def handle(self, *args, **options):
+        counts = {'fresh': 0, 'mismatched': 0, 'stale': 0, 'missing': 0, 'repaired': 0}
+        chunk_size = options['chunk_size']
+        for _ in sharding.each_shard():
+            last_id = 0
+            while True:
+                ids = list(Ad.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+                if not ids:
+                    break
+                last_id = ids[-1]
+                fresh = snapshots.fresh_bodies(ids)
+                known = set(AdSnapshot.objects.filter(ad_id__in=ids).values_list('ad_id', flat=True))
+                live = _live_bodies(list(fresh))
+                bad = []
+                for ad_id in ids:
+                    if ad_id in fresh:
+                        # an ad written during the check can show up as a false mismatch
+                        if fresh[ad_id] == live.get(ad_id):
+                            counts['fresh'] += 1
+                            continue
+                        counts['mismatched'] += 1
+                        self.stdout.write(f"ad {ad_id}: snapshot differs from live render")
+                    else:
+                        counts['stale' if ad_id in known else 'missing'] += 1
+                    bad.append(ad_id)
+                if options['repair'] and bad:
+                    AdSnapshot.objects.filter(ad_id__in=bad).update(built_generation=None)
+                    counts['repaired'] += snapshots.build(bad)
+
+        summary = ', '.join(f'{value} {name}' for name, value in counts.items())
+        style = self.style.SUCCESS if not counts['mismatched'] else self.style.WARNING
+        self.stdout.write(style(f"Ad snapshots: {summary}."))
+
+        if options['benchmark']:
+            for _ in sharding.each_shard():
+                self._benchmark(options['benchmark'])
+
+    def _benchmark(self, n):
+        ids = list(AdSnapshot.objects.exclude(built_generation=None).order_by('-ad_id').values_list('ad_id', flat=True)[:n])
+        if not ids:
+            self.stdout.write('No built snapshots to benchmark; run with --repair first.')
+            return
+        connection = connections[router.db_for_read(AdSnapshot)]
+        with CaptureQueriesContext(connection) as live_queries:
+            started = time.perf_counter()
+            _live_bodies(ids)
+            live_ms = (time.perf_counter() - started) * 1000
+        with CaptureQueriesContext(connection) as snapshot_queries:
+            started = time.perf_counter()
+            snapshots.bodies(ids, {})
+            snapshot_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(
+            f"{len(ids)} ads: live {live_ms:.1f} ms / {len(live_queries)} queries, "
+            f"snapshots {snapshot_ms:.1f} ms / {len(snapshot_queries)} queries"
+        )
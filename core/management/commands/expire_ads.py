@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from core import expiry, sharding
+
+
+class Command(BaseCommand):
+    help = "Cancel open ads whose end_date has passed. Safe to run repeatedly and concurrently (e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Ads canceled per UPDATE/transaction.')
+        parser.add_argument('--max-chunks', type=int, default=None, help='Stop after this many chunks.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many ads are expired.')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            expired = sum(expiry.expired_open_ads().count() for _ in sharding.each_shard())
+            self.stdout.write(f"{expired} open ads are past their end_date.")
+            return
+        swept = chunks = seconds = 0
+        for _ in sharding.each_shard():
+            result = expiry.sweep(chunk_size=options['chunk_size'], max_chunks=options['max_chunks'])
+            swept, chunks, seconds = swept + result['swept'], chunks + result['chunks'], seconds + result['seconds']
+        self.stdout.write(self.style.SUCCESS(
+            f"Canceled {swept} expired ads in {chunks} chunks ({round(seconds, 3)}s)."
+        ))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from core import dedup, sharding, snapshots
+from core.models import Ad
+
+
+class Command(BaseCommand):
+    help = "Backfill MinHash signatures used for near-duplicate detection; optionally link existing duplicates."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Ads loaded per query.')
+        parser.add_argument('--all', action='store_true', help='Re-check ads that already have a signature.')
+        parser.add_argument('--link', action='store_true',
+                            help='Also link open ads to an older open ad they near-duplicate.')
+
+    def handle(self, *args, **options):
+        indexed = linked = 0
+        for _ in sharding.each_shard():
+            # duplicates are only looked for among the ads of the same shard (city)
+            ads = Ad.objects.only('id', 'title', 'description', 'creator_id', 'status', 'duplicate_of_id').order_by('pk')
+            if not options['all']:
+                ads = ads.filter(signature__isnull=True)
+            last_id = 0
+            while True:
+                batch = list(ads.filter(pk__gt=last_id)[:options['batch_size']])
+                if not batch:
+                    break
+                last_id = batch[-1].pk
+                links = []
+                for ad in batch:
+                    signature = dedup.index_ad(ad)
+                    indexed += 1
+                    if options['link'] and ad.status == 'open' and ad.duplicate_of_id is None:
+                        # ads are walked oldest first, so only link to an older one
+                        original = dedup.find_duplicate(ad, signature)
+                        if original is not None and original < ad.pk:
+                            # written right away so later reposts resolve to the original;
+                            # a plain UPDATE, as Ad.save() would rebuild search_text
+                            Ad.objects.filter(pk=ad.pk).update(duplicate_of_id=original)
+                            links.append(ad.pk)
+                if links:
+                    # the update skips the post_save signal that refreshes snapshots
+                    snapshots.invalidate(links)
+                    linked += len(links)
+                self.stdout.write(f"  indexed up to ad {last_id}")
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} ads, linked {linked} duplicates."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import idempotency
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key records. Safe to run repeatedly (e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Records deleted per query.')
+
+    def handle(self, *args, **options):
+        purged = idempotency.purge_expired(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} expired idempotency keys."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.search import autocomplete_index
+
+
+class Command(BaseCommand):
+    help = "Recount the autocomplete title suggestions from every live ad (all shards)."
+
+    def handle(self, *args, **options):
+        spellings = autocomplete_index.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {spellings} title spellings.'))
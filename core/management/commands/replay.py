@@ -0,0 +1,331 @@
+import json
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from core import sharding
+from core.sketches import QuantileSketch
+from core.traffic import MASKED_WORD, SAFE_METHODS, read_capture
+
+
+# the rows behind a hashed path id, by the path segment in front of it
+ROUTE_ROWS = {
+    'ads': ('core.Ad', {}),
+    'proposals': ('core.Proposal', {}),
+    'comments': ('core.Comment', {}),
+    'tickets': ('core.Ticket', {}),
+    'schedules': ('core.Schedule', {}),
+    'contractors': (settings.AUTH_USER_MODEL, {'role': 'contractor'}),
+    'customers': (settings.AUTH_USER_MODEL, {'role': 'customer'}),
+    'users': (settings.AUTH_USER_MODEL, {}),
+}
+# captured ids are spread over at most this many rows of each kind
+ID_POOL_SIZE = 1000
+# masked query and body fields that hold user ids rather than text
+USER_ID_FIELDS = {'creator__id', 'contractor', 'assignee', 'creator', 'user'}
+# masked words are mapped onto the most frequent words of this many seeded ads
+VOCABULARY_ADS = 5000
+_WORD = re.compile(r'\w+')
+
+
+def _rewrite(data, text, user_id, field=None):
+    """``data`` with ``text`` applied to each masked word and ``user_id`` to each masked user id."""
+    if isinstance(data, dict):
+        return {name: _rewrite(value, text, user_id, name) for name, value in data.items()}
+    if isinstance(data, list):
+        return [_rewrite(value, text, user_id, field) for value in data]
+    if not isinstance(data, str):
+        return data
+    if field in USER_ID_FIELDS and MASKED_WORD.match(data):
+        return user_id(data)
+    return ' '.join(text(word) if MASKED_WORD.match(word) else word for word in data.split(' '))
+
+
+class ReplayRouter:
+    """Sends every query of an in-process replay to the ``--database`` alias."""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def db_for_read(self, model, **hints):
+        return self.alias
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class RouteStats:
+    def __init__(self):
+        self.latency = QuantileSketch()
+        self.captured = QuantileSketch()
+        self.count = self.client_errors = self.server_errors = self.failures = 0
+        self.max = 0.0
+
+    def add(self, record, status, elapsed_ms):
+        self.count += 1
+        if status is None:
+            self.failures += 1
+            return
+        self.latency.add(elapsed_ms)
+        self.max = max(self.max, elapsed_ms)
+        if record.get('duration_ms') is not None:
+            self.captured.add(record['duration_ms'])
+        if 400 <= status < 500:
+            self.client_errors += 1
+        elif status >= 500:
+            self.server_errors += 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay traffic captured by core.traffic.TrafficCaptureMiddleware against this project's database "
+        "(in-process) or a running server, and report latency and error rates per route. Each hashed id in "
+        "a captured path is mapped to an existing row of the same kind, hashed user ids to users and hashed "
+        "words to words of the seeded ads. Only reads are replayed unless "
+        "--allow-writes is given, which in-process also needs --database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Capture files, e.g. traffic.ndjson traffic.ndjson.1')
+        parser.add_argument('--speed', type=float, default=1.0, help='Speed multiplier for the captured timing; 0 sends as fast as possible.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at most.')
+        parser.add_argument('--base-url', default=None, help='Send requests over HTTP to this server instead of in-process.')
+        parser.add_argument('--allow-writes', action='store_true',
+                            help='Also send writes (anything but GET/HEAD/OPTIONS), in-process only with --database.')
+        parser.add_argument('--database', default=None,
+                            help='Database alias, other than default, that in-process requests use, e.g. a migrated copy.')
+        parser.add_argument('--limit', type=int, default=None, help='Replay only the first N requests.')
+        parser.add_argument('--user', action='append', default=[], metavar='ROLE=USERNAME',
+                            help='Account used in-process for requests captured from ROLE (default: the first user with that role).')
+        parser.add_argument('--token', action='append', default=[], metavar='ROLE=KEY',
+                            help='API token sent with --base-url for requests captured from ROLE.')
+        parser.add_argument('--no-throttle', action='store_true', help='Disable rate limits (in-process only).')
+
+    def handle(self, *args, **options):
+        try:
+            records = read_capture(options['paths'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read capture: {exc}')
+        self.base_url = options['base_url'].rstrip('/') if options['base_url'] else None
+        self.database = options['database']
+        if self.database is not None:
+            if self.database == 'default' or self.database not in settings.DATABASES:
+                raise CommandError(f'--database must name a configured database other than default, not {self.database!r}.')
+            if self.base_url is not None:
+                raise CommandError('--database applies to in-process replay only.')
+            if sharding.enabled():
+                raise CommandError('--database cannot redirect the shards; replay a sharded setup with --base-url.')
+        if options['allow_writes']:
+            if self.base_url is None and self.database is None:
+                raise CommandError('In-process writes need --database, a copy the replayed writes may change.')
+        else:
+            records = [record for record in records if record['method'] in SAFE_METHODS]
+        if options['limit'] is not None:
+            records = records[:options['limit']]
+        if not records:
+            raise CommandError('Nothing to replay.')
+        roles = {record['role'] for record in records} - {'anon'}
+        if self.base_url is not None:
+            self.tokens = self._tokens(roles, options['token'])
+        self.local = threading.local()
+
+        # in-process requests come from the test client's host and must not be captured again
+        overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'], 'TRAFFIC_CAPTURE_ENABLED': False}
+        if self.database is not None:
+            overrides['DATABASE_ROUTERS'] = [ReplayRouter(self.database)]
+        if options['no_throttle']:
+            overrides['REST_FRAMEWORK'] = {
+                **settings.REST_FRAMEWORK,
+                'DEFAULT_THROTTLE_RATES': dict.fromkeys(settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})),
+            }
+        with override_settings(**overrides):
+            if self.base_url is None:
+                self.users = self._users(roles, options['user'])
+            self._map_ids(records)
+            self._map_terms(records)
+            stats, elapsed, max_lag = self._replay(records, options['speed'], options['concurrency'])
+        self._report(stats, elapsed, max_lag)
+
+    def _users(self, roles, choices):
+        User = get_user_model()
+        usernames = dict(choice.split('=', 1) for choice in choices)
+        users = {}
+        for role in roles:
+            if role in usernames:
+                user = User.objects.filter(username=usernames[role]).first()
+            else:
+                user = User.objects.filter(role=role, is_active=True).order_by('pk').first()
+            if user is None:
+                raise CommandError(f'No user to replay {role!r} requests as; seed one or pass --user {role}=USERNAME.')
+            users[role] = user
+        return users
+
+    def _tokens(self, roles, choices):
+        # tokens are not created here: they would be credentials for real accounts
+        tokens = dict(choice.split('=', 1) for choice in choices)
+        missing = sorted(roles - set(tokens))
+        if missing:
+            raise CommandError(f"Pass --token ROLE=KEY for the captured roles {', '.join(missing)}.")
+        return tokens
+
+    def _map_ids(self, records):
+        """Replace each hashed path id by a row of its kind; one hash always maps to the same row."""
+        pools, mapped = {}, {}
+        for record in records:
+            hashes = set(record.get('params', {}).values())
+            if not hashes:
+                continue
+            segments = record['path'].split('/')
+            for position, segment in enumerate(segments):
+                if segment not in hashes or position == 0 or segments[position - 1] not in ROUTE_ROWS:
+                    continue
+                kind = segments[position - 1]
+                if kind not in pools:
+                    label, filters = ROUTE_ROWS[kind]
+                    pools[kind] = list(
+                        apps.get_model(label)._default_manager.filter(**filters).order_by('pk').values_list('pk', flat=True)[:ID_POOL_SIZE]
+                    )
+                if pools[kind]:
+                    ids = mapped.setdefault(kind, {})
+                    segments[position] = str(ids.setdefault(segment, pools[kind][len(ids) % len(pools[kind])]))
+            record['path'] = '/'.join(segments)
+
+    def _map_terms(self, records):
+        """Replace masked words in queries and bodies by seeded words, and masked user ids by users.
+
+        The most frequent captured word gets the most frequent word of the seeded
+        ads, so searches and autocomplete hit rows as the captured ones did.
+        """
+        from core.models import Ad
+        words, user_ids = Counter(), Counter()
+
+        def count_word(word):
+            words[word] += 1
+            return word
+
+        def count_user_id(value):
+            user_ids[value] += 1
+            return value
+
+        for record in records:
+            for part in ('query', 'body'):
+                if part in record:
+                    _rewrite(record[part], count_word, count_user_id)
+        if not words and not user_ids:
+            return
+        seeded = Counter()
+        for title, description in Ad.objects.order_by('-pk').values_list('title', 'description')[:VOCABULARY_ADS]:
+            seeded.update(word.lower() for word in _WORD.findall(f'{title} {description}'))
+        vocabulary = [word for word, _ in seeded.most_common()]
+        users = list(get_user_model()._default_manager.order_by('pk').values_list('pk', flat=True)[:ID_POOL_SIZE])
+        if words and not vocabulary:
+            self.stderr.write('No seeded ads to take search words from; masked words are replayed as they are.')
+        word_map = {word: vocabulary[rank % len(vocabulary)] for rank, (word, _) in enumerate(words.most_common())} if vocabulary else {}
+        user_map = {value: users[rank % len(users)] for rank, (value, _) in enumerate(user_ids.most_common())} if users else {}
+        for record in records:
+            for part in ('query', 'body'):
+                if part in record:
+                    record[part] = _rewrite(
+                        record[part], lambda word: word_map.get(word, word), lambda value: user_map.get(value, value),
+                    )
+
+    def _replay(self, records, speed, concurrency):
+        stats = {}
+        lock = threading.Lock()
+        slots = threading.BoundedSemaphore(concurrency)
+        max_lag = 0.0
+
+        def run(record):
+            try:
+                started = time.perf_counter()
+                try:
+                    status = self._send(record)
+                except Exception:  # connection refused, timeouts
+                    status = None
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                key = f"{record['method']} {record.get('route') or record['path']}"
+                with lock:
+                    stats.setdefault(key, RouteStats()).add(record, status, elapsed_ms)
+            finally:
+                slots.release()
+
+        first_ts = records[0]['ts']
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for record in records:
+                if speed > 0:
+                    due = started + (record['ts'] - first_ts) / speed
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                slots.acquire()
+                if speed > 0:
+                    # how far behind the captured schedule we fell for lack of free slots
+                    max_lag = max(max_lag, time.monotonic() - due)
+                pool.submit(run, record)
+        return stats, time.monotonic() - started, max_lag
+
+    def _send(self, record):
+        path = record['path']
+        if record.get('query'):
+            path = f"{path}?{urlencode(record['query'], doseq=True)}"
+        body = json.dumps(record['body']).encode() if 'body' in record else None
+        if self.base_url is None:
+            clients = getattr(self.local, 'clients', None)
+            if clients is None:
+                clients = self.local.clients = {}
+            client = clients.get(record['role'])
+            if client is None:
+                # authenticated without a token or session row
+                client = clients[record['role']] = APIClient(raise_request_exception=False)
+                client.force_authenticate(self.users.get(record['role']))
+            response = client.generic(record['method'], path, data=body or b'', content_type='application/json')
+            return response.status_code
+        token = self.tokens.get(record['role'])
+        request = urllib.request.Request(f'{self.base_url}{path}', data=body, method=record['method'])
+        request.add_header('Content-Type', 'application/json')
+        if token:
+            request.add_header('Authorization', f'Token {token}')
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:
+            return exc.code
+
+    def _report(self, stats, elapsed, max_lag):
+        total = sum(route.count for route in stats.values())
+        self.stdout.write(f'{total} requests in {elapsed:.1f}s ({total / elapsed:.1f}/s), max schedule lag {max_lag:.2f}s')
+        self.stdout.write(
+            f"{'route':<50} {'count':>6} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'maxms':>8} {'4xx%':>6} {'5xx%':>6} {'fail%':>6} {'capt p50':>9}"
+        )
+
+        def ms(value):
+            return f'{value:8.1f}' if value is not None else f"{'-':>8}"
+
+        for key, route in sorted(stats.items(), key=lambda item: -item[1].count):
+            # the sketch is accurate to 1%, which may overshoot the true maximum
+            p50, p95, p99 = (
+                min(value, route.max) if value is not None else None
+                for value in (route.latency.quantile(q) for q in (0.5, 0.95, 0.99))
+            )
+            captured = route.captured.quantile(0.5)
+            self.stdout.write(
+                f'{key[:50]:<50} {route.count:>6} {ms(p50)} {ms(p95)} {ms(p99)} {ms(route.max or None)} '
+                f'{route.client_errors / route.count:>6.1%} {route.server_errors / route.count:>6.1%} '
+                f'{route.failures / route.count:>6.1%} {ms(captured):>9}'
+            )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core import stats
+
+
+class Command(BaseCommand):
+    help = "Incrementally fold new ads and proposals into the daily stats rollups."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Source rows per transaction.')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches per source.')
+        parser.add_argument('--rebuild', action='store_true', help='Drop the rollups and watermarks and start over.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            stats.reset()
+            self.stdout.write("Rollups cleared.")
+        totals = stats.rollup(batch_size=options['batch_size'], max_batches=options['max_batches'])
+        for name, count in totals.items():
+            self.stdout.write(f"{name}: {count} rows")
+        self.stdout.write(self.style.SUCCESS('Rollup completed.'))
@@ -0,0 +1,74 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+
+from core import jobs
+
+
+def _worker_loop(batch_size, poll_interval, stale_after, once):
+    stop = False
+
+    def request_stop(signum, frame):
+        nonlocal stop
+        stop = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    name = jobs.worker_name()
+    last_requeue = 0.0
+    while not stop:
+        close_old_connections()
+        if time.monotonic() - last_requeue > stale_after:
+            jobs.requeue_stale(stale_after)
+            last_requeue = time.monotonic()
+        processed = jobs.run_batch(name, batch_size)
+        if once and not processed:
+            break
+        if not processed:
+            time.sleep(poll_interval)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Run background job workers from the database-backed queue (no external broker needed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Worker processes; 0 runs in this process.')
+        parser.add_argument('--batch-size', type=int, default=20, help='Jobs claimed per round trip.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--stale-after', type=int, default=300, help='Requeue running jobs whose heartbeat is older than this many seconds.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is drained.')
+        parser.add_argument('--purge-after', type=int, default=None, help='Delete finished jobs older than this many seconds before starting.')
+
+    def handle(self, *args, **options):
+        if options['stale_after'] <= jobs.heartbeat_seconds():
+            raise CommandError('--stale-after must be longer than JOBS_HEARTBEAT_SECONDS.')
+        if options['purge_after'] is not None:
+            purged = jobs.purge_finished(options['purge_after'])
+            self.stdout.write(f"Purged {purged} finished jobs.")
+        worker_args = (options['batch_size'], options['poll_interval'], options['stale_after'], options['once'])
+        if options['processes'] <= 0:
+            _worker_loop(*worker_args)
+            return
+
+        # children must open their own database connections
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=_worker_loop, args=worker_args, daemon=False)
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"Started {len(workers)} job workers.")
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
+        self.stdout.write(self.style.SUCCESS('Job workers stopped.'))
@@ -3,7 +3,7 @@ from django.contrib.auth import get_user_model
 from django.utils import timezone
 import datetime
 
-from core.models import Ad, Proposal, Comment, Rating, Ticket, Schedule
+from core.models import Ad, Category, Proposal, Comment, Rating, Ticket, Schedule
 
 
 class Command(BaseCommand):
@@ -85,6 +85,15 @@ class Command(BaseCommand):
         admin.set_password('DemoPass123')
         admin.save()
 
+        self.stdout.write("Creating categories...")
+        renovation = Category.resolve('renovation')
+        categories = {}
+        for name in ('painting', 'carpentry', 'tiling'):
+            categories[name] = Category.resolve(name)
+            if categories[name].parent_id != renovation.pk:
+                categories[name].parent = renovation
+                categories[name].save()
+
         self.stdout.write("Creating example ads, proposals, comments, ratings...")
 
         # Open ad (no accepted proposal)
@@ -96,7 +105,7 @@ class Command(BaseCommand):
                 'status': 'open',
                 'budget': '1500.00',
                 'location': 'Tehran',
-                'category': 'painting',
+                'category': categories['painting'],
                 'start_date': timezone.now().date(),
                 'end_date': (timezone.now() + timezone.timedelta(days=14)).date(),
                 'hours_per_day': '6.0',
@@ -112,7 +121,7 @@ class Command(BaseCommand):
                 'status': 'assigned',
                 'budget': '4000.00',
                 'location': 'Isfahan',
-                'category': 'carpentry',
+                'category': categories['carpentry'],
                 'start_date': (timezone.now() + timezone.timedelta(days=7)).date(),
                 'end_date': (timezone.now() + timezone.timedelta(days=21)).date(),
                 'hours_per_day': '8.0',
@@ -138,7 +147,7 @@ class Command(BaseCommand):
                 'status': 'done',
                 'budget': '1200.00',
                 'location': 'Shiraz',
-                'category': 'tiling',
+                'category': categories['tiling'],
                 'start_date': (timezone.now() - timezone.timedelta(days=30)).date(),
                 'end_date': (timezone.now() - timezone.timedelta(days=15)).date(),
                 'hours_per_day': '5.0',
@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import sharding
+from core.models import City
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy every user, category and city to every shard (needed once after adding a shard; "
+        "saves keep them in sync afterwards), and start shard ids after those of existing ads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users loaded per query.')
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Sharding is off; set DB_SHARDS first.')
+        User = get_user_model()
+        synced = 0
+        last_id = 0
+        while True:
+            users = list(User.objects.using('default').filter(pk__gt=last_id).order_by('pk')[:options['batch_size']])
+            if not users:
+                break
+            for user in users:
+                sharding.replicate(user)
+            synced += len(users)
+            last_id = users[-1].pk
+        sharding.replicate_categories()
+        for city in City.objects.using('default').order_by('pk').iterator(chunk_size=options['batch_size']):
+            sharding.replicate(city)
+        top = sharding.reserve_existing_ids()
+        if top:
+            self.stdout.write(f"Rows up to id {top} stay on default; new ids start after it.")
+        self.stdout.write(self.style.SUCCESS(f"Synced {synced} users to {len(sharding.shard_aliases())} shards."))
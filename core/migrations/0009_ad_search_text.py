@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:08
+
+from django.db import migrations, models
+
+# frozen copy of core.search.normalize_text as of this migration
+_CHAR_MAP = {
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی', 'ك': 'ک', 'ة': 'ه', 'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ؤ': 'و',
+    '\u200c': '', '\u200f': '', '\u200e': '', 'ـ': '',
+}
+for _i, (_fa, _ar) in enumerate(zip('۰۱۲۳۴۵۶۷۸۹', '٠١٢٣٤٥٦٧٨٩')):
+    _CHAR_MAP[_fa] = str(_i)
+    _CHAR_MAP[_ar] = str(_i)
+for _cp in list(range(0x064B, 0x0660)) + [0x0670]:
+    _CHAR_MAP[chr(_cp)] = ''
+_TRANSLATION = str.maketrans(_CHAR_MAP)
+
+
+def normalize_text(value):
+    if not value:
+        return ''
+    return ' '.join(str(value).translate(_TRANSLATION).lower().split())
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_search_text(apps, schema_editor):
+    Ad = apps.get_model('core', 'Ad')
+    ads = Ad.objects.using(schema_editor.connection.alias)
+    last_id = 0
+    while True:
+        batch = list(ads.filter(id__gt=last_id).order_by('id').only('id', 'title', 'category', 'description')[:BATCH_SIZE])
+        if not batch:
+            break
+        for ad in batch:
+            ad.search_text = normalize_text(' '.join(filter(None, [ad.title, ad.category, ad.description])))
+        ads.bulk_update(batch, ['search_text'])
+        last_id = batch[-1].id
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS core_ad_search_text_trgm '
+        'ON core_ad USING gin (search_text gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS core_ad_search_text_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_rating_ad_ticketmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_agent_load(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Ticket = apps.get_model('core', 'Ticket')
+    SupportAgentLoad = apps.get_model('core', 'SupportAgentLoad')
+    counts = dict(
+        Ticket.objects.filter(status__in=['open', 'in_progress'], assignee__isnull=False)
+        .values_list('assignee_id')
+        .annotate(n=models.Count('id'))
+    )
+    SupportAgentLoad.objects.bulk_create([
+        SupportAgentLoad(agent_id=agent_id, open_tickets=counts.get(agent_id, 0))
+        for agent_id in User.objects.filter(role='support').values_list('id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_ad_search_text'),
+        ('users', '0003_alter_user_email_alter_user_phone_number'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupportAgentLoad',
+            fields=[
+                ('agent', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ticket_load', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('open_tickets', models.PositiveIntegerField(db_index=True, default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['status', 'assignee', 'created_at'], name='ticket_status_assignee_idx'),
+        ),
+        migrations.RunPython(populate_agent_load, migrations.RunPython.noop),
+    ]
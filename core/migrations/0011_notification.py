@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_ticket_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('proposal_created', 'New proposal'), ('proposal_accepted', 'Proposal accepted'), ('proposal_completed', 'Proposal completed'), ('proposal_confirmed', 'Completion confirmed'), ('comment_created', 'New comment'), ('rating_created', 'New rating'), ('ticket_reply', 'Ticket reply')], max_length=30)),
+                ('target_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('text', models.CharField(blank=True, max_length=255)),
+                ('read', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['recipient', 'read', '-created_at'], name='notification_inbox_idx')],
+            },
+        ),
+    ]
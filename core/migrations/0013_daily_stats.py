@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:17
+
+from django.db import migrations, models
+
+
+def backfill_accepted_at(apps, schema_editor):
+    Proposal = apps.get_model('core', 'Proposal')
+    Proposal.objects.using(schema_editor.connection.alias).filter(accepted=True, accepted_at__isnull=True).update(accepted_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('last_timestamp', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='proposal',
+            name='accepted_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='DailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('category', models.CharField(blank=True, max_length=100)),
+                ('ads_created', models.PositiveIntegerField(default=0)),
+                ('proposals_created', models.PositiveIntegerField(default=0)),
+                ('proposals_accepted', models.PositiveIntegerField(default=0)),
+                ('proposal_price_sum', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('proposal_price_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='dailystat_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('category', 'date'), name='dailystat_category_date_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_accepted_at, migrations.RunPython.noop),
+    ]
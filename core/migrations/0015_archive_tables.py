@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_price_sketch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rating',
+            name='ad',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='core.ad'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedAd',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True)),
+                ('budget', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('category', models.CharField(blank=True, max_length=100)),
+                ('location', models.CharField(blank=True, max_length=255)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('hours_per_day', models.DecimalField(blank=True, decimal_places=1, max_digits=4, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('open', 'Open'), ('assigned', 'Assigned'), ('done', 'Done'), ('canceled', 'Canceled')], max_length=20)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_ads', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('text', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('ad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='core.archivedad')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_comments', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedProposal',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('accepted', models.BooleanField(default=False)),
+                ('accepted_at', models.DateTimeField(blank=True, null=True)),
+                ('completed', models.BooleanField(default=False)),
+                ('ad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='proposals', to='core.archivedad')),
+                ('contractor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_proposals', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdSnapshot',
+            fields=[
+                ('ad', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='core.ad')),
+                ('body', models.BinaryField(default=b'')),
+                ('generation', models.PositiveIntegerField(default=1)),
+                ('built_generation', models.PositiveIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
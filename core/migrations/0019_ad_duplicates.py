@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def expire_snapshots(apps, schema_editor):
+    # rendered ads gain the duplicate_of field
+    AdSnapshot = apps.get_model('core', 'AdSnapshot')
+    AdSnapshot.objects.using(schema_editor.connection.alias).update(built_generation=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_ad_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdSignature',
+            fields=[
+                ('ad', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='core.ad')),
+                ('source_hash', models.CharField(max_length=40)),
+                ('minhash', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, db_constraint=False, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='core.ad'),
+        ),
+        migrations.CreateModel(
+            name='AdSignatureBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('ad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='signature_bands', to='core.ad')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band', 'bucket'], name='ad_signature_band_idx')],
+            },
+        ),
+        migrations.RunPython(expire_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_ad_duplicates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardMap',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=50)),
+                ('shard', models.CharField(max_length=50)),
+            ],
+        ),
+    ]
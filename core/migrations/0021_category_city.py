@@ -0,0 +1,214 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:07
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# frozen copies of core.search.normalize_text and city_of as of this migration
+_CHAR_MAP = {
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی', 'ك': 'ک', 'ة': 'ه', 'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ؤ': 'و',
+    '\u200c': '', '\u200f': '', '\u200e': '', 'ـ': '',
+}
+for _i, (_fa, _ar) in enumerate(zip('۰۱۲۳۴۵۶۷۸۹', '٠١٢٣٤٥٦٧٨٩')):
+    _CHAR_MAP[_fa] = str(_i)
+    _CHAR_MAP[_ar] = str(_i)
+for _cp in list(range(0x064B, 0x0660)) + [0x0670]:
+    _CHAR_MAP[chr(_cp)] = ''
+_TRANSLATION = str.maketrans(_CHAR_MAP)
+_CITY_SEPARATORS = re.compile(r'[,،\-/(]')
+
+
+def normalize_text(value):
+    if not value:
+        return ''
+    return ' '.join(str(value).translate(_TRANSLATION).lower().split())
+
+
+def city_of(location):
+    return _CITY_SEPARATORS.split(normalize_text(location), 1)[0].strip()
+
+
+BATCH_SIZE = 1000
+
+
+class Lookups:
+    """Category and city ids by key for one database.
+
+    Shards hold copies of the ``default`` rows, so on a shard the rows are
+    resolved on ``default`` (migrated first) and copied over with their ids.
+    """
+
+    def __init__(self, apps, alias):
+        self.alias = alias
+        self.source = 'default' if alias in getattr(settings, 'DB_SHARDS', []) else alias
+        self.models = {'category': apps.get_model('core', 'Category'), 'city': apps.get_model('core', 'City')}
+        self.ids = {'category': {}, 'city': {}}
+
+    def _resolve(self, kind, key, name):
+        if not key:
+            return None
+        if key not in self.ids[kind]:
+            model = self.models[kind]
+            row, _ = model.objects.using(self.source).get_or_create(key=key, defaults={'name': name[:100]})
+            if self.source != self.alias:
+                model.objects.using(self.alias).get_or_create(pk=row.pk, defaults={'key': row.key, 'name': row.name})
+            self.ids[kind][key] = row.pk
+        return self.ids[kind][key]
+
+    def category(self, text):
+        return self._resolve('category', normalize_text(text)[:100], ' '.join((text or '').split()))
+
+    def city(self, location):
+        return self._resolve('city', city_of(location)[:100], _CITY_SEPARATORS.split(location or '', 1)[0].strip())
+
+
+def rebuild_closure(apps, alias):
+    # migrated strings become top-level categories, so every row is its own only ancestor
+    Category = apps.get_model('core', 'Category')
+    CategoryClosure = apps.get_model('core', 'CategoryClosure')
+    CategoryClosure.objects.using(alias).all().delete()
+    CategoryClosure.objects.using(alias).bulk_create(
+        [CategoryClosure(ancestor_id=pk, descendant_id=pk, depth=0) for pk in Category.objects.using(alias).values_list('pk', flat=True)],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def _batches(model, alias, fields):
+    last_id = 0
+    while True:
+        batch = list(model.objects.using(alias).filter(id__gt=last_id).order_by('id').only('id', *fields)[:BATCH_SIZE])
+        if not batch:
+            break
+        yield batch
+        last_id = batch[-1].id
+
+
+def normalize(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    lookups = Lookups(apps, alias)
+    for name in ('Ad', 'ArchivedAd'):
+        model = apps.get_model('core', name)
+        for batch in _batches(model, alias, ['category', 'location']):
+            for ad in batch:
+                ad.category_ref_id = lookups.category(ad.category)
+                ad.city_id = lookups.city(ad.location)
+            model.objects.using(alias).bulk_update(batch, ['category_ref', 'city'])
+    Schedule = apps.get_model('core', 'Schedule')
+    for batch in _batches(Schedule, alias, ['location']):
+        for row in batch:
+            row.city_id = lookups.city(row.location)
+        Schedule.objects.using(alias).bulk_update(batch, ['city'])
+    rebuild_closure(apps, alias)
+    if lookups.source != alias:
+        rebuild_closure(apps, lookups.source)
+
+
+def denormalize(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    for name in ('Ad', 'ArchivedAd'):
+        model = apps.get_model('core', name)
+        for batch in _batches(model, alias, ['category_ref']):
+            names = dict(apps.get_model('core', 'Category').objects.using(alias).filter(
+                pk__in={ad.category_ref_id for ad in batch},
+            ).values_list('pk', 'name'))
+            for ad in batch:
+                ad.category = names.get(ad.category_ref_id, '')
+            model.objects.using(alias).bulk_update(batch, ['category'])
+
+
+def expire_snapshots(apps, schema_editor):
+    # rendered ads now show the category's canonical name
+    AdSnapshot = apps.get_model('core', 'AdSnapshot')
+    AdSnapshot.objects.using(schema_editor.connection.alias).update(built_generation=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_shard_map'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('key', models.CharField(editable=False, max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'cities',
+            },
+        ),
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('key', models.CharField(editable=False, max_length=100, unique=True)),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='children', to='core.category')),
+            ],
+            options={
+                'verbose_name_plural': 'categories',
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='core.category')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='core.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='categoryclosure_ancestor_descendant_uniq')],
+            },
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='category_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='ads', to='core.category'),
+        ),
+        migrations.AddField(
+            model_name='archivedad',
+            name='category_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='archived_ads', to='core.category'),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='city',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='ads', to='core.city'),
+        ),
+        migrations.AddField(
+            model_name='archivedad',
+            name='city',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='archived_ads', to='core.city'),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='city',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='schedules', to='core.city'),
+        ),
+        migrations.RunPython(normalize, denormalize),
+        migrations.RemoveField(
+            model_name='ad',
+            name='category',
+        ),
+        migrations.RemoveField(
+            model_name='archivedad',
+            name='category',
+        ),
+        migrations.RenameField(
+            model_name='ad',
+            old_name='category_ref',
+            new_name='category',
+        ),
+        migrations.RenameField(
+            model_name='archivedad',
+            old_name='category_ref',
+            new_name='category',
+        ),
+        migrations.RunPython(expire_snapshots, migrations.RunPython.noop),
+    ]
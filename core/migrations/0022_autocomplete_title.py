@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# frozen copy of core.search.normalize_text as of this migration
+_CHAR_MAP = {
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی', 'ك': 'ک', 'ة': 'ه', 'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ؤ': 'و',
+    '\u200c': '', '\u200f': '', '\u200e': '', 'ـ': '',
+}
+for _i, (_fa, _ar) in enumerate(zip('۰۱۲۳۴۵۶۷۸۹', '٠١٢٣٤٥٦٧٨٩')):
+    _CHAR_MAP[_fa] = str(_i)
+    _CHAR_MAP[_ar] = str(_i)
+for _cp in list(range(0x064B, 0x0660)) + [0x0670]:
+    _CHAR_MAP[chr(_cp)] = ''
+_TRANSLATION = str.maketrans(_CHAR_MAP)
+
+
+def normalize_text(value):
+    if not value:
+        return ''
+    return ' '.join(str(value).translate(_TRANSLATION).lower().split())
+
+
+def backfill_titles(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    if alias in getattr(settings, 'DB_SHARDS', []):
+        # sharded ads are counted into default by `manage.py rebuild_autocomplete`
+        return
+    Ad = apps.get_model('core', 'Ad')
+    AutocompleteTitle = apps.get_model('core', 'AutocompleteTitle')
+    counts = {}
+    for title, n in Ad.objects.using(alias).order_by().values('title').annotate(n=models.Count('id')).values_list('title', 'n'):
+        key = normalize_text(title)[:255]
+        if key:
+            counts[(key, title[:255])] = counts.get((key, title[:255]), 0) + n
+    AutocompleteTitle.objects.using(alias).bulk_create(
+        [AutocompleteTitle(key=key, display=display, ads=n) for (key, display), n in counts.items()], batch_size=1000,
+    )
+
+
+def create_prefix_index(apps, schema_editor):
+    # LIKE 'prefix%' only uses a btree index with pattern ops on Postgres
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS core_autocompletetitle_key_like '
+        'ON core_autocompletetitle (key varchar_pattern_ops)'
+    )
+
+
+def drop_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS core_autocompletetitle_key_like')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_category_city'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AutocompleteTitle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('display', models.CharField(max_length=255)),
+                ('ads', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('key', 'display'), name='autocompletetitle_key_display_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_titles, migrations.RunPython.noop),
+        migrations.RunPython(create_prefix_index, drop_prefix_index),
+    ]
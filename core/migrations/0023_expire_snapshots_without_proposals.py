@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:02
+
+from django.db import migrations
+
+
+def expire_snapshots(apps, schema_editor):
+    # stored bodies embed every proposal of the ad; they now hold none and each
+    # request adds the ones its caller may read
+    AdSnapshot = apps.get_model('core', 'AdSnapshot')
+    AdSnapshot.objects.using(schema_editor.connection.alias).update(built_generation=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_autocomplete_title'),
+    ]
+
+    operations = [
+        migrations.RunPython(expire_snapshots, migrations.RunPython.noop),
+    ]
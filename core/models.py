@@ -1,7 +1,163 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, router, transaction
 from django.conf import settings
 
 
+class ShardedQuerySet(models.QuerySet):
+    """QuerySet of the models that can be sharded (see core.sharding).
+
+    ``create()`` without ``using()`` asks the router with the new row as hint,
+    so the row lands on the shard its contents pick instead of the queryset's
+    database.
+    """
+
+    def create(self, **kwargs):
+        if self._db is None:
+            return self.using(router.db_for_write(self.model, instance=self.model(**kwargs))).create(**kwargs)
+        return super().create(**kwargs)
+
+
+class Category(models.Model):
+    """Ad category; ``parent`` makes a tree (renovation -> painting).
+
+    ``key`` is the normalized name, so every spelling of a category resolves
+    to one row. ``CategoryClosure`` holds each category's ancestors.
+    """
+
+    name = models.CharField(max_length=100)
+    key = models.CharField(max_length=100, unique=True, editable=False)
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.PROTECT, related_name='children')
+
+    class Meta:
+        verbose_name_plural = 'categories'
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so the post_save signal only does work for a rename or a move
+        instance._loaded_name = instance.__dict__.get('name')
+        instance._loaded_parent_id = instance.__dict__.get('parent_id')
+        return instance
+
+    def clean(self):
+        if self.pk is not None and self.parent_id is not None and CategoryClosure.objects.filter(
+            ancestor_id=self.pk, descendant_id=self.parent_id,
+        ).exists():
+            raise ValidationError({'parent': 'A category cannot be moved under itself or its subcategories.'})
+
+    def save(self, *args, **kwargs):
+        from .search import normalize_text
+        self.name = ' '.join(self.name.split())
+        self.key = normalize_text(self.name)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def resolve(cls, name):
+        """The category called ``name`` in any spelling, added at the top level if new; None when blank."""
+        from .search import normalize_text
+        key = normalize_text(name)
+        if not key:
+            return None
+        category, _ = cls.objects.get_or_create(key=key, defaults={'name': name})
+        return category
+
+    @classmethod
+    def lookup(cls, name):
+        """The existing category called ``name`` in any spelling; None when blank or unknown."""
+        from .search import normalize_text
+        key = normalize_text(name)
+        if not key:
+            return None
+        return cls.objects.filter(key=key).first()
+
+    def add_closure(self, using='default'):
+        """Add the rows of a new leaf: its parent's ancestors one level further up, and itself."""
+        rows = [CategoryClosure(ancestor_id=self.pk, descendant_id=self.pk, depth=0)]
+        if self.parent_id is not None:
+            rows += [
+                CategoryClosure(ancestor_id=ancestor_id, descendant_id=self.pk, depth=depth + 1)
+                for ancestor_id, depth in CategoryClosure.objects.using(using).filter(
+                    descendant_id=self.parent_id,
+                ).values_list('ancestor_id', 'depth')
+            ]
+        # a concurrent rebuild may already have written some of them
+        CategoryClosure.objects.using(using).bulk_create(rows, ignore_conflicts=True)
+
+    @classmethod
+    def rebuild_closure(cls, using='default'):
+        """Recompute every (ancestor, descendant) row; only needed when a category moves."""
+        parents = dict(cls.objects.using(using).values_list('pk', 'parent_id'))
+        rows = []
+        for pk in parents:
+            ancestor, depth = pk, 0
+            while ancestor is not None and depth <= len(parents):
+                rows.append(CategoryClosure(ancestor_id=ancestor, descendant_id=pk, depth=depth))
+                ancestor, depth = parents.get(ancestor), depth + 1
+        with transaction.atomic(using=using):
+            CategoryClosure.objects.using(using).all().delete()
+            # rows a concurrent create or rebuild committed after the delete are the same rows
+            CategoryClosure.objects.using(using).bulk_create(rows, ignore_conflicts=True)
+
+
+class CategoryClosure(models.Model):
+    """One row per category and each of its ancestors, itself included at depth 0.
+
+    ``?category=renovation`` becomes a join on ``ancestor`` instead of a walk
+    down the tree.
+    """
+
+    ancestor = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='categoryclosure_ancestor_descendant_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} > {self.descendant_id} ({self.depth})"
+
+
+class City(models.Model):
+    """City part of the free-text locations, keyed like ``core.search.city_of``."""
+
+    name = models.CharField(max_length=100)
+    key = models.CharField(max_length=100, unique=True, editable=False)
+
+    class Meta:
+        verbose_name_plural = 'cities'
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        from .search import city_of
+        self.name = ' '.join(self.name.split())
+        self.key = city_of(self.name)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def resolve_many(cls, locations):
+        """``{location: City or None}``, adding cities not seen before."""
+        from .search import _CITY_SEPARATORS, city_of
+        keys = {location: city_of(location) for location in set(locations)}
+        cities = {city.key: city for city in cls.objects.filter(key__in=set(keys.values()) - {''})}
+        for location, key in keys.items():
+            if key and key not in cities:
+                # the city as first spelled, "Tehran" from "Tehran, Vanak"
+                name = _CITY_SEPARATORS.split(location, 1)[0].strip() or key
+                cities[key], _ = cls.objects.get_or_create(key=key, defaults={'name': name})
+        return {location: cities.get(key) for location, key in keys.items()}
+
+    @classmethod
+    def resolve(cls, location):
+        return cls.resolve_many([location])[location]
+
+
 class Ad(models.Model):
     STATUS_CHOICES = [
         ('open', 'Open'),
@@ -13,18 +169,83 @@ class Ad(models.Model):
     description = models.TextField(blank=True)
     # Additional fields
     budget = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    category = models.CharField(max_length=100, blank=True)
+    category = models.ForeignKey(Category, null=True, blank=True, on_delete=models.PROTECT, related_name='ads')
     location = models.CharField(max_length=255, blank=True)
+    # resolved from location on save
+    city = models.ForeignKey(City, null=True, blank=True, on_delete=models.PROTECT, related_name='ads', editable=False)
     start_date = models.DateField(null=True, blank=True)
     end_date = models.DateField(null=True, blank=True)
     hours_per_day = models.DecimalField(max_digits=4, decimal_places=1, null=True, blank=True)
     creator = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ads')
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    # normalized title/description/category used by search (see core.search)
+    search_text = models.TextField(blank=True, default='', editable=False)
+    # earlier open ad this one near-duplicates (see core.dedup); no FK constraint
+    # because the original may be moved to the archive
+    duplicate_of = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL,
+                                     related_name='duplicates', db_constraint=False, editable=False)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'end_date'], name='ad_status_end_date_idx'),
+        ]
 
     def __str__(self):
         return f"Ad {self.id} - {self.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so the post_save signal can move the autocomplete count without a query
+        instance._loaded_title = instance.__dict__.get('title')
+        # and so save() only resolves the city when the location changed
+        instance._loaded_location = instance.__dict__.get('location')
+        return instance
+
+    def build_search_text(self):
+        from .search import normalize_text
+        category = self.category.name if self.category_id else ''
+        return normalize_text(' '.join(filter(None, [self.title, category, self.description])))
+
+    def save(self, *args, **kwargs):
+        self.search_text = self.build_search_text()
+        update_fields = kwargs.get('update_fields')
+        relocated = (update_fields is None or 'location' in update_fields) and (
+            self._state.adding or getattr(self, '_loaded_location', None) != self.location
+        )
+        if relocated:
+            self.city = City.resolve(self.location)
+        if update_fields is not None:
+            update_fields = set(update_fields) | {'search_text'}
+            if relocated:
+                update_fields.add('city')
+            kwargs['update_fields'] = list(update_fields)
+        super().save(*args, **kwargs)
+        self._loaded_location = self.location
+
+
+class AutocompleteTitle(models.Model):
+    """Number of live ads using one spelling of a title; read by ``core.search.autocomplete_index``.
+
+    ``key`` is the normalized title. Kept on ``default`` so every web and job
+    worker shares it.
+    """
+
+    key = models.CharField(max_length=255)
+    display = models.CharField(max_length=255)
+    ads = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'display'], name='autocompletetitle_key_display_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.display} ({self.ads})"
+
 
 class Proposal(models.Model):
     ad = models.ForeignKey(Ad, on_delete=models.CASCADE, related_name='proposals')
@@ -33,8 +254,11 @@ class Proposal(models.Model):
     message = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     accepted = models.BooleanField(default=False)
+    accepted_at = models.DateTimeField(null=True, blank=True, db_index=True)
     completed = models.BooleanField(default=False)
 
+    objects = ShardedQuerySet.as_manager()
+
     def __str__(self):
         return f"Proposal by {self.contractor} for {self.ad}"
 
@@ -45,6 +269,8 @@ class Comment(models.Model):
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ShardedQuerySet.as_manager()
+
     def __str__(self):
         return f"Comment {self.id} by {self.author} on {self.ad}"
 
@@ -52,11 +278,15 @@ class Comment(models.Model):
 class Rating(models.Model):
     contractor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ratings_received')
     rater = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ratings_given')
-    ad = models.ForeignKey(Ad, on_delete=models.CASCADE, related_name='ratings', null=True, blank=True)
+    # no DB constraint: ratings stay in the hot table (they feed contractor
+    # averages) when their ad is moved to the archive by ``archive_ads``
+    ad = models.ForeignKey(Ad, on_delete=models.CASCADE, related_name='ratings', null=True, blank=True, db_constraint=False)
     score = models.PositiveSmallIntegerField()
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ShardedQuerySet.as_manager()
+
     def __str__(self):
         return f"Rating {self.score} for {self.contractor} by {self.rater}"
 
@@ -75,9 +305,65 @@ class Ticket(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    OPEN_STATUSES = ('open', 'in_progress')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'assignee', 'created_at'], name='ticket_status_assignee_idx'),
+        ]
+
     def __str__(self):
         return f"Ticket {self.id} - {self.title} ({self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so the post_save signal can adjust agent load without a query
+        instance._loaded_assignment = instance.assignment_key()
+        return instance
+
+    def assignment_key(self):
+        """The assignee this ticket counts against, or None if it counts against nobody."""
+        if self.__dict__.get('assignee_id') is None or self.__dict__.get('status') not in self.OPEN_STATUSES:
+            return None
+        return self.assignee_id
+
+
+class SupportAgentLoad(models.Model):
+    """Denormalized count of open tickets per support agent, used for auto-assignment."""
+
+    agent = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='ticket_load')
+    open_tickets = models.PositiveIntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        return f"{self.agent_id}: {self.open_tickets} open tickets"
+
+    @classmethod
+    def adjust(cls, agent_id, delta):
+        if agent_id is None or not delta:
+            return
+        cls.objects.filter(agent_id=agent_id).update(open_tickets=models.F('open_tickets') + delta)
+
+    @classmethod
+    def recount(cls, agent_ids=None):
+        """Recompute counters from the tickets table (after bulk updates, or to self-heal)."""
+        rows = cls.objects.all() if agent_ids is None else cls.objects.filter(agent_id__in=agent_ids)
+        counts = dict(
+            Ticket.objects.filter(status__in=Ticket.OPEN_STATUSES, assignee__isnull=False)
+            .filter(**({} if agent_ids is None else {'assignee_id__in': agent_ids}))
+            .values_list('assignee_id')
+            .annotate(n=models.Count('id'))
+        )
+        updated = []
+        for row in rows:
+            row.open_tickets = counts.get(row.agent_id, 0)
+            updated.append(row)
+        cls.objects.bulk_update(updated, ['open_tickets'])
+
+    @classmethod
+    def least_loaded_agent_id(cls):
+        return cls.objects.order_by('open_tickets', 'agent_id').values_list('agent_id', flat=True).first()
+
 
 class TicketMessage(models.Model):
     ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name='messages')
@@ -104,7 +390,271 @@ class Schedule(models.Model):
     start_time = models.TimeField()
     end_time = models.TimeField()
     location = models.CharField(max_length=255, blank=True)
+    # resolved from location on save
+    city = models.ForeignKey(City, null=True, blank=True, on_delete=models.PROTECT, related_name='schedules', editable=False)
     is_available = models.BooleanField(default=True)
 
     def __str__(self):
         return f"Schedule {self.contractor} day {self.day_of_week} {self.start_time}-{self.end_time}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so save() only resolves the city when the location changed
+        instance._loaded_location = instance.__dict__.get('location')
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if (update_fields is None or 'location' in update_fields) and (
+            self._state.adding or getattr(self, '_loaded_location', None) != self.location
+        ):
+            self.city = City.resolve(self.location)
+            if update_fields is not None:
+                kwargs['update_fields'] = list(set(update_fields) | {'city'})
+        super().save(*args, **kwargs)
+        self._loaded_location = self.location
+
+
+class Notification(models.Model):
+    KIND_CHOICES = [
+        ('proposal_created', 'New proposal'),
+        ('proposal_accepted', 'Proposal accepted'),
+        ('proposal_completed', 'Proposal completed'),
+        ('proposal_confirmed', 'Completion confirmed'),
+        ('comment_created', 'New comment'),
+        ('rating_created', 'New rating'),
+        ('ticket_reply', 'Ticket reply'),
+    ]
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    # id of the ad or ticket the notification points at, depending on kind
+    target_id = models.PositiveBigIntegerField(null=True, blank=True)
+    text = models.CharField(max_length=255, blank=True)
+    read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', 'read', '-created_at'], name='notification_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notification {self.id} ({self.kind}) for {self.recipient_id}"
+
+
+class Job(models.Model):
+    """A deferred side effect executed by ``manage.py run_workers``."""
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField()
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    # refreshed by the worker while the job runs; requeue_stale goes by this, not locked_at
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} {self.task} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """The stored outcome of a POST sent with an ``Idempotency-Key`` header (see core.idempotency)."""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    # method, path and body hash of the first request; a reuse with other parameters is rejected
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key} ({self.response_status or 'pending'})"
+
+
+class DailyStat(models.Model):
+    """Per-day, per-category marketplace counters maintained by ``rollup_stats``."""
+
+    date = models.DateField()
+    category = models.CharField(max_length=100, blank=True)
+    ads_created = models.PositiveIntegerField(default=0)
+    proposals_created = models.PositiveIntegerField(default=0)
+    proposals_accepted = models.PositiveIntegerField(default=0)
+    proposal_price_sum = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    proposal_price_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'date'], name='dailystat_category_date_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='dailystat_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.category or '-'}"
+
+
+class RollupWatermark(models.Model):
+    """How far an incremental rollup has read its source table."""
+
+    name = models.CharField(max_length=50, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id} / {self.last_timestamp}"
+
+
+class PriceSketch(models.Model):
+    """Quantile sketch of accepted proposal prices for one (category, location).
+
+    ``location`` is blank for the category-wide sketch. Keys are the
+    ``Category.key`` and ``City.key`` of the ad.
+    """
+
+    category = models.CharField(max_length=100)
+    location = models.CharField(max_length=255, blank=True)
+    count = models.PositiveIntegerField(default=0)
+    sketch = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'location'], name='pricesketch_category_location_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.category}/{self.location or '*'} ({self.count})"
+
+
+class ArchivedAd(models.Model):
+    """Finished ad moved out of the hot tables by ``archive_ads``; keeps its original id."""
+
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    budget = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    category = models.ForeignKey(Category, null=True, blank=True, on_delete=models.PROTECT, related_name='archived_ads')
+    location = models.CharField(max_length=255, blank=True)
+    city = models.ForeignKey(City, null=True, blank=True, on_delete=models.PROTECT, related_name='archived_ads')
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    hours_per_day = models.DecimalField(max_digits=4, decimal_places=1, null=True, blank=True)
+    creator = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_ads')
+    created_at = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=Ad.STATUS_CHOICES)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived ad {self.id} - {self.title}"
+
+
+class ArchivedProposal(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    ad = models.ForeignKey(ArchivedAd, on_delete=models.CASCADE, related_name='proposals')
+    contractor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_proposals')
+    price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    accepted = models.BooleanField(default=False)
+    accepted_at = models.DateTimeField(null=True, blank=True)
+    completed = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"Archived proposal {self.id} for ad {self.ad_id}"
+
+
+class ArchivedComment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    ad = models.ForeignKey(ArchivedAd, on_delete=models.CASCADE, related_name='comments')
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_comments')
+    text = models.TextField()
+    created_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Archived comment {self.id} on ad {self.ad_id}"
+
+
+class AdSnapshot(models.Model):
+    """Pre-rendered ``AdSerializer`` JSON for an ad, rebuilt by a job (see core.snapshots).
+
+    ``generation`` is bumped whenever the ad or one of its children changes;
+    the body is only served while ``built_generation`` matches it.
+    """
+
+    ad = models.OneToOneField(Ad, on_delete=models.CASCADE, primary_key=True, related_name='snapshot')
+    body = models.BinaryField(default=b'')
+    generation = models.PositiveIntegerField(default=1)
+    built_generation = models.PositiveIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Snapshot of ad {self.ad_id} (gen {self.built_generation}/{self.generation})"
+
+
+class AdSignature(models.Model):
+    """MinHash signature of an ad's normalized title and description (see core.dedup)."""
+
+    ad = models.OneToOneField(Ad, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    # hash of the text the signature was computed from; unchanged text is not re-indexed
+    source_hash = models.CharField(max_length=40)
+    minhash = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"Signature of ad {self.ad_id}"
+
+
+class AdSignatureBand(models.Model):
+    """One LSH band of an ``AdSignature``; ads sharing a (band, bucket) are duplicate candidates."""
+
+    ad = models.ForeignKey(Ad, on_delete=models.CASCADE, related_name='signature_bands')
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'bucket'], name='ad_signature_band_idx'),
+        ]
+
+    def __str__(self):
+        return f"Ad {self.ad_id} band {self.band}: {self.bucket}"
+
+
+class ShardMap(models.Model):
+    """Which shard holds a sharded row (see core.sharding); lives on ``default``.
+
+    The auto-increment ``id`` doubles as the id allocator: ads, proposals,
+    comments and ratings take theirs from here so ids stay unique across shards.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=50)
+    shard = models.CharField(max_length=50)
+
+    def __str__(self):
+        return f"{self.model} {self.id} on {self.shard}"
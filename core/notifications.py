@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .models import Notification
+
+
+def unread_count(user_id):
+    """Unread notifications for ``user_id``, read from the user's counter column."""
+    return get_user_model().objects.filter(pk=user_id).values_list('unread_notifications', flat=True).first() or 0
+
+
+def mark_read(user_id, ids=None):
+    """Mark ``user_id``'s notifications (all, or just ``ids``) read and lower the counter to match."""
+    with transaction.atomic():
+        qs = Notification.objects.filter(recipient_id=user_id, read=False)
+        if ids is not None:
+            qs = qs.filter(id__in=ids)
+        changed = qs.update(read=True)
+        if changed:
+            get_user_model().objects.filter(pk=user_id).update(
+                unread_notifications=Greatest(F('unread_notifications') - changed, Value(0)),
+            )
+
+
+def notify(recipient_ids, kind, actor=None, target_id=None, text=''):
+    """Fan a notification out to every recipient with one ``bulk_create``.
+
+    The actor is never notified about their own action. The recipients'
+    unread counters go up in the same transaction.
+    """
+    actor_id = getattr(actor, 'pk', actor)
+    recipients = {user_id for user_id in recipient_ids if user_id is not None and user_id != actor_id}
+    if not recipients:
+        return []
+    with transaction.atomic():
+        created = Notification.objects.bulk_create([
+            Notification(recipient_id=user_id, actor_id=actor_id, kind=kind, target_id=target_id, text=text[:255])
+            for user_id in recipients
+        ])
+        get_user_model().objects.filter(pk__in=recipients).update(unread_notifications=F('unread_notifications') + 1)
+    return created
+
+
+def notify_later(recipient_ids, kind, actor=None, target_id=None, text=''):
+    """Like ``notify()`` but deferred to the job queue after commit."""
+    from .jobs import enqueue
+    enqueue(
+        'core.notify',
+        recipient_ids=[user_id for user_id in recipient_ids if user_id is not None],
+        kind=kind,
+        actor_id=getattr(actor, 'pk', actor),
+        target_id=target_id,
+        text=text,
+    )
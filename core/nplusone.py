@@ -0,0 +1,267 @@
+"""N+1 query detection for development and CI.
+
+While a ``QueryCollector`` is active, every SQL statement run on any
+connection is reduced to its shape (literals and ``IN`` lists folded) and
+counted. A shape run more than ``threshold`` times is an N+1 suspect: when it
+crosses the threshold the stack is inspected once to find the serializer
+field and the line of project code that issued it, or the view when only
+Django or DRF code ran between the middleware and the query.
+
+``NPlusOneMiddleware`` collects per request and logs the suspects (or raises
+``QueryBudgetExceeded`` with ``NPLUSONE_RAISE``). Inside ``collect_reports``
+they are handed to the caller instead; ``core.pytest_nplusone`` uses that to
+fail the test that made the request.
+"""
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import re
+import sys
+import sysconfig
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_active = contextvars.ContextVar('nplusone_collector', default=None)
+_reports = contextvars.ContextVar('nplusone_reports', default=None)
+
+_IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+_SPACE = re.compile(r'\s+')
+
+
+def default_threshold():
+    return getattr(settings, 'NPLUSONE_THRESHOLD', 5)
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """The shape of ``sql``: the same statement with different values maps to the same string."""
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+_LIBRARY_PATHS = tuple({sysconfig.get_paths()[name] + os.sep for name in ('stdlib', 'purelib', 'platlib')})
+
+
+def _own_code(frame):
+    """True for frames of the project (or its tests) rather than Django, DRF or the stdlib."""
+    filename = frame.f_code.co_filename
+    return not (
+        filename.startswith(_LIBRARY_PATHS)
+        or filename.startswith('<')
+        or 'site-packages' in filename
+        or filename == __file__
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _middleware_files():
+    """Source files of the configured middleware; their frames wrap whole requests."""
+    files = set()
+    for path in settings.MIDDLEWARE:
+        module = sys.modules.get(path.rpartition('.')[0])
+        if getattr(module, '__file__', None):
+            files.add(module.__file__)
+    # this module's own frames (the execute wrapper) are always innermost
+    files.discard(__file__)
+    return frozenset(files)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return f'view {match.view_name or match._func_path}'
+
+
+def _where(frame):
+    filename = frame.f_code.co_filename
+    if filename.startswith(str(settings.BASE_DIR)):
+        filename = os.path.relpath(filename, settings.BASE_DIR)
+    return f'{filename}:{frame.f_lineno} in {frame.f_code.co_name}'
+
+
+def origin():
+    """``(serializer_field, code_location)`` of the query being run, either may be None."""
+    from rest_framework.fields import Field
+    field = location = None
+    frame = sys._getframe(1)
+    while frame is not None and (field is None or location is None):
+        if frame.f_code.co_filename in _middleware_files():
+            # frames further out belong to whoever sent the request; without
+            # project code between here and the query, name the view instead
+            if location is None:
+                location = _view_name(frame.f_locals.get('request'))
+            break
+        if location is None and _own_code(frame):
+            location = _where(frame)
+        if field is None:
+            owner = frame.f_locals.get('self')
+            # the innermost field being rendered; list serializers' children have no name
+            if isinstance(owner, Field) and owner.field_name and owner.parent is not None:
+                field = f'{type(owner.parent).__name__}.{owner.field_name}'
+        frame = frame.f_back
+    return field, location
+
+
+class Repeat:
+    """One statement shape that ran more often than the threshold."""
+
+    def __init__(self, sql, count, field, location):
+        self.sql = sql
+        self.count = count
+        self.field = field
+        self.location = location
+
+    def __str__(self):
+        source = ', '.join(filter(None, [self.field and f'serializer field {self.field}', self.location])) or 'unknown origin'
+        return f'{self.count}x from {source}: {self.sql}'
+
+
+class QueryCollector:
+    """Counts statement shapes run in its context (threads started with a copied context included)."""
+
+    def __init__(self, threshold=None):
+        self.threshold = default_threshold() if threshold is None else threshold
+        self.total = 0
+        self.counts = {}
+        self.origins = {}
+        self._token = None
+
+    def record(self, sql):
+        self.total += 1
+        shape = fingerprint(sql)
+        count = self.counts.get(shape, 0) + 1
+        self.counts[shape] = count
+        if count == self.threshold + 1:
+            # only look at the stack once per suspect
+            self.origins[shape] = origin()
+
+    def repeats(self):
+        """The suspects, most repeated first."""
+        return sorted(
+            (Repeat(shape, self.counts[shape], *found) for shape, found in self.origins.items()),
+            key=lambda repeat: -repeat.count,
+        )
+
+    def __enter__(self):
+        _install_everywhere()
+        self._token = _active.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _active.reset(self._token)
+        self._token = None
+
+
+def _record(execute, sql, params, many, context):
+    collector = _active.get()
+    if collector is not None:
+        collector.record(sql)
+    return execute(sql, params, many, context)
+
+
+def _install(connection):
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record)
+
+
+def install_on_new_connection(sender, connection, **kwargs):
+    _install(connection)
+
+
+def _install_everywhere():
+    """Wrap the open connections and every one opened later."""
+    # connected on first use, so a process without the middleware or collect_reports runs unwrapped
+    connection_created.connect(install_on_new_connection, dispatch_uid='core.nplusone')
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+
+
+def summary(collector, label):
+    """A readable list of ``collector``'s suspects, or None when there are none."""
+    repeats = collector.repeats()
+    if not repeats:
+        return None
+    return f'Possible N+1 in {label} ({collector.total} queries):\n' + '\n'.join(f'  {repeat}' for repeat in repeats)
+
+
+class Reports:
+    """Suspects gathered by ``collect_reports``."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.messages = []
+
+
+@contextlib.contextmanager
+def collect_reports(threshold=None):
+    """Gather the middleware's reports (at ``threshold``) instead of logging or raising them."""
+    reports = Reports(default_threshold() if threshold is None else threshold)
+    token = _reports.set(reports)
+    try:
+        yield reports
+    finally:
+        _reports.reset(token)
+
+
+def report(collector, label):
+    """Log ``collector``'s suspects; raise QueryBudgetExceeded when ``NPLUSONE_RAISE`` is on."""
+    message = summary(collector, label)
+    if message is None:
+        return
+    reports = _reports.get()
+    if reports is not None:
+        reports.messages.append(message)
+        return
+    if getattr(settings, 'NPLUSONE_RAISE', False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class NPlusOneMiddleware:
+    """Reports statement shapes repeated more than ``NPLUSONE_THRESHOLD`` times in one request."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'NPLUSONE_ENABLED', False) and _reports.get() is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def threshold():
+        reports = _reports.get()
+        return reports.threshold if reports is not None else None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with QueryCollector(self.threshold()) as collector:
+            response = self.get_response(request)
+        report(collector, f'{request.method} {request.path}')
+        return response
+
+    async def __acall__(self, request):
+        with QueryCollector(self.threshold()) as collector:
+            response = await self.get_response(request)
+        report(collector, f'{request.method} {request.path}')
+        return response
@@ -1,4 +1,85 @@
+"""Access rules for the core API.
+
+Ownership is decided from foreign-key ids (``creator_id``, ``contractor_id``,
+``author_id``) so object checks never load the related user. Who may read
+which rows is one ``Q`` per model in ``VISIBILITY``; views apply it with
+``visible_to`` (or ``VisibleToUserMixin``) so a detail lookup fetches only a
+row the caller may see, in one query, and anything else is a 404.
+"""
+from django.db.models import Q
 from rest_framework import permissions
+from rest_framework.exceptions import PermissionDenied
+
+
+OWNER_FIELDS = ('creator', 'contractor', 'author')
+
+
+def role_of(user):
+    """The caller's role, or None when anonymous."""
+    if user is None or not user.is_authenticated:
+        return None
+    return getattr(user, 'role', None)
+
+
+def require_role(user, role, message):
+    if role_of(user) != role:
+        raise PermissionDenied(message)
+
+
+def is_owner(user, obj, fields=OWNER_FIELDS):
+    if user is None or not user.is_authenticated:
+        return False
+    return any(getattr(obj, f'{name}_id', None) == user.pk for name in fields)
+
+
+def _proposals(user):
+    role = role_of(user)
+    if role == 'contractor':
+        return Q(contractor_id=user.pk)
+    if role == 'customer':
+        # proposals on the customer's own ads
+        return Q(ad__creator_id=user.pk)
+    # support and admin see all
+    return Q()
+
+
+def _tickets(user):
+    if role_of(user) == 'support':
+        return Q()
+    return Q(creator_id=user.pk) | Q(assignee_id=user.pk)
+
+
+def _ticket_messages(user):
+    if role_of(user) == 'support':
+        return Q()
+    return Q(ticket__creator_id=user.pk) | Q(ticket__assignee_id=user.pk)
+
+
+# model label -> rule(user) giving the rows an authenticated user may read;
+# anonymous users see none of them
+VISIBILITY = {
+    'core.proposal': _proposals,
+    'core.archivedproposal': _proposals,
+    'core.ticket': _tickets,
+    'core.ticketmessage': _ticket_messages,
+}
+
+
+def visible_to(queryset, user):
+    """``queryset`` narrowed to the rows ``user`` may read; unchanged for models without a rule."""
+    rule = VISIBILITY.get(queryset.model._meta.label_lower)
+    if rule is None:
+        return queryset
+    if role_of(user) is None:
+        return queryset.none()
+    return queryset.filter(rule(user))
+
+
+class VisibleToUserMixin:
+    """Restricts a generic view's queryset to what the caller may read (see ``VISIBILITY``)."""
+
+    def get_queryset(self):
+        return visible_to(super().get_queryset(), self.request.user)
 
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
@@ -9,11 +90,7 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
         # Write permissions are only allowed to the owner of the object
-        return (
-            getattr(obj, 'creator', None) == request.user
-            or getattr(obj, 'contractor', None) == request.user
-            or getattr(obj, 'author', None) == request.user
-        )
+        return is_owner(request.user, obj)
 
 
 class IsSupportOrOwner(permissions.BasePermission):
@@ -22,6 +99,6 @@ class IsSupportOrOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
             return True
-        if getattr(request.user, 'role', None) == 'support':
+        if role_of(request.user) == 'support':
             return True
-        return getattr(obj, 'creator', None) == request.user
+        return is_owner(request.user, obj, fields=('creator',))
@@ -0,0 +1,61 @@
+from django.db import transaction
+
+from .models import PriceSketch
+from .search import city_of, normalize_text
+from .sketches import QuantileSketch
+
+
+# below this many samples a city falls back to the category-wide sketch
+MIN_LOCATION_SAMPLES = 5
+
+
+def sketch_keys(category, location):
+    category = normalize_text(category)
+    if not category:
+        return []
+    keys = [(category, '')]
+    # per city, whatever the spelling of the rest of the location
+    location = city_of(location)
+    if location:
+        keys.append((category, location))
+    return keys
+
+
+def record_prices(category, location, prices):
+    """Fold ``prices`` into the category-wide and per-location sketches."""
+    prices = [price for price in prices if price is not None]
+    if not prices:
+        return
+    with transaction.atomic():
+        for key in sketch_keys(category, location):
+            row, _ = PriceSketch.objects.select_for_update().get_or_create(category=key[0], location=key[1])
+            sketch = QuantileSketch.from_dict(row.sketch)
+            for price in prices:
+                sketch.add(price)
+            row.sketch = sketch.to_dict()
+            row.count = sketch.count
+            row.save(update_fields=['sketch', 'count', 'updated_at'])
+
+
+def suggest(category, location=''):
+    """p25/p50/p75 of accepted prices; falls back to the category when the city is thin."""
+    keys = sketch_keys(category, location)
+    if not keys:
+        return None
+    rows = {(row.category, row.location): row for row in PriceSketch.objects.filter(category=keys[0][0], location__in=[key[1] for key in keys])}
+    chosen = None
+    for key in reversed(keys):
+        row = rows.get(key)
+        if row is not None and (row.count >= MIN_LOCATION_SAMPLES or not key[1]):
+            chosen = row
+            break
+    if chosen is None:
+        return None
+    sketch = QuantileSketch.from_dict(chosen.sketch)
+    return {
+        'scope': 'location' if chosen.location else 'category',
+        'samples': chosen.count,
+        'p25': round(sketch.quantile(0.25), 2),
+        'p50': round(sketch.quantile(0.5), 2),
+        'p75': round(sketch.quantile(0.75), 2),
+    }
@@ -0,0 +1,70 @@
+import threading
+
+from django.conf import settings
+
+
+class Hub:
+    """In-process pub/sub keyed by topic.
+
+    Publishers record the newest event id for a topic and wake every waiter;
+    waiters only re-check an in-memory id, so an idle subscriber costs no
+    queries. Events published by another process are not seen here; the
+    streaming views re-read the table after every heartbeat to pick them up.
+    """
+
+    def __init__(self, max_subscribers):
+        self._cond = threading.Condition()
+        self._latest = {}
+        self._subscribers = 0
+        self.max_subscribers = max_subscribers
+
+    def publish(self, topic, event_id):
+        with self._cond:
+            if event_id > self._latest.get(topic, 0):
+                self._latest[topic] = event_id
+            self._cond.notify_all()
+
+    def wait(self, topic, after_id, timeout):
+        """Block until ``topic`` has an event newer than ``after_id``; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._latest.get(topic, 0) > after_id, timeout)
+
+    def subscribe(self):
+        """Reserve a subscriber slot; returns a release callable, or None when full."""
+        with self._cond:
+            if self._subscribers >= self.max_subscribers:
+                return None
+            self._subscribers += 1
+        released = False
+
+        def release():
+            nonlocal released
+            with self._cond:
+                if not released:
+                    released = True
+                    self._subscribers -= 1
+        return release
+
+
+class ReleasingIterator:
+    """Wraps a streaming generator so its subscriber slot is freed on close,
+    even if the client disconnects before the first chunk is sent."""
+
+    def __init__(self, iterator, release):
+        self._iterator = iterator
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        try:
+            self._iterator.close()
+        finally:
+            self._release()
+
+
+ticket_messages = Hub(getattr(settings, 'TICKET_STREAM_MAX_CONNECTIONS', 100))
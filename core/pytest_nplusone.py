@@ -0,0 +1,59 @@
+"""pytest plugin that fails tests whose requests repeat one query shape too often.
+
+    pytest -p core.pytest_nplusone --nplusone-threshold=5
+
+Every request a test makes through the test client is checked by
+``core.nplusone.NPlusOneMiddleware``; a statement shape run more than the
+threshold within one request fails the test with the serializer field and
+line that issued it. Queries of the test's own setup are not counted.
+``@pytest.mark.query_budget(n)`` sets the threshold for one test and
+``@pytest.mark.query_budget(None)`` skips the check.
+"""
+import warnings
+
+import pytest
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('nplusone', 'N+1 query detection')
+    group.addoption(
+        '--nplusone-threshold', type=int, default=None,
+        help='Times one statement shape may run per request (default: NPLUSONE_THRESHOLD).',
+    )
+    group.addoption(
+        '--nplusone-warn', action='store_true', default=False,
+        help='Report repeated queries as warnings instead of failing the test.',
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'query_budget(n): times one statement shape may run per request in this test; None to skip the check')
+
+
+def _threshold(item):
+    marker = item.get_closest_marker('query_budget')
+    if marker is not None:
+        return marker.args[0] if marker.args else marker.kwargs.get('n')
+    option = item.config.getoption('nplusone_threshold')
+    if option is not None:
+        return option
+    from core.nplusone import default_threshold
+    return default_threshold()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    limit = _threshold(item)
+    if limit is None:
+        yield
+        return
+    from core.nplusone import collect_reports
+    with collect_reports(limit) as reports:
+        outcome = yield
+    if outcome.excinfo is not None or not reports.messages:
+        return
+    message = '\n'.join(reports.messages)
+    if item.config.getoption('nplusone_warn'):
+        warnings.warn(message)
+        return
+    outcome.force_exception(pytest.fail.Exception(message, pytrace=False))
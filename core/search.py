@@ -0,0 +1,143 @@
+import difflib
+import re
+
+from django.db import models, transaction
+from rest_framework import filters
+
+
+# Arabic code points that Persian keyboards and copy/pasted text mix in.
+_CHAR_MAP = {
+    'ي': 'ی',
+    'ى': 'ی',
+    'ئ': 'ی',
+    'ك': 'ک',
+    'ة': 'ه',
+    'أ': 'ا',
+    'إ': 'ا',
+    'آ': 'ا',
+    'ؤ': 'و',
+    '\u200c': '',  # ZWNJ
+    '\u200f': '',  # RLM
+    '\u200e': '',  # LRM
+    'ـ': '',  # tatweel
+}
+for _i, (_fa, _ar) in enumerate(zip('۰۱۲۳۴۵۶۷۸۹', '٠١٢٣٤٥٦٧٨٩')):
+    _CHAR_MAP[_fa] = str(_i)
+    _CHAR_MAP[_ar] = str(_i)
+# harakat / diacritics
+for _cp in list(range(0x064B, 0x0660)) + [0x0670]:
+    _CHAR_MAP[chr(_cp)] = ''
+_TRANSLATION = str.maketrans(_CHAR_MAP)
+
+
+def normalize_text(value):
+    """Fold Persian/Arabic variants, digits and ZWNJ so equivalent spellings compare equal."""
+    if not value:
+        return ''
+    return ' '.join(str(value).translate(_TRANSLATION).lower().split())
+
+
+_CITY_SEPARATORS = re.compile(r'[,،\-/(]')
+
+
+def city_of(location):
+    """The normalized city part of a free-text location ("Tehran, Vanak" -> "tehran")."""
+    return _CITY_SEPARATORS.split(normalize_text(location), 1)[0].strip()
+
+
+class NormalizedSearchFilter(filters.SearchFilter):
+    """SearchFilter that matches the normalized terms against ``Ad.search_text``."""
+
+    search_field = 'search_text'
+
+    def filter_queryset(self, request, queryset, view):
+        terms = [normalize_text(term) for term in self.get_search_terms(request)]
+        for term in terms:
+            if term:
+                queryset = queryset.filter(**{f'{self.search_field}__contains': term})
+        return queryset
+
+
+class AutocompleteIndex:
+    """Prefix suggestions for ad titles and categories, read from the database.
+
+    Titles come from ``AutocompleteTitle`` (one row per spelling, counted by
+    the ``Ad`` save/delete signals) and categories from ``Category``, so every
+    process sees the same suggestions. Both are looked up by a prefix of their
+    normalized ``key``.
+    """
+
+    KINDS = ('titles', 'categories')
+    # upper bound on keys compared by the typo fallback, keeps a keystroke cheap
+    FUZZY_SCAN_LIMIT = 2000
+    # spellings read per suggestion; most keys have one or two
+    SPELLINGS_PER_KEY = 5
+
+    def _rows(self, kind):
+        """``(key, display)`` pairs, ordered by key and most used spelling first."""
+        from .models import AutocompleteTitle, Category
+        if kind == 'titles':
+            return AutocompleteTitle.objects.filter(ads__gt=0).order_by('key', '-ads', 'display').values_list('key', 'display')
+        return Category.objects.order_by('key').values_list('key', 'name')
+
+    @staticmethod
+    def _first_spellings(rows, limit):
+        results, seen = [], set()
+        for key, display in rows:
+            if key in seen:
+                continue
+            seen.add(key)
+            results.append(display)
+            if len(results) >= limit:
+                break
+        return results
+
+    def _lookup(self, kind, prefix, limit):
+        rows = self._rows(kind)
+        results = self._first_spellings(rows.filter(key__startswith=prefix)[:limit * self.SPELLINGS_PER_KEY], limit)
+        if results:
+            return results
+        # typo fallback: only compare against keys sharing the first character
+        scanned = list(rows.filter(key__startswith=prefix[0])[:self.FUZZY_SCAN_LIMIT])
+        close = set(difflib.get_close_matches(prefix, [key[:len(prefix)] for key, _ in scanned], n=limit, cutoff=0.75))
+        return self._first_spellings(((key, display) for key, display in scanned if key[:len(prefix)] in close), limit)
+
+    def suggest(self, query, limit=10):
+        prefix = normalize_text(query)
+        if not prefix:
+            return {kind: [] for kind in self.KINDS}
+        return {kind: self._lookup(kind, prefix, limit) for kind in self.KINDS}
+
+    def count_titles(self, titles, delta):
+        """Add ``delta`` ads to each of ``titles``' counts."""
+        from .models import AutocompleteTitle
+        for title in titles:
+            key = normalize_text(title)[:255]
+            if not key:
+                continue
+            rows = AutocompleteTitle.objects.filter(key=key, display=title[:255])
+            if delta > 0:
+                AutocompleteTitle.objects.bulk_create([AutocompleteTitle(key=key, display=title[:255])], ignore_conflicts=True)
+            else:
+                rows = rows.filter(ads__gte=-delta)
+            rows.update(ads=models.F('ads') + delta)
+
+    def rebuild(self):
+        """Recount every live ad's title (all shards); returns the number of spellings."""
+        from .models import Ad, AutocompleteTitle
+        from .sharding import each_shard
+        counts = {}
+        for _ in each_shard():
+            for title, n in Ad.objects.order_by().values('title').annotate(n=models.Count('id')).values_list('title', 'n'):
+                key = normalize_text(title)[:255]
+                if key:
+                    counts[(key, title[:255])] = counts.get((key, title[:255]), 0) + n
+        with transaction.atomic():
+            AutocompleteTitle.objects.all().delete()
+            AutocompleteTitle.objects.bulk_create(
+                [AutocompleteTitle(key=key, display=display, ads=n) for (key, display), n in counts.items()], batch_size=1000,
+            )
+        return len(counts)
+
+
+autocomplete_index = AutocompleteIndex()
@@ -1,78 +1,346 @@
 from rest_framework import serializers
-from .models import Ad, Proposal
-from users.serializers import UserSerializer
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
+from .models import Ad, Category, City, Proposal
 from .models import Comment
 from .models import Rating, Ticket, TicketMessage
 from .models import Schedule
-from django.db.models import Avg, Count
-
-
-class AdSerializer(serializers.ModelSerializer):
-    creator = UserSerializer(read_only=True)
+from .models import Notification
+from .models import ArchivedAd, ArchivedComment, ArchivedProposal
+from django.db.models import Avg, Count, Prefetch
+from .loaders import LoadedUserField, UserLoaderListSerializer, UserLoaderMixin, get_user_loader
+from .permissions import role_of, visible_to
+from .sharding import merged
+
+
+def _prefetched(obj, name):
+    return name in getattr(obj, '_prefetched_objects_cache', {})
+
+
+def visible_proposals(context, ad_ids, using=None, serializer_class=None):
+    """``{ad_id: [proposal, ...]}`` newest first, limited to what the request's user may read; one query."""
+    serializer_class = serializer_class or ProposalSerializer
+    user = getattr(context.get('request'), 'user', None)
+    if role_of(user) is None or not ad_ids:
+        return {}
+    qs = serializer_class.Meta.model.objects.using(using).filter(ad_id__in=ad_ids).order_by('-created_at')
+    proposals = list(visible_to(qs, user))
+    found = {}
+    for proposal, data in zip(proposals, serializer_class(proposals, many=True, context=context).data):
+        found.setdefault(proposal.ad_id, []).append(data)
+    return found
+
+
+@extend_schema_field(OpenApiTypes.STR)
+class CategoryField(serializers.Field):
+    """A category by name in any spelling; categories are added in the admin, not by ad posters."""
+
+    default_error_messages = {
+        'invalid': 'Not a valid string.',
+        'max_length': 'Ensure this field has no more than 100 characters.',
+        'does_not_exist': 'Unknown category "{name}".',
+    }
+
+    def to_representation(self, value):
+        return value.name
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid')
+        if len(data) > 100:
+            self.fail('max_length')
+        category = Category.lookup(data)
+        if category is None and data.strip():
+            self.fail('does_not_exist', name=data)
+        return category
+
+
+class AdSerializer(UserLoaderMixin, serializers.ModelSerializer):
+    creator = LoadedUserField()
+    category = CategoryField(required=False, allow_null=True)
     proposals = serializers.SerializerMethodField()
     comments = serializers.SerializerMethodField()
 
     class Meta:
         model = Ad
-        fields = ['id', 'title', 'description', 'creator', 'created_at', 'status', 'budget', 'category', 'location', 'start_date', 'end_date', 'hours_per_day', 'proposals', 'comments']
+        fields = ['id', 'title', 'description', 'creator', 'created_at', 'status', 'budget', 'category', 'location', 'start_date', 'end_date', 'hours_per_day', 'duplicate_of', 'proposals', 'comments']
+        read_only_fields = ['duplicate_of']
+        list_serializer_class = UserLoaderListSerializer
+
+    proposal_serializer_class = None
+
+    # proposals are not prefetched: which ones show depends on the caller, so
+    # prime_users loads them for the whole page instead (see visible_proposals)
+    @staticmethod
+    def prefetch_children(qs):
+        return qs.select_related('category').prefetch_related(
+            Prefetch('comments', queryset=Comment.objects.order_by('-created_at')),
+        )
+
+    def prime_users(self, instances):
+        super().prime_users(instances)
+        # users of prefetched children join the same batch as the creators
+        loader = get_user_loader(self.context)
+        for ad in instances:
+            if _prefetched(ad, 'comments'):
+                loader.prime(c.author_id for c in ad.comments.all())
+        self.prime_proposals(instances)
+
+    def prime_proposals(self, instances):
+        loaded = self.context.setdefault('visible_proposals', {})
+        label = self.Meta.model._meta.label_lower
+        pending = {}
+        for ad in instances:
+            if (label, ad.pk) not in loaded:
+                # merged pages hold ads of several shards
+                pending.setdefault(ad._state.db, []).append(ad.pk)
+        for using, ad_ids in pending.items():
+            found = visible_proposals(self.context, ad_ids, using=using, serializer_class=self.proposal_serializer_class)
+            for ad_id in ad_ids:
+                loaded[label, ad_id] = found.get(ad_id, [])
 
     def get_proposals(self, obj) -> list:
-        qs = obj.proposals.all().order_by('-created_at')
-        return ProposalSerializer(qs, many=True).data
+        return self.context['visible_proposals'][self.Meta.model._meta.label_lower, obj.pk]
 
     def get_comments(self, obj) -> list:
-        qs = obj.comments.all().order_by('-created_at')
-        return CommentSerializer(qs, many=True).data
+        qs = obj.comments.all() if _prefetched(obj, 'comments') else obj.comments.all().order_by('-created_at')
+        return CommentSerializer(qs, many=True, context=self.context).data
 
 
-class ProposalSerializer(serializers.ModelSerializer):
-    contractor = UserSerializer(read_only=True)
+class ProposalSerializer(UserLoaderMixin, serializers.ModelSerializer):
+    contractor = LoadedUserField()
 
     class Meta:
         model = Proposal
         fields = ['id', 'ad', 'contractor', 'price', 'message', 'created_at', 'accepted', 'completed']
+        list_serializer_class = UserLoaderListSerializer
 
 
-class CommentSerializer(serializers.ModelSerializer):
-    author = UserSerializer(read_only=True)
+class CommentSerializer(UserLoaderMixin, serializers.ModelSerializer):
+    author = LoadedUserField()
 
     class Meta:
         model = Comment
         fields = ['id', 'ad', 'author', 'text', 'created_at']
+        list_serializer_class = UserLoaderListSerializer
+
+
+class ArchivedProposalSerializer(ProposalSerializer):
+    class Meta(ProposalSerializer.Meta):
+        model = ArchivedProposal
+
+
+class ArchivedCommentSerializer(CommentSerializer):
+    class Meta(CommentSerializer.Meta):
+        model = ArchivedComment
+
+
+class ArchivedAdSerializer(AdSerializer):
+    """Read-only view of an archived ad, same shape as ``AdSerializer``."""
+
+    # duplicate links only matter while ads are open and are not archived
+    duplicate_of = serializers.SerializerMethodField()
+    proposal_serializer_class = ArchivedProposalSerializer
+
+    class Meta(AdSerializer.Meta):
+        model = ArchivedAd
+        read_only_fields = AdSerializer.Meta.fields
+
+    def get_duplicate_of(self, obj) -> int | None:
+        return None
+
+    @staticmethod
+    def prefetch_children(qs):
+        return qs.select_related('category').prefetch_related(
+            Prefetch('comments', queryset=ArchivedComment.objects.order_by('-created_at')),
+        )
+
+    def get_comments(self, obj) -> list:
+        qs = obj.comments.all() if _prefetched(obj, 'comments') else obj.comments.all().order_by('-created_at')
+        return ArchivedCommentSerializer(qs, many=True, context=self.context).data
 
 
-class RatingSerializer(serializers.ModelSerializer):
-    rater = UserSerializer(read_only=True)
-    contractor = UserSerializer(read_only=True)
+class RatingSerializer(UserLoaderMixin, serializers.ModelSerializer):
+    rater = LoadedUserField()
+    contractor = LoadedUserField()
 
     class Meta:
         model = Rating
         fields = ['id', 'contractor', 'rater', 'ad', 'score', 'comment', 'created_at']
+        list_serializer_class = UserLoaderListSerializer
 
 
-class TicketSerializer(serializers.ModelSerializer):
-    creator = UserSerializer(read_only=True)
-    assignee = UserSerializer(read_only=True)
+class TicketSerializer(UserLoaderMixin, serializers.ModelSerializer):
+    creator = LoadedUserField()
+    assignee = LoadedUserField()
 
     class Meta:
         model = Ticket
         fields = ['id', 'title', 'description', 'creator', 'assignee', 'status', 'created_at', 'updated_at']
+        list_serializer_class = UserLoaderListSerializer
+
 
+class TicketQueueRequestSerializer(serializers.Serializer):
+    claim = serializers.BooleanField(default=False, help_text='Assign to the caller instead of the least-loaded agent')
 
-class TicketMessageSerializer(serializers.ModelSerializer):
-    author = UserSerializer(read_only=True)
+
+class TicketMessageSerializer(UserLoaderMixin, serializers.ModelSerializer):
+    author = LoadedUserField()
 
     class Meta:
         model = TicketMessage
         fields = ['id', 'ticket', 'author', 'text', 'created_at']
+        list_serializer_class = UserLoaderListSerializer
 
 
-class ScheduleSerializer(serializers.ModelSerializer):
-    contractor = UserSerializer(read_only=True)
+class ScheduleSerializer(UserLoaderMixin, serializers.ModelSerializer):
+    contractor = LoadedUserField()
 
     class Meta:
         model = Schedule
         fields = ['id', 'contractor', 'day_of_week', 'start_time', 'end_time', 'location', 'is_available']
+        list_serializer_class = UserLoaderListSerializer
+
+
+class NotificationSerializer(UserLoaderMixin, serializers.ModelSerializer):
+    actor = LoadedUserField()
+
+    class Meta:
+        model = Notification
+        fields = ['id', 'kind', 'actor', 'target_id', 'text', 'read', 'created_at']
+        list_serializer_class = UserLoaderListSerializer
+
+
+class NotificationMarkReadSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, help_text='Omit to mark everything read')
+
+
+class UnreadCountSerializer(serializers.Serializer):
+    unread = serializers.IntegerField()
+
+
+class TimeseriesQuerySerializer(serializers.Serializer):
+    metric = serializers.ChoiceField(choices=['ads_created', 'proposals_created', 'proposals_accepted', 'acceptance_rate', 'avg_price'])
+    category = serializers.CharField(required=False, allow_blank=True)
+    # `from`/`to` query parameters, renamed in to_internal_value() since `from` is a keyword
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def to_internal_value(self, data):
+        data = {key: value for key, value in data.items()}
+        for param, field in (('from', 'date_from'), ('to', 'date_to')):
+            if param in data:
+                data[field] = data.pop(param)
+        return super().to_internal_value(data)
+
+    def validate(self, attrs):
+        import datetime
+        from django.utils import timezone
+        attrs.setdefault('date_to', timezone.now().date())
+        attrs.setdefault('date_from', attrs['date_to'] - datetime.timedelta(days=29))
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError('from must not be after to.')
+        if (attrs['date_to'] - attrs['date_from']).days > 3660:
+            raise serializers.ValidationError('Range is limited to ten years.')
+        return attrs
+
+
+class TimeseriesPointSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    value = serializers.FloatField(allow_null=True)
+
+
+class TimeseriesSerializer(serializers.Serializer):
+    metric = serializers.CharField()
+    category = serializers.CharField(allow_null=True)
+    points = TimeseriesPointSerializer(many=True)
+
+
+class ScheduleSlotSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Schedule
+        fields = ['id', 'day_of_week', 'start_time', 'end_time', 'location', 'is_available']
+
+    def validate(self, attrs):
+        if attrs['start_time'] >= attrs['end_time']:
+            raise serializers.ValidationError('start_time must be before end_time.')
+        return attrs
+
+
+class ScheduleWeekSerializer(serializers.Serializer):
+    """Replaces a contractor's whole weekly availability in one transaction."""
+
+    UPDATE_FIELDS = ['day_of_week', 'start_time', 'end_time', 'location', 'is_available']
+
+    slots = ScheduleSlotSerializer(many=True)
+
+    def validate_slots(self, slots):
+        by_day = {}
+        for slot in slots:
+            by_day.setdefault(slot['day_of_week'], []).append(slot)
+        for day, day_slots in by_day.items():
+            day_slots.sort(key=lambda slot: slot['start_time'])
+            for previous, current in zip(day_slots, day_slots[1:]):
+                if current['start_time'] < previous['end_time']:
+                    raise serializers.ValidationError(
+                        f"Overlapping slots on day {day}: "
+                        f"{previous['start_time']}-{previous['end_time']} and {current['start_time']}-{current['end_time']}."
+                    )
+        ids = [slot['id'] for slot in slots if 'id' in slot]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError('Each schedule id may appear only once.')
+        return slots
+
+    def create(self, validated_data):
+        from django.db import transaction
+        contractor = validated_data['contractor']
+        with transaction.atomic():
+            existing = {row.id: row for row in Schedule.objects.select_for_update().filter(contractor=contractor)}
+            by_key = {(row.day_of_week, row.start_time): row for row in existing.values()}
+            unknown = [slot['id'] for slot in validated_data['slots'] if 'id' in slot and slot['id'] not in existing]
+            if unknown:
+                raise serializers.ValidationError({'slots': f'Unknown schedule ids for this contractor: {unknown}.'})
+
+            to_create, to_update, kept = [], [], set()
+            for slot in validated_data['slots']:
+                row = existing.get(slot['id']) if 'id' in slot else by_key.get((slot['day_of_week'], slot['start_time']))
+                if row is None or row.id in kept:
+                    to_create.append(Schedule(contractor=contractor, **{f: slot.get(f, Schedule._meta.get_field(f).get_default()) for f in self.UPDATE_FIELDS}))
+                    continue
+                kept.add(row.id)
+                changed = False
+                for field in self.UPDATE_FIELDS:
+                    if field in slot and getattr(row, field) != slot[field]:
+                        setattr(row, field, slot[field])
+                        changed = True
+                if changed:
+                    to_update.append(row)
+            to_delete = [row_id for row_id in existing if row_id not in kept]
+            # bulk writes skip Schedule.save(), so resolve the cities here
+            cities = City.resolve_many(row.location for row in to_create + to_update)
+            for row in to_create + to_update:
+                row.city = cities[row.location]
+
+            if to_delete:
+                Schedule.objects.filter(id__in=to_delete).delete()
+            if to_update:
+                Schedule.objects.bulk_update(to_update, self.UPDATE_FIELDS + ['city'])
+            if to_create:
+                Schedule.objects.bulk_create(to_create)
+        self.stats = {'created': len(to_create), 'updated': len(to_update), 'deleted': len(to_delete)}
+        return Schedule.objects.filter(contractor=contractor).order_by('day_of_week', 'start_time')
+
+
+def ad_history(user, context):
+    """A user's ads, newest first: live ads followed by archived ones."""
+    live = merged(AdSerializer.prefetch_children(user.ads.all().order_by('-created_at')))
+    archived = merged(ArchivedAdSerializer.prefetch_children(user.archived_ads.all().order_by('-created_at')))
+    return (
+        AdSerializer(live, many=True, context=context).data
+        + ArchivedAdSerializer(archived, many=True, context=context).data
+    )
 
 
 class ContractorProfileSerializer(serializers.ModelSerializer):
@@ -91,9 +359,7 @@ class ContractorProfileSerializer(serializers.ModelSerializer):
         return data
 
     def get_ads(self, obj) -> list:
-        from .serializers import AdSerializer
-        qs = obj.ads.all().order_by('-created_at')
-        return AdSerializer(qs, many=True).data
+        return ad_history(obj, self.context)
 
 
 class ContractorListSerializer(serializers.ModelSerializer):
@@ -106,6 +372,53 @@ class ContractorListSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'avg_rating', 'ratings_count']
 
 
+class AdAutocompleteSerializer(serializers.Serializer):
+    titles = serializers.ListField(child=serializers.CharField(), read_only=True)
+    categories = serializers.ListField(child=serializers.CharField(), read_only=True)
+
+
+class PriceSuggestionSerializer(serializers.Serializer):
+    category = serializers.CharField()
+    location = serializers.CharField(allow_blank=True)
+    scope = serializers.ChoiceField(choices=['location', 'category'], help_text='Which sketch answered')
+    samples = serializers.IntegerField()
+    p25 = serializers.FloatField()
+    p50 = serializers.FloatField()
+    p75 = serializers.FloatField()
+
+
+class BatchSubRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'])
+    path = serializers.RegexField(r'^/', help_text='Absolute API path, may include a query string')
+    body = serializers.JSONField(required=False)
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict) and isinstance(data.get('method'), str):
+            data = {**data, 'method': data['method'].upper()}
+        return super().to_internal_value(data)
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    requests = BatchSubRequestSerializer(many=True, allow_empty=False)
+    parallel = serializers.BooleanField(default=False, help_text='Run consecutive GETs concurrently')
+
+    def validate_requests(self, value):
+        from .batch import max_batch_size
+        limit = max_batch_size()
+        if len(value) > limit:
+            raise serializers.ValidationError(f'At most {limit} requests per batch.')
+        return value
+
+
+class BatchResponseItemSerializer(serializers.Serializer):
+    status = serializers.IntegerField()
+    body = serializers.JSONField(allow_null=True)
+
+
+class BatchResponseSerializer(serializers.Serializer):
+    responses = BatchResponseItemSerializer(many=True)
+
+
 class ProposalActionSerializer(serializers.Serializer):
     message = serializers.CharField(read_only=True, help_text='Action result message')
 
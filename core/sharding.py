@@ -0,0 +1,410 @@
+"""Optional per-city sharding of the marketplace tables.
+
+With ``DB_SHARDS`` set, every ad lives on the shard chosen from its normalized
+city, and its proposals, comments, ratings, snapshot, signature and archive rows
+follow it there. Ratings without an ad are placed by contractor. Everything
+else (users, tickets, jobs, notifications, stats) stays on ``default``; users
+are copied to every shard so foreign keys hold inside a shard.
+
+Ads, proposals, comments and ratings take their ids from ``ShardMap`` on
+``default``, which also records where each row went, so a lookup by id needs
+no city. Views declare where their object id comes from with
+``ShardedViewMixin``; code outside a request picks a shard with ``on_shard``
+or walks all of them with ``each_shard``. Queries on sharded models that know
+neither go to ``default``.
+
+Rows written before sharding was turned on stay on ``default``: their ids are
+not in ``ShardMap``, so lookups by id find them there, and lists and
+``each_shard`` read ``default`` along with the shards. ``reserve_existing_ids``
+moves the id allocator past them.
+"""
+import contextlib
+import contextvars
+import functools
+import hashlib
+import heapq
+import itertools
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import Count, Max, Sum
+
+from .models import Ad, ArchivedAd, ArchivedComment, ArchivedProposal, Category, Comment, Proposal, Rating, ShardMap
+from .search import city_of, normalize_text
+
+
+SHARDED_MODELS = {
+    'core.ad', 'core.proposal', 'core.comment', 'core.rating',
+    'core.adsnapshot', 'core.adsignature', 'core.adsignatureband',
+    'core.archivedad', 'core.archivedproposal', 'core.archivedcomment',
+}
+# rows that can be looked up by id and so take a global id from ShardMap
+GLOBAL_ID_MODELS = {'core.ad', 'core.proposal', 'core.comment', 'core.rating'}
+# ads and archived ads are placed by their own id; other rows by their ad's
+AD_MODELS = {'core.ad', 'core.archivedad'}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_current = contextvars.ContextVar('db_shard', default=None)
+
+
+def shard_aliases():
+    return getattr(settings, 'DB_SHARDS', [])
+
+
+def enabled():
+    return bool(shard_aliases())
+
+
+def fan_out_aliases():
+    """Every database holding sharded rows: ``default`` (rows from before sharding) and the shards."""
+    return ['default', *shard_aliases()]
+
+
+def current():
+    """The shard that unhinted queries on sharded models go to, or None."""
+    return _current.get()
+
+
+def fans_out():
+    """True when a list has to be read from every shard."""
+    return enabled() and current() is None
+
+
+@contextlib.contextmanager
+def on_shard(alias):
+    """Route queries on sharded models to ``alias``; a no-op for other aliases, None and with sharding off."""
+    if not enabled() or alias not in fan_out_aliases():
+        yield
+        return
+    token = _current.set(alias)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def each_shard():
+    """Yield ``default`` and every shard alias with queries routed there; a single None when sharding is off."""
+    if not enabled():
+        yield None
+        return
+    for alias in fan_out_aliases():
+        with on_shard(alias):
+            yield alias
+
+
+def shard_for_key(key):
+    aliases = shard_aliases()
+    digest = hashlib.blake2b(str(key).encode(), digest_size=8).digest()
+    return aliases[int.from_bytes(digest, 'big') % len(aliases)]
+
+
+def shard_for_city(location):
+    city = city_of(location)
+    cities = {normalize_text(name): alias for name, alias in getattr(settings, 'DB_SHARD_CITIES', {}).items()}
+    if city in cities:
+        return cities[city]
+    if f'shard_{city}' in shard_aliases():
+        return f'shard_{city}'
+    return shard_for_key(city)
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _cache_key(object_id):
+    return f'shard:of:{object_id}'
+
+
+def shards_of(object_ids):
+    """``{id: alias}`` for the ids found in the shard map; rows never move, so hits are cached for good."""
+    ids = {_as_int(object_id) for object_id in object_ids} - {None}
+    if not ids:
+        return {}
+    cached = cache.get_many([_cache_key(object_id) for object_id in ids])
+    found = {object_id: cached[_cache_key(object_id)] for object_id in ids if _cache_key(object_id) in cached}
+    missing = ids - set(found)
+    if missing:
+        rows = dict(ShardMap.objects.using('default').filter(pk__in=missing).values_list('pk', 'shard'))
+        cache.set_many({_cache_key(object_id): alias for object_id, alias in rows.items()}, None)
+        found.update(rows)
+    return found
+
+
+def shard_of(object_id):
+    return shards_of([object_id]).get(_as_int(object_id))
+
+
+def by_shard(object_ids):
+    """Yield ``(alias, ids)`` per shard with queries routed there; ``(None, ids)`` when sharding is off.
+
+    Ids missing from the shard map are rows from before sharding, on ``default``.
+    """
+    object_ids = list(object_ids)
+    if not enabled():
+        yield None, object_ids
+        return
+    found = shards_of(object_ids)
+    groups = {}
+    for object_id in object_ids:
+        if _as_int(object_id) is not None:
+            groups.setdefault(found.get(_as_int(object_id), 'default'), []).append(object_id)
+    for alias, ids in groups.items():
+        with on_shard(alias):
+            yield alias, ids
+
+
+def placement(instance):
+    """The shard a new sharded row belongs on."""
+    label = instance._meta.label_lower
+    if label in AD_MODELS:
+        if instance.pk is not None:
+            alias = shard_of(instance.pk)
+            if alias is not None:
+                return alias
+        return shard_for_city(instance.location)
+    ad_id = getattr(instance, 'ad_id', None)
+    if ad_id is not None:
+        return shard_of(ad_id) or current()
+    if label == 'core.rating':
+        return shard_for_key(f'contractor:{instance.contractor_id}')
+    return current()
+
+
+def allocate_id(instance, using):
+    """Give a new row a globally unique id and record its shard (pre_save)."""
+    label = instance._meta.label_lower
+    # rows added to ``default`` next to the ones from before sharding take one too
+    if label not in GLOBAL_ID_MODELS or instance.pk is not None or not enabled() or using not in fan_out_aliases():
+        return
+    entry = ShardMap.objects.using('default').create(model=label, shard=using)
+    cache.set(_cache_key(entry.pk), using, None)
+    instance.pk = entry.pk
+
+
+def reserve_existing_ids():
+    """Move the ``ShardMap`` id allocator past the ids of rows created on ``default`` before sharding.
+
+    Returns the highest such id. Run once when turning sharding on (``sync_shard_users`` does).
+    """
+    models = (Ad, ArchivedAd, Proposal, ArchivedProposal, Comment, ArchivedComment, Rating)
+    top = max(model._base_manager.using('default').aggregate(top=Max('pk'))['top'] or 0 for model in models)
+    if top and not ShardMap.objects.using('default').filter(pk__gte=top).exists():
+        # the row for ``top`` says "on default", which is where that row is
+        ShardMap.objects.using('default').create(pk=top, model='reserved', shard='default')
+        connection = connections['default']
+        with connection.cursor() as cursor:
+            # Postgres sequences do not move past explicit ids; SQLite's AUTOINCREMENT does
+            for sql in connection.ops.sequence_reset_sql(no_style(), [ShardMap]):
+                cursor.execute(sql)
+    return top
+
+
+def _copy(instance, alias):
+    model = type(instance)
+    values = {field.attname: getattr(instance, field.attname) for field in model._meta.concrete_fields}
+    changes = {name: value for name, value in values.items() if name != model._meta.pk.attname}
+    rows = model._base_manager.using(alias)
+    if not rows.filter(pk=instance.pk).update(**changes):
+        rows.bulk_create([model(**values)])
+
+
+def replicate(instance):
+    """Copy a ``default`` row to every shard, where sharded rows reference it by foreign key."""
+    for alias in shard_aliases():
+        _copy(instance, alias)
+
+
+def delete_replicated(instance):
+    """Remove a replicated row from every shard; rows protecting it there raise ProtectedError."""
+    for alias in shard_aliases():
+        type(instance)._base_manager.using(alias).filter(pk=instance.pk).delete()
+
+
+def replicate_categories():
+    """Copy the category tree and its closure to every shard (ads filter on both there)."""
+    categories = list(Category.objects.using('default').order_by('pk'))
+    for alias in shard_aliases():
+        # foreign keys are checked at commit, so a parent may arrive after its children
+        with transaction.atomic(using=alias):
+            for category in categories:
+                _copy(category, alias)
+        Category.rebuild_closure(using=alias)
+
+
+def delete_user(user_id):
+    User = get_user_model()
+    for alias in shard_aliases():
+        # cascades to the user's ads, proposals, comments and ratings on that shard
+        User._base_manager.using(alias).filter(pk=user_id).delete()
+
+
+def rating_totals(contractor_ids=None):
+    """``{contractor_id: (avg_score, count)}`` summed over every shard."""
+    sums = {}
+    for _ in each_shard():
+        qs = Rating.objects.all()
+        if contractor_ids is not None:
+            qs = qs.filter(contractor_id__in=contractor_ids)
+        rows = qs.values('contractor_id').annotate(total=Sum('score'), n=Count('id')).values_list('contractor_id', 'total', 'n')
+        for contractor_id, total, n in rows:
+            previous = sums.get(contractor_id, (0, 0))
+            sums[contractor_id] = (previous[0] + total, previous[1] + n)
+    return {contractor_id: (total / n, n) for contractor_id, (total, n) in sums.items()}
+
+
+def _compare(fields, a, b):
+    for path, descending in fields:
+        x, y = _value(a, path), _value(b, path)
+        if x == y:
+            continue
+        # NULLs sort first ascending, as on SQLite
+        if x is None or (y is not None and x < y):
+            result = -1
+        else:
+            result = 1
+        return -result if descending else result
+    return 0
+
+
+def _value(obj, path):
+    if len(path) == 2 and path[1] in ('id', 'pk'):
+        # "contractor__id" without loading the contractor
+        return getattr(obj, f'{path[0]}_id', None)
+    for name in path:
+        obj = getattr(obj, name, None)
+        if obj is None:
+            return None
+    return obj
+
+
+class MergedQuerySet:
+    """Read-only view of one queryset across every shard, merged by its ordering.
+
+    Slicing reads the first ``stop`` rows from each shard and merges them, so a
+    page costs one query per shard (plus its prefetches); ``count()`` sums the
+    per-shard counts. Enough for Django's and DRF's paginators.
+    """
+
+    ordered = True
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self.model = queryset.model
+        ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering) or ['pk']
+        fields = [
+            (name.lstrip('-+').split('__'), name.startswith('-'))
+            for name in ordering if isinstance(name, str) and name != '?'
+        ]
+        self._key = functools.cmp_to_key(functools.partial(_compare, fields))
+        self._count = None
+
+    def _parts(self):
+        return [self.queryset.using(alias) for alias in fan_out_aliases()]
+
+    def count(self):
+        if self._count is None:
+            self._count = sum(part.count() for part in self._parts())
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start, stop = item.start or 0, item.stop
+        rows = [list(part[:stop]) if stop is not None else list(part) for part in self._parts()]
+        return list(itertools.islice(heapq.merge(*rows, key=self._key), start, stop))
+
+    def __iter__(self):
+        return iter(self[0:None])
+
+
+def merged(queryset):
+    """``queryset`` itself, or a MergedQuerySet over it when the rows are spread over the shards."""
+    if queryset.model._meta.label_lower in SHARDED_MODELS and fans_out():
+        return MergedQuerySet(queryset)
+    return queryset
+
+
+class ShardRouter:
+    """Sends sharded models to the shard of the row at hand (see module docstring).
+
+    Must come before ``ReplicaRouter``; everything it returns None for falls
+    through to it.
+    """
+
+    def _route(self, model, hints):
+        if model._meta.label_lower not in SHARDED_MODELS or not enabled():
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._meta.label_lower in SHARDED_MODELS:
+            # a new row's _state.db is borrowed from whatever related object was assigned first
+            if not instance._state.adding:
+                return instance._state.db
+            if isinstance(instance, model):
+                return placement(instance)
+        return current()
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # shards carry the full schema; only the sharded tables and users are filled
+        if db in shard_aliases():
+            return True
+        return None
+
+
+class ShardedViewMixin:
+    """Runs an API view on the shard of the object it is about.
+
+    ``shard_kwargs`` are URL kwargs and ``shard_fields`` query parameters (safe
+    methods) or body fields (writes) holding the id of an ad, proposal, comment
+    or rating; ``shard_city_param`` is a query parameter naming a city. When
+    none of them is present, paginated lists read every shard and merge.
+    """
+
+    shard_kwargs = ('pk',)
+    shard_fields = ()
+    shard_city_param = None
+
+    def get_shard(self, request):
+        for name in self.shard_kwargs:
+            if self.kwargs.get(name) is not None:
+                return shard_of(self.kwargs[name])
+        source = request.query_params if request.method in SAFE_METHODS else request.data
+        for name in self.shard_fields:
+            value = source.get(name) if hasattr(source, 'get') else None
+            if value not in (None, ''):
+                return shard_of(value)
+        if self.shard_city_param and request.query_params.get(self.shard_city_param):
+            return shard_for_city(request.query_params[self.shard_city_param])
+        return None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if enabled():
+            self._shard_token = _current.set(self.get_shard(request))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_shard_token', None)
+        if token is not None:
+            _current.reset(token)
+            self._shard_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def paginate_queryset(self, queryset):
+        return super().paginate_queryset(merged(queryset))
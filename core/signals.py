@@ -0,0 +1,151 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Ad, AdSnapshot, Category, City, Comment, SupportAgentLoad, Ticket, TicketMessage
+from .jobs import enqueue
+from .pubsub import ticket_messages
+from .search import autocomplete_index
+from . import dedup, sharding, snapshots
+
+
+@receiver(pre_save)
+def allocate_sharded_id(sender, instance, using, **kwargs):
+    sharding.allocate_id(instance, using)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def replicate_user_to_shards(sender, instance, using, **kwargs):
+    if using == 'default' and sharding.enabled():
+        sharding.replicate(instance)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def delete_user_from_shards(sender, instance, using, **kwargs):
+    if using == 'default' and sharding.enabled():
+        sharding.delete_user(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def sync_category_tree(sender, instance, created, using, **kwargs):
+    # a new category is a leaf, so only its own rows are added; a move rewrites the subtree's
+    moved = not created and getattr(instance, '_loaded_parent_id', None) != instance.parent_id
+    renamed = not created and getattr(instance, '_loaded_name', instance.name) != instance.name
+    instance._loaded_name, instance._loaded_parent_id = instance.name, instance.parent_id
+    if created:
+        instance.add_closure(using=using)
+    elif moved:
+        Category.rebuild_closure(using=using)
+    if using != 'default':
+        return
+    if sharding.enabled():
+        sharding.replicate(instance)
+        for alias in sharding.shard_aliases():
+            if created:
+                instance.add_closure(using=alias)
+            elif moved:
+                Category.rebuild_closure(using=alias)
+    if renamed:
+        # the name is part of each ad's search text and snapshot
+        enqueue('core.refresh_category_ads', category_id=instance.pk)
+
+
+@receiver(post_save, sender=City)
+def replicate_city_to_shards(sender, instance, using, **kwargs):
+    if using == 'default' and sharding.enabled():
+        sharding.replicate(instance)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=City)
+def delete_lookup_from_shards(sender, instance, using, **kwargs):
+    if using == 'default' and sharding.enabled():
+        sharding.delete_replicated(instance)
+
+
+@receiver(post_save, sender=Ad)
+def index_ad_for_autocomplete(sender, instance, created, **kwargs):
+    old = getattr(instance, '_loaded_title', None)
+    if not created and old == instance.title:
+        return
+    if old is not None:
+        autocomplete_index.count_titles([old], -1)
+    if created or old is not None:
+        autocomplete_index.count_titles([instance.title], 1)
+    instance._loaded_title = instance.title
+
+
+@receiver(post_delete, sender=Ad)
+def unindex_ad_for_autocomplete(sender, instance, **kwargs):
+    autocomplete_index.count_titles([getattr(instance, '_loaded_title', instance.title)], -1)
+
+
+@receiver(post_save, sender=Ad)
+def invalidate_ad_snapshot(sender, instance, created, using, **kwargs):
+    if created:
+        # in the ad's transaction, so a write racing the first build() bumps a row that build() already read
+        AdSnapshot.objects.using(using).bulk_create([AdSnapshot(ad_id=instance.pk)], ignore_conflicts=True)
+    with sharding.on_shard(using):
+        snapshots.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=Ad)
+def index_ad_signature(sender, instance, created, using, update_fields=None, **kwargs):
+    if created or update_fields is None or {'title', 'description'} & set(update_fields):
+        with sharding.on_shard(using):
+            dedup.index_ad(instance)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_parent_ad_snapshot(sender, instance, using, **kwargs):
+    with sharding.on_shard(using):
+        snapshots.invalidate([instance.ad_id])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def refresh_user_ad_snapshots(sender, instance, created, update_fields=None, **kwargs):
+    # users are embedded in every snapshot of an ad they created or commented on
+    if created or (update_fields is not None and not set(update_fields) & set(snapshots.USER_FIELDS)):
+        return
+    enqueue('core.refresh_user_ad_snapshots', user_id=instance.pk)
+
+
+@receiver(post_save, sender=Ticket)
+def track_ticket_assignment(sender, instance, **kwargs):
+    old = getattr(instance, '_loaded_assignment', None)
+    new = instance.assignment_key()
+    if old != new:
+        SupportAgentLoad.adjust(old, -1)
+        SupportAgentLoad.adjust(new, 1)
+    instance._loaded_assignment = new
+
+
+@receiver(post_delete, sender=Ticket)
+def untrack_ticket_assignment(sender, instance, **kwargs):
+    SupportAgentLoad.adjust(getattr(instance, '_loaded_assignment', None), -1)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def sync_support_agent_load(sender, instance, created, update_fields=None, **kwargs):
+    # most saves (last_login, profile edits) leave the role alone and need no query
+    if update_fields is not None and 'role' not in update_fields:
+        return
+    old = getattr(instance, '_loaded_role', None)
+    instance._loaded_role = instance.role
+    if not created and old is not None and old == instance.role:
+        return
+    if instance.role == 'support':
+        _, added = SupportAgentLoad.objects.get_or_create(agent=instance)
+        if added:
+            SupportAgentLoad.recount([instance.pk])
+    elif not created:
+        SupportAgentLoad.objects.filter(agent=instance).delete()
+
+
+@receiver(post_save, sender=TicketMessage)
+def publish_ticket_message(sender, instance, created, **kwargs):
+    if created:
+        ticket_id, message_id = instance.ticket_id, instance.pk
+        transaction.on_commit(lambda: ticket_messages.publish(ticket_id, message_id))
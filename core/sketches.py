@@ -0,0 +1,84 @@
+import math
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative-error guarantees (DDSketch).
+
+    Values fall into logarithmic buckets, so any quantile is within
+    ``relative_accuracy`` of the true value. Merging adds bucket counts, and
+    the state is a small ``{bucket: count}`` dict regardless of how many values
+    were added.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=512, buckets=None, zero_count=0):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets = dict(buckets or {})
+        self.zero_count = zero_count
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.buckets.values())
+
+    def _key(self, value):
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, key):
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+    def add(self, value, weight=1):
+        value = float(value)
+        if value <= 0:
+            self.zero_count += weight
+            return
+        key = self._key(value)
+        self.buckets[key] = self.buckets.get(key, 0) + weight
+        self._collapse()
+
+    def merge(self, other):
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self._collapse()
+
+    def _collapse(self):
+        # fold the lowest buckets together; accuracy is kept for the upper quantiles
+        if len(self.buckets) <= self.max_buckets:
+            return
+        keys = sorted(self.buckets)
+        overflow = keys[:len(keys) - self.max_buckets + 1]
+        target = overflow[-1]
+        self.buckets[target] = sum(self.buckets.pop(key) for key in overflow[:-1]) + self.buckets[target]
+
+    def quantile(self, q):
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.buckets))
+
+    def to_dict(self):
+        return {
+            'a': self.relative_accuracy,
+            'z': self.zero_count,
+            'b': {str(key): count for key, count in self.buckets.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data:
+            return cls()
+        return cls(
+            relative_accuracy=data.get('a', 0.01),
+            buckets={int(key): count for key, count in data.get('b', {}).items()},
+            zero_count=data.get('z', 0),
+        )
@@ -0,0 +1,105 @@
+"""Materialized ``AdSerializer`` output.
+
+Every change to an ad or its comments bumps the ad's snapshot
+generation in the writing transaction and queues ``core.build_ad_snapshots``.
+The job renders the ad and stores the JSON bytes tagged with the generation it
+read; a snapshot whose generation moved on in the meantime is simply not
+stored, so a reader never gets a body older than the last committed write.
+Ads without a fresh snapshot are serialized live.
+
+Which proposals an ad shows depends on the caller, so snapshots are rendered
+as seen anonymously (with none) and ``with_proposals`` splices the caller's
+into the stored bytes, one query per batch of ads.
+"""
+from django.db import models
+from rest_framework.renderers import JSONRenderer
+
+from .jobs import enqueue
+from .models import Ad, AdSnapshot, Comment
+from .serializers import AdSerializer, visible_proposals
+from users.serializers import UserSerializer
+
+
+# user fields embedded in snapshots (creator, comment authors)
+USER_FIELDS = [name for name, field in UserSerializer().fields.items() if not field.write_only]
+CHUNK_SIZE = 500
+# how the proposals of an anonymous render come out of the renderer
+EMPTY_PROPOSALS = b'"proposals":[]'
+
+_renderer = JSONRenderer()
+
+
+def render(data):
+    return _renderer.render(data)
+
+
+def invalidate(ad_ids):
+    """Mark the snapshots of ``ad_ids`` stale and queue their rebuild."""
+    ad_ids = sorted({ad_id for ad_id in ad_ids if ad_id is not None})
+    if not ad_ids:
+        return
+    # rows are created with their ad (see core.signals); older ads without one
+    # have nothing to go stale and get theirs from build()
+    AdSnapshot.objects.filter(ad_id__in=ad_ids).update(generation=models.F('generation') + 1)
+    enqueue('core.build_ad_snapshots', ad_ids=ad_ids)
+
+
+def ads_of_user(user_id):
+    """Ids of the ads whose snapshot embeds ``user_id``."""
+    ad_ids = set(Ad.objects.filter(creator_id=user_id).values_list('pk', flat=True))
+    ad_ids.update(Comment.objects.filter(author_id=user_id).values_list('ad_id', flat=True))
+    return ad_ids
+
+
+def invalidate_user(user_id):
+    ad_ids = sorted(ads_of_user(user_id))
+    for start in range(0, len(ad_ids), CHUNK_SIZE):
+        invalidate(ad_ids[start:start + CHUNK_SIZE])
+
+
+def build(ad_ids):
+    """Render and store snapshots for ``ad_ids``; returns how many were stored."""
+    existing = Ad.objects.filter(pk__in=ad_ids).values_list('pk', flat=True)
+    # the row must exist before rendering so a concurrent write can bump it
+    AdSnapshot.objects.bulk_create([AdSnapshot(ad_id=ad_id) for ad_id in existing], ignore_conflicts=True)
+    generations = dict(AdSnapshot.objects.filter(ad_id__in=ad_ids).values_list('ad_id', 'generation'))
+    ads = list(AdSerializer.prefetch_children(Ad.objects.filter(pk__in=generations)))
+    stored = 0
+    for ad, data in zip(ads, AdSerializer(ads, many=True).data):
+        generation = generations[ad.pk]
+        stored += AdSnapshot.objects.filter(ad_id=ad.pk, generation=generation).update(
+            body=render(data), built_generation=generation,
+        )
+    return stored
+
+
+def fresh_bodies(ad_ids):
+    """``{ad_id: bytes}`` for the ads in ``ad_ids`` whose snapshot is up to date."""
+    rows = AdSnapshot.objects.filter(ad_id__in=ad_ids, built_generation=models.F('generation')).values_list('ad_id', 'body')
+    return {ad_id: bytes(body) for ad_id, body in rows}
+
+
+def with_proposals(found, context):
+    """``found`` (``{ad_id: snapshot bytes}``) with the proposals the request's user may read spliced in."""
+    for ad_id, proposals in visible_proposals(context, list(found)).items():
+        # quotes inside string values are escaped, so this only matches the ad's own key
+        found[ad_id] = found[ad_id].replace(EMPTY_PROPOSALS, b'"proposals":' + render(proposals), 1)
+    return found
+
+
+def bodies(ad_ids, context):
+    """Rendered ads in ``ad_ids`` order, from snapshots where fresh and live otherwise."""
+    found = with_proposals(fresh_bodies(ad_ids), context)
+    missing = [ad_id for ad_id in ad_ids if ad_id not in found]
+    if missing:
+        ads = list(AdSerializer.prefetch_children(Ad.objects.filter(pk__in=missing)))
+        for ad, data in zip(ads, AdSerializer(ads, many=True, context=context).data):
+            found[ad.pk] = render(data)
+    return [found[ad_id] for ad_id in ad_ids if ad_id in found]
+
+
+def splice_page(envelope, items):
+    """Render a paginated envelope whose ``results`` are the pre-rendered ``items``."""
+    head = render(dict(envelope, results=[]))
+    # the renderer emits results last, as ``"results":[]}``
+    return head[:-2] + b','.join(items) + head[-2:]
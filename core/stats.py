@@ -0,0 +1,161 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import sharding
+from .models import Ad, CategoryClosure, DailyStat, Proposal, RollupWatermark
+from .search import normalize_text
+
+
+# Rows newer than this are left for the next run so in-flight transactions
+# that commit late are not skipped by the watermark.
+SETTLE_SECONDS = 5
+
+METRICS = ('ads_created', 'proposals_created', 'proposals_accepted', 'acceptance_rate', 'avg_price')
+
+
+def _apply(deltas):
+    """Add ``{(date, category): {column: delta}}`` onto the DailyStat rows."""
+    if not deltas:
+        return
+    # insert missing rows first; a concurrent rollup creating the same one is not an error,
+    # and the locked read below then sees whichever insert won
+    DailyStat.objects.bulk_create([DailyStat(date=date, category=category) for date, category in deltas], ignore_conflicts=True)
+    rows = DailyStat.objects.select_for_update().filter(
+        date__in={date for date, _ in deltas}, category__in={c for _, c in deltas},
+    )
+    to_update = []
+    for row in rows:
+        changes = deltas.get((row.date, row.category))
+        if changes is None:
+            continue
+        for column, delta in changes.items():
+            setattr(row, column, getattr(row, column) + delta)
+        to_update.append(row)
+    DailyStat.objects.bulk_update(to_update, ['ads_created', 'proposals_created', 'proposals_accepted', 'proposal_price_sum', 'proposal_price_count'])
+
+
+def _watermark(name):
+    mark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=name)
+    return mark
+
+
+def _by_id_batch(name, queryset, batch_size, cutoff, aggregate):
+    """Roll up the next ``batch_size`` rows after the id watermark; returns rows read."""
+    mark = _watermark(name)
+    window = list(
+        queryset.filter(id__gt=mark.last_id, created_at__lte=cutoff).order_by('id').values_list('id', flat=True)[:batch_size]
+    )
+    if not window:
+        return 0
+    deltas = {}
+    grouped = (
+        queryset.filter(id__gt=mark.last_id, id__lte=window[-1])
+        .annotate(day=TruncDate('created_at'))
+        .values('day', aggregate['category'])
+        .annotate(**aggregate['annotations'])
+    )
+    for row in grouped:
+        key = (row['day'], row[aggregate['category']] or '')
+        deltas[key] = {column: row[alias] or 0 for column, alias in aggregate['columns'].items()}
+    _apply(deltas)
+    mark.last_id = window[-1]
+    mark.save(update_fields=['last_id'])
+    return len(window)
+
+
+def _accepted_batch(name, batch_size, cutoff):
+    mark = _watermark(name)
+    since = mark.last_timestamp
+    qs = Proposal.objects.filter(accepted=True, accepted_at__isnull=False, accepted_at__lte=cutoff)
+    if since is not None:
+        qs = qs.filter(accepted_at__gt=since)
+    window = list(qs.order_by('accepted_at').values_list('accepted_at', flat=True)[:batch_size])
+    if not window:
+        return 0
+    # never split rows that share the last timestamp across two runs
+    qs = qs.filter(accepted_at__lte=window[-1])
+    deltas = {}
+    for row in qs.annotate(day=TruncDate('accepted_at')).values('day', 'ad__category__key').annotate(n=Count('id')):
+        deltas[(row['day'], row['ad__category__key'] or '')] = {'proposals_accepted': row['n']}
+    _apply(deltas)
+    mark.last_timestamp = window[-1]
+    mark.save(update_fields=['last_timestamp'])
+    return len(window)
+
+
+AD_AGGREGATE = {
+    'category': 'category__key',
+    'annotations': {'n': Count('id')},
+    'columns': {'ads_created': 'n'},
+}
+PROPOSAL_AGGREGATE = {
+    'category': 'ad__category__key',
+    'annotations': {'n': Count('id'), 'price_sum': Sum('price'), 'price_count': Count('price')},
+    'columns': {'proposals_created': 'n', 'proposal_price_sum': 'price_sum', 'proposal_price_count': 'price_count'},
+}
+
+
+def rollup(batch_size=5000, max_batches=None):
+    """Fold new Ad/Proposal rows into DailyStat; returns rows processed per source."""
+    cutoff = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+    totals = dict.fromkeys(('ads_created', 'proposals_created', 'proposals_accepted'), 0)
+    for alias in sharding.each_shard():
+        # ids only increase within one database, so every shard keeps its own watermarks;
+        # default keeps the ones it had before sharding
+        suffix = f':{alias}' if alias not in (None, 'default') else ''
+        steps = {
+            'ads_created': lambda: _by_id_batch('ads_created' + suffix, Ad.objects.all(), batch_size, cutoff, AD_AGGREGATE),
+            'proposals_created': lambda: _by_id_batch('proposals_created' + suffix, Proposal.objects.all(), batch_size, cutoff, PROPOSAL_AGGREGATE),
+            'proposals_accepted': lambda: _accepted_batch('proposals_accepted' + suffix, batch_size, cutoff),
+        }
+        for name, step in steps.items():
+            batches = 0
+            while max_batches is None or batches < max_batches:
+                # one transaction per batch keeps row locks short and the watermark consistent
+                with transaction.atomic():
+                    processed = step()
+                if not processed:
+                    break
+                totals[name] += processed
+                batches += 1
+    return totals
+
+
+def reset():
+    with transaction.atomic():
+        DailyStat.objects.all().delete()
+        RollupWatermark.objects.all().delete()
+
+
+def timeseries(metric, date_from, date_to, category=None):
+    """Daily points for ``metric`` between two dates (inclusive), read from the rollups.
+
+    ``category`` includes its subcategories.
+    """
+    qs = DailyStat.objects.filter(date__gte=date_from, date__lte=date_to)
+    if category is not None:
+        key = normalize_text(category)
+        keys = set(CategoryClosure.objects.filter(ancestor__key=key).values_list('descendant__key', flat=True))
+        qs = qs.filter(category__in=keys | {key})
+    rows = qs.values('date').annotate(
+        ads_created=Sum('ads_created'),
+        proposals_created=Sum('proposals_created'),
+        proposals_accepted=Sum('proposals_accepted'),
+        price_sum=Sum('proposal_price_sum'),
+        price_count=Sum('proposal_price_count'),
+    ).order_by('date')
+    points = []
+    for row in rows:
+        if metric == 'acceptance_rate':
+            value = row['proposals_accepted'] / row['proposals_created'] if row['proposals_created'] else None
+        elif metric == 'avg_price':
+            value = (row['price_sum'] / row['price_count']).quantize(Decimal('0.01')) if row['price_count'] else None
+        else:
+            value = row[metric]
+        points.append({'date': row['date'], 'value': value})
+    return points
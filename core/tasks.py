@@ -0,0 +1,49 @@
+from . import expiry, sharding, snapshots
+from .jobs import task
+from .notifications import notify
+from .pricing import record_prices
+
+
+@task('core.notify')
+def notify_task(recipient_ids, kind, actor_id=None, target_id=None, text=''):
+    notify(recipient_ids, kind, actor=actor_id, target_id=target_id, text=text)
+
+
+@task('core.record_accepted_price')
+def record_accepted_price_task(category, location, price):
+    record_prices(category, location, [price])
+
+
+@task('core.expire_ads')
+def expire_ads_task(chunk_size=500):
+    for _ in sharding.each_shard():
+        expiry.sweep(chunk_size=chunk_size)
+
+
+@task('core.build_ad_snapshots')
+def build_ad_snapshots_task(ad_ids):
+    for _, ids in sharding.by_shard(ad_ids):
+        snapshots.build(ids)
+
+
+@task('core.refresh_user_ad_snapshots')
+def refresh_user_ad_snapshots_task(user_id):
+    for _ in sharding.each_shard():
+        snapshots.invalidate_user(user_id)
+
+
+@task('core.refresh_category_ads')
+def refresh_category_ads_task(category_id, batch_size=500):
+    """Re-render ads of a renamed category: search text and snapshots."""
+    from .models import Ad
+    for _ in sharding.each_shard():
+        last_id = 0
+        while True:
+            ads = list(Ad.objects.select_related('category').filter(category_id=category_id, pk__gt=last_id).order_by('pk')[:batch_size])
+            if not ads:
+                break
+            for ad in ads:
+                ad.search_text = ad.build_search_text()
+            Ad.objects.bulk_update(ads, ['search_text'])
+            snapshots.invalidate([ad.pk for ad in ads])
+            last_id = ads[-1].pk
@@ -0,0 +1,118 @@
+import time
+from contextlib import ExitStack, contextmanager
+
+import pytest
+from django.core.cache import cache
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from core.db_router import replica_aliases
+from core.models import Ad, Proposal
+from users.models import User
+
+
+# the replica reads rows written through default, so nothing may stay uncommitted
+pytestmark = pytest.mark.django_db(transaction=True, databases=['default', 'replica'])
+
+
+@pytest.fixture(scope='module', autouse=True)
+def replica(django_db_setup):
+    """A ``replica`` alias on the test database next to ``default``, as DB_REPLICA_HOSTS would add."""
+    connections.settings['replica'] = {**connections['default'].settings_dict, 'TEST': {'MIRROR': 'default'}}
+    yield
+    connections['replica'].close()
+    del connections['replica']
+    del connections.settings['replica']
+
+
+@pytest.fixture(autouse=True)
+def clear_pins():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def proposal():
+    customer = User.objects.create_user(username='customer', email='customer@example.com', password='x', role='customer')
+    contractor = User.objects.create_user(username='contractor', email='contractor@example.com', password='x', role='contractor')
+    ad = Ad.objects.create(creator=customer, title='Paint the kitchen', description='Two walls', location='Tehran')
+    return Proposal.objects.create(ad=ad, contractor=contractor, price=100, message='Tomorrow')
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@contextmanager
+def queries_by_alias():
+    with ExitStack() as stack:
+        captured = {alias: stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in ('default', 'replica')}
+        yield captured
+
+
+def test_replica_is_configured():
+    assert replica_aliases() == ['replica']
+
+
+@pytest.mark.parametrize('path', ['/api/proposals/', '/api/proposals/{pk}/'])
+def test_safe_reads_go_to_the_replica(proposal, path):
+    client = client_for(proposal.contractor)
+    with queries_by_alias() as queries:
+        response = client.get(path.format(pk=proposal.pk))
+    assert response.status_code == 200
+    assert len(queries['default']) == 0
+    assert len(queries['replica']) > 0
+
+
+def test_writes_go_to_the_primary(proposal):
+    client = client_for(proposal.contractor)
+    with queries_by_alias() as queries:
+        response = client.patch(f'/api/proposals/{proposal.pk}/', {'message': 'Today'}, format='json')
+    assert response.status_code == 200
+    assert any(query['sql'].startswith('UPDATE') for query in queries['default'])
+    # reads of an unsafe request stay on the primary too
+    assert len(queries['replica']) == 0
+
+
+def test_reads_stick_to_the_primary_after_a_write(proposal):
+    client = client_for(proposal.contractor)
+    client.patch(f'/api/proposals/{proposal.pk}/', {'message': 'Today'}, format='json')
+    with queries_by_alias() as queries:
+        response = client.get(f'/api/proposals/{proposal.pk}/')
+    assert response.data['message'] == 'Today'
+    assert len(queries['default']) > 0
+    assert len(queries['replica']) == 0
+
+
+def test_pin_is_per_user(proposal):
+    client_for(proposal.contractor).patch(f'/api/proposals/{proposal.pk}/', {'message': 'Today'}, format='json')
+    client = client_for(proposal.ad.creator)
+    with queries_by_alias() as queries:
+        response = client.get(f'/api/proposals/{proposal.pk}/')
+    assert response.status_code == 200
+    assert len(queries['default']) == 0
+
+
+def test_failed_write_does_not_pin(proposal):
+    client = client_for(proposal.contractor)
+    response = client.patch(f'/api/proposals/{proposal.pk}/', {'price': 'a lot'}, format='json')
+    assert response.status_code == 400
+    with queries_by_alias() as queries:
+        client.get(f'/api/proposals/{proposal.pk}/')
+    assert len(queries['default']) == 0
+
+
+def test_pin_expires(proposal, settings):
+    settings.DB_PIN_SECONDS = 1
+    client = client_for(proposal.contractor)
+    client.patch(f'/api/proposals/{proposal.pk}/', {'message': 'Today'}, format='json')
+    time.sleep(1.1)
+    with queries_by_alias() as queries:
+        response = client.get(f'/api/proposals/{proposal.pk}/')
+    assert response.data['message'] == 'Today'
+    assert len(queries['default']) == 0
+    assert len(queries['replica']) > 0
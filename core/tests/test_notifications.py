@@ -0,0 +1,43 @@
+import pytest
+from rest_framework.test import APIClient
+
+from core.notifications import notify, unread_count
+from users.models import User
+
+
+@pytest.fixture
+def users(db):
+    return [
+        User.objects.create_user(username=name, email=f'{name}@example.com', password='x', role='customer')
+        for name in ('alice', 'bob')
+    ]
+
+
+def test_counter_follows_notify_and_mark_read(users):
+    alice, bob = users
+    notify([alice.pk, bob.pk], 'comment_created', actor=bob)
+    notify([alice.pk], 'rating_created')
+    assert unread_count(alice.pk) == 2
+    # the actor is not notified
+    assert unread_count(bob.pk) == 0
+
+    client = APIClient()
+    client.force_authenticate(alice)
+    first = alice.notifications.order_by('pk').first()
+    response = client.post('/api/notifications/mark-read/', {'ids': [first.pk]}, format='json')
+    assert response.data == {'unread': 1}
+    # marking the same one again changes nothing
+    response = client.post('/api/notifications/mark-read/', {'ids': [first.pk]}, format='json')
+    assert response.data == {'unread': 1}
+    response = client.post('/api/notifications/mark-read/', {}, format='json')
+    assert response.data == {'unread': 0}
+
+
+def test_unread_count_is_one_column_read(users, django_assert_num_queries):
+    alice, _ = users
+    notify([alice.pk], 'rating_created')
+    client = APIClient()
+    client.force_authenticate(alice)
+    with django_assert_num_queries(1):
+        response = client.get('/api/notifications/unread-count/')
+    assert response.data == {'unread': 1}
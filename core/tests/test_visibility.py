@@ -0,0 +1,178 @@
+import pytest
+from rest_framework.test import APIClient
+
+from core import snapshots
+from core.models import Ad, Proposal, Ticket
+from users.models import User
+
+
+@pytest.fixture
+def users(db):
+    return {
+        name: User.objects.create_user(username=name, email=f'{name}@example.com', password='x', role=role)
+        for name, role in [
+            ('customer', 'customer'),
+            ('other_customer', 'customer'),
+            ('contractor', 'contractor'),
+            ('other_contractor', 'contractor'),
+            ('support', 'support'),
+        ]
+    }
+
+
+@pytest.fixture
+def proposal(users):
+    ad = Ad.objects.create(creator=users['customer'], title='Paint the kitchen', description='Two walls', location='Tehran')
+    return Proposal.objects.create(ad=ad, contractor=users['contractor'], price=100, message='Tomorrow')
+
+
+@pytest.fixture
+def ticket(users):
+    return Ticket.objects.create(title='Payment failed', description='Card declined', creator=users['customer'])
+
+
+def client_for(user):
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+@pytest.mark.parametrize('name', ['customer', 'contractor', 'support'])
+def test_proposal_detail_for_readers(users, proposal, django_assert_num_queries, name):
+    client = client_for(users[name])
+    # the scoped lookup, then the contractor for the nested user
+    with django_assert_num_queries(2):
+        response = client.get(f'/api/proposals/{proposal.pk}/')
+    assert response.status_code == 200
+    assert response.data['id'] == proposal.pk
+
+
+@pytest.mark.parametrize('name', ['other_customer', 'other_contractor', None])
+def test_proposal_detail_hidden(users, proposal, django_assert_num_queries, name):
+    client = client_for(users.get(name))
+    # anonymous callers are answered without a query
+    with django_assert_num_queries(1 if name else 0):
+        response = client.get(f'/api/proposals/{proposal.pk}/')
+    assert response.status_code == 404
+
+
+def test_proposal_patch_by_owner(users, proposal, django_assert_num_queries):
+    client = client_for(users['contractor'])
+    with django_assert_num_queries(3):
+        response = client.patch(f'/api/proposals/{proposal.pk}/', {'message': 'Today'}, format='json')
+    assert response.status_code == 200
+    proposal.refresh_from_db()
+    assert proposal.message == 'Today'
+
+
+def test_proposal_patch_by_customer_of_the_ad(users, proposal, django_assert_num_queries):
+    # the ad's customer may read the proposal but not edit it
+    client = client_for(users['customer'])
+    with django_assert_num_queries(1):
+        response = client.patch(f'/api/proposals/{proposal.pk}/', {'message': 'Cheaper'}, format='json')
+    assert response.status_code == 403
+    proposal.refresh_from_db()
+    assert proposal.message == 'Tomorrow'
+
+
+def test_proposal_patch_by_other_contractor(users, proposal, django_assert_num_queries):
+    client = client_for(users['other_contractor'])
+    with django_assert_num_queries(1):
+        response = client.patch(f'/api/proposals/{proposal.pk}/', {'message': 'Mine'}, format='json')
+    assert response.status_code == 404
+
+
+def test_proposal_patch_anonymous(proposal, django_assert_num_queries):
+    with django_assert_num_queries(0):
+        response = client_for(None).patch(f'/api/proposals/{proposal.pk}/', {'message': 'Mine'}, format='json')
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize('name', ['customer', 'support'])
+def test_ticket_detail_for_readers(users, ticket, django_assert_num_queries, name):
+    client = client_for(users[name])
+    # the scoped lookup, then creator and assignee in one batch
+    with django_assert_num_queries(2):
+        response = client.get(f'/api/tickets/{ticket.pk}/')
+    assert response.status_code == 200
+    assert response.data['id'] == ticket.pk
+
+
+@pytest.mark.parametrize('name', ['other_customer', 'contractor', None])
+def test_ticket_detail_hidden(users, ticket, django_assert_num_queries, name):
+    client = client_for(users.get(name))
+    with django_assert_num_queries(1 if name else 0):
+        response = client.get(f'/api/tickets/{ticket.pk}/')
+    assert response.status_code == 404
+
+
+def test_ticket_patch_by_owner(users, ticket, django_assert_num_queries):
+    client = client_for(users['customer'])
+    with django_assert_num_queries(3):
+        response = client.patch(f'/api/tickets/{ticket.pk}/', {'title': 'Payment still failing'}, format='json')
+    assert response.status_code == 200
+    ticket.refresh_from_db()
+    assert ticket.title == 'Payment still failing'
+
+
+def test_ticket_patch_by_other_customer(users, ticket, django_assert_num_queries):
+    client = client_for(users['other_customer'])
+    with django_assert_num_queries(1):
+        response = client.patch(f'/api/tickets/{ticket.pk}/', {'title': 'Mine'}, format='json')
+    assert response.status_code == 404
+
+
+def test_ticket_patch_anonymous(ticket, django_assert_num_queries):
+    with django_assert_num_queries(0):
+        response = client_for(None).patch(f'/api/tickets/{ticket.pk}/', {'title': 'Mine'}, format='json')
+    assert response.status_code == 401
+
+
+@pytest.fixture
+def bids(users, proposal):
+    """Two proposals on the customer's ad, from different contractors."""
+    other = Proposal.objects.create(ad=proposal.ad, contractor=users['other_contractor'], price=90, message='Now')
+    return {'contractor': proposal.pk, 'other_contractor': other.pk}
+
+
+AD_READERS = [
+    ('customer', ['contractor', 'other_contractor']),
+    ('other_customer', []),
+    ('contractor', ['contractor']),
+    ('support', ['contractor', 'other_contractor']),
+    (None, []),
+]
+
+
+@pytest.mark.parametrize('snapshot', [False, True])
+@pytest.mark.parametrize('name, expected', AD_READERS)
+def test_ad_detail_nests_visible_proposals(users, proposal, bids, snapshot, name, expected):
+    if snapshot:
+        snapshots.build([proposal.ad_id])
+    response = client_for(users.get(name)).get(f'/api/ads/{proposal.ad_id}/')
+    assert response.status_code == 200
+    assert sorted(p['id'] for p in response.json()['proposals']) == sorted(bids[bidder] for bidder in expected)
+
+
+@pytest.mark.parametrize('name, expected', AD_READERS)
+def test_ad_list_nests_visible_proposals(users, proposal, bids, name, expected):
+    snapshots.build([proposal.ad_id])
+    response = client_for(users.get(name)).get('/api/ads/')
+    [ad] = response.json()['results']
+    assert sorted(p['id'] for p in ad['proposals']) == sorted(bids[bidder] for bidder in expected)
+
+
+def test_ad_list_loads_proposals_once_per_page(users, django_assert_num_queries):
+    ads = [
+        Ad.objects.create(creator=users['customer'], title=f'Ad {i}', description='d', location='Tehran')
+        for i in range(3)
+    ]
+    for ad in ads:
+        Proposal.objects.create(ad=ad, contractor=users['contractor'], price=100)
+    snapshots.build([ad.pk for ad in ads])
+    client = client_for(users['customer'])
+    # count, ids, snapshots, then one query for the proposals and one for their contractors
+    with django_assert_num_queries(5):
+        response = client.get('/api/ads/')
+    assert [len(ad['proposals']) for ad in response.json()['results']] == [1, 1, 1]
@@ -0,0 +1,179 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .permissions import role_of
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """``'100/min'`` -> ``(100, 60)``; ``None`` means unlimited."""
+    if rate is None:
+        return None
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+def rate_role(user):
+    """The role whose rates apply: ``anon``, ``staff`` or the user's ``role_of``."""
+    role = role_of(user)
+    if role is None and not (user and user.is_authenticated):
+        return 'anon'
+    if user.is_staff:
+        return 'staff'
+    return role or 'user'
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """Sliding-window counter kept in the shared cache.
+
+    Each client has one counter per fixed window; the rate is estimated from
+    the current counter plus the previous one weighted by how much of it still
+    overlaps the sliding window. A check is one atomic ``incr`` and one
+    ``get``, so it stays cheap and correct across processes when the cache is
+    shared (Redis, memcached). Rates come from ``DEFAULT_THROTTLE_RATES``.
+    """
+
+    cache_prefix = 'throttle'
+
+    def get_scope(self, request, view):
+        """The budget this request counts against, or None to skip the check."""
+        raise NotImplementedError
+
+    def get_ident_key(self, request, view):
+        user = request.user
+        return f'user:{user.pk}' if user and user.is_authenticated else f'ip:{self.get_ident(request)}'
+
+    def get_rate(self, scope, request):
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        role_rate = f'{scope}.{rate_role(request.user)}'
+        return rates[role_rate] if role_rate in rates else rates.get(scope)
+
+    def window_key(self, request, view):
+        """The counter of the current window for this request, or None when it is not limited.
+
+        Also reads the previous window's count, for ``fits`` and ``wait``.
+        """
+        scope = self.get_scope(request, view)
+        if scope is None:
+            return None
+        parsed = parse_rate(self.get_rate(scope, request))
+        if parsed is None:
+            return None
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return None
+        self.limit, self.period = parsed
+        now = time.time()
+        window = int(now // self.period)
+        self.elapsed = now - window * self.period
+        self.previous = cache.get(f'{self.cache_prefix}:{scope}:{ident}:{window - 1}', 0)
+        return f'{self.cache_prefix}:{scope}:{ident}:{window}'
+
+    def fits(self, count):
+        return self.previous * (1 - self.elapsed / self.period) + count <= self.limit
+
+    def allow_request(self, request, view):
+        key = self.window_key(request, view)
+        if key is None:
+            return True
+        self.count = self._incr(key)
+        if self.fits(self.count):
+            return True
+        # rejected requests do not use up budget
+        cache.decr(key)
+        self.count -= 1
+        return False
+
+    def _incr(self, key):
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # kept for two windows so the next one can still weigh it
+            if cache.add(key, 1, self.period * 2):
+                return 1
+            return cache.incr(key)
+
+    def wait(self):
+        """Seconds until one more request fits in the sliding window."""
+        remaining = self.period - self.elapsed
+        if self.count + 1 > self.limit:
+            # wait for the next window, where the current count becomes the weighted one
+            overlap = 1 - (self.limit - 1) / self.count if self.count else 0
+            return remaining + self.period * max(overlap, 0)
+        needed = 1 - (self.limit - self.count - 1) / self.previous
+        return max(needed * self.period - self.elapsed, 0)
+
+
+class RoleRateThrottle(SlidingWindowThrottle):
+    """Overall budget per client, sized by role (``anon``, ``customer``, ``contractor``, ``support``, ``staff``)."""
+
+    def get_scope(self, request, view):
+        return rate_role(request.user)
+
+    def get_rate(self, scope, request):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+
+
+class EndpointRateThrottle(SlidingWindowThrottle):
+    """Extra budget for expensive endpoints, named by the view's ``throttle_scope``.
+
+    Free-text ``?search=`` is the expensive path of every list view, so such
+    requests count against the ``search`` scope. ``<scope>.<role>`` rates
+    override the plain ``<scope>`` rate.
+    """
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope is None and request.query_params.get('search'):
+            scope = 'search'
+        return scope
+
+
+class LoginIPThrottle(SlidingWindowThrottle):
+    """Login attempts per client IP."""
+
+    def get_scope(self, request, view):
+        return 'login.ip'
+
+    def get_ident_key(self, request, view):
+        return f'ip:{self.get_ident(request)}'
+
+
+class LoginIdentifierThrottle(SlidingWindowThrottle):
+    """Failed login attempts per username/email/phone, whichever IPs they come from.
+
+    Only failures use up budget: the view calls ``record_failure`` after a
+    wrong password, so an account's owner is not locked out by their own
+    logins.
+    """
+
+    def allow_request(self, request, view):
+        key = self.window_key(request, view)
+        if key is None:
+            return True
+        self.count = cache.get(key, 0)
+        return self.fits(self.count + 1)
+
+    @classmethod
+    def record_failure(cls, request, view):
+        throttle = cls()
+        key = throttle.window_key(request, view)
+        if key is not None:
+            throttle._incr(key)
+
+    def get_scope(self, request, view):
+        return 'login.identifier'
+
+    def get_ident_key(self, request, view):
+        data = request.data
+        if not hasattr(data, 'get'):
+            return None
+        identifier = data.get('username') or data.get('email') or data.get('phone_number')
+        if not identifier:
+            return None
+        return hashlib.sha256(str(identifier).strip().lower().encode()).hexdigest()
@@ -0,0 +1,169 @@
+"""Sampled, anonymized capture of API traffic for ``manage.py replay``.
+
+``TrafficCaptureMiddleware`` writes one JSON line per sampled request to a
+size-rotated log: method, URL route and path, query parameters, the caller's
+role, response status and server time. JSON bodies of writes are kept so
+they can be replayed, with free-text, credential and user id fields masked
+(see ``TRAFFIC_CAPTURE_MASK_FIELDS``). Ids in the path are replaced by keyed
+hashes, kept per route parameter in ``params``, so replay can map each one to
+a row of its own database. No user ids, IPs, headers or cookies are recorded.
+"""
+import functools
+import hashlib
+import json
+import logging
+import logging.handlers
+import random
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# bodies larger than this are not captured
+MAX_BODY_BYTES = 64 * 1024
+
+
+def mask_fields():
+    return set(getattr(settings, 'TRAFFIC_CAPTURE_MASK_FIELDS', ()))
+
+
+# a word as written by mask_text()
+MASKED_WORD = re.compile(r'^w[0-9a-f]{8}$')
+
+
+def mask_text(value):
+    """Replace each word by a keyed hash, keeping word count and repeats; replay maps them onto seeded words."""
+    key = settings.SECRET_KEY.encode()[:64]
+    return ' '.join(
+        'w' + hashlib.blake2b(word.encode(), key=key, digest_size=4).hexdigest() for word in str(value).split()
+    )
+
+
+def anonymize(data, fields):
+    if isinstance(data, dict):
+        return {
+            name: mask_text(value) if name in fields and isinstance(value, (str, int)) else anonymize(value, fields)
+            for name, value in data.items()
+        }
+    if isinstance(data, list):
+        return [anonymize(item, fields) for item in data]
+    return data
+
+
+@functools.lru_cache(maxsize=None)
+def _writer():
+    writer = logging.getLogger('core.traffic.capture')
+    writer.propagate = False
+    writer.setLevel(logging.INFO)
+    handler = logging.handlers.RotatingFileHandler(
+        settings.TRAFFIC_CAPTURE_PATH,
+        maxBytes=getattr(settings, 'TRAFFIC_CAPTURE_MAX_BYTES', 50 * 1024 * 1024),
+        backupCount=getattr(settings, 'TRAFFIC_CAPTURE_BACKUPS', 5),
+        encoding='utf-8',
+    )
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    writer.addHandler(handler)
+    return writer
+
+
+def _role(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return 'anon'
+    return getattr(user, 'role', None) or 'user'
+
+
+def _body(request):
+    if request.method in SAFE_METHODS or request.content_type != 'application/json':
+        return None
+    try:
+        if int(request.META.get('CONTENT_LENGTH') or 0) > MAX_BODY_BYTES:
+            return None
+        return anonymize(json.loads(request.body or b'null'), mask_fields())
+    except ValueError:
+        return None
+
+
+def _masked_path(path, match, params):
+    """``path`` with each route parameter's segment replaced by its hash in ``params``."""
+    hashes = {str(match.kwargs[name]): value for name, value in params.items()}
+    return '/'.join(hashes.get(segment, segment) for segment in path.split('/'))
+
+
+class TrafficCaptureMiddleware:
+    """Logs a ``TRAFFIC_CAPTURE_SAMPLE_RATE`` share of requests under ``TRAFFIC_CAPTURE_PREFIX``."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TRAFFIC_CAPTURE_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'TRAFFIC_CAPTURE_SAMPLE_RATE', 0.1)
+        self.prefix = getattr(settings, 'TRAFFIC_CAPTURE_PREFIX', '/api/')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _sampled(self, request):
+        return request.path.startswith(self.prefix) and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled(request):
+            return self.get_response(request)
+        # read before the view consumes the stream
+        body = _body(request)
+        started = time.time()
+        response = self.get_response(request)
+        self._record(request, response, started, body)
+        return response
+
+    async def __acall__(self, request):
+        if not self._sampled(request):
+            return await self.get_response(request)
+        body = _body(request)
+        started = time.time()
+        response = await self.get_response(request)
+        self._record(request, response, started, body)
+        return response
+
+    def _record(self, request, response, started, body):
+        match = getattr(request, 'resolver_match', None)
+        fields = mask_fields()
+        params = {name: mask_text(value) for name, value in match.kwargs.items()} if match is not None else {}
+        record = {
+            'ts': round(started, 3),
+            'method': request.method,
+            'route': match.route if match is not None else None,
+            'path': _masked_path(request.path, match, params),
+            'params': params,
+            'query': {
+                name: [mask_text(value) if name in fields else value for value in values]
+                for name, values in request.GET.lists()
+            },
+            'role': _role(request),
+            'status': response.status_code,
+            'duration_ms': round((time.time() - started) * 1000, 2),
+        }
+        if body is not None:
+            record['body'] = body
+        _writer().info(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+
+
+def read_capture(paths):
+    """Captured records from ``paths`` (rotated files included), oldest first."""
+    records = []
+    for path in paths:
+        with open(path, encoding='utf-8') as capture:
+            for line in capture:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    records.sort(key=lambda record: record['ts'])
+    return records
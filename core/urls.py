@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     AdListCreateView,
     AdDetailView,
+    AdAutocompleteView,
+    AdPriceSuggestionView,
     ProposalListCreateView,
     ProposalAcceptView,
     ProposalCompleteView,
@@ -12,17 +15,27 @@ from .views import (
     RatingListCreateView,
     TicketListCreateView,
     TicketDetailView,
+    TicketQueueView,
     TicketMessageListCreateView,
+    TicketMessageStreamView,
     ScheduleListCreateView,
     ScheduleDetailView,
+    ScheduleBulkUpsertView,
     ContractorProfileView,
     ContractorListView,
     CustomerProfileView,
     UserRoleUpdateView,
+    BatchView,
+    NotificationListView,
+    NotificationUnreadCountView,
+    NotificationMarkReadView,
+    StatsTimeseriesView,
 )
 
 urlpatterns = [
     path('ads/', AdListCreateView.as_view(), name='ad-list-create'),
+    path('ads/autocomplete/', AdAutocompleteView.as_view(), name='ad-autocomplete'),
+    path('ads/price-suggestion/', AdPriceSuggestionView.as_view(), name='ad-price-suggestion'),
     path('ads/<int:pk>/', AdDetailView.as_view(), name='ad-detail'),
     path('proposals/', ProposalListCreateView.as_view(), name='proposal-list-create'),
     path('proposals/<int:pk>/', ProposalDetailView.as_view(), name='proposal-detail'),
@@ -32,9 +45,12 @@ urlpatterns = [
     path('contractors/<int:contractor_id>/ratings/', RatingListCreateView.as_view(), name='contractor-ratings-list-create'),
     path('ratings/', RatingListCreateView.as_view(), name='ratings-list-create'),
     path('tickets/', TicketListCreateView.as_view(), name='tickets-list-create'),
+    path('tickets/queue/', TicketQueueView.as_view(), name='ticket-queue'),
     path('tickets/<int:pk>/', TicketDetailView.as_view(), name='ticket-detail'),
     path('tickets/<int:ticket_id>/messages/', TicketMessageListCreateView.as_view(), name='ticket-messages'),
+    path('tickets/<int:ticket_id>/messages/stream/', TicketMessageStreamView.as_view(), name='ticket-messages-stream'),
     path('contractors/<int:contractor_id>/schedule/', ScheduleListCreateView.as_view(), name='contractor-schedule-list-create'),
+    path('contractors/<int:contractor_id>/schedule/bulk/', ScheduleBulkUpsertView.as_view(), name='contractor-schedule-bulk'),
     path('schedules/<int:pk>/', ScheduleDetailView.as_view(), name='schedule-detail'),
     path('proposals/<int:pk>/complete/', ProposalCompleteView.as_view(), name='proposal-complete'),
     path('proposals/<int:pk>/confirm/', ProposalConfirmCompletionView.as_view(), name='proposal-confirm'),
@@ -42,4 +58,25 @@ urlpatterns = [
     path('customers/<int:pk>/profile/', CustomerProfileView.as_view(), name='customer-profile'),
     path('contractors/', ContractorListView.as_view(), name='contractor-list'),
     path('users/<int:pk>/role/', UserRoleUpdateView.as_view(), name='user-role-update'),
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('notifications/', NotificationListView.as_view(), name='notification-list'),
+    path('notifications/unread-count/', NotificationUnreadCountView.as_view(), name='notification-unread-count'),
+    path('stats/timeseries/', StatsTimeseriesView.as_view(), name='stats-timeseries'),
+    path('notifications/mark-read/', NotificationMarkReadView.as_view(), name='notification-mark-read'),
 ]
+
+# the async variants read the default database directly, so they are left out when sharding
+if settings.ASYNC_READ_VIEWS and not settings.DB_SHARDS:
+    from . import async_views
+
+    _async_variants = {
+        'ad-list-create': async_views.ad_list_view,
+        'ad-detail': async_views.ad_detail_view,
+        'contractor-list': async_views.contractor_list_view,
+        'contractor-profile': async_views.contractor_profile_view,
+    }
+    urlpatterns = [
+        path(str(pattern.pattern), _async_variants[pattern.name], name=pattern.name)
+        if pattern.name in _async_variants else pattern
+        for pattern in urlpatterns
+    ]
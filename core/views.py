@@ -1,21 +1,36 @@
 from rest_framework import generics, permissions, status, serializers
 from rest_framework import filters
-from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiExample
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiExample, OpenApiParameter
 from django_filters.rest_framework import DjangoFilterBackend
+from django.http import HttpResponse
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .permissions import IsOwnerOrReadOnly, IsSupportOrOwner
+from .permissions import IsOwnerOrReadOnly, IsSupportOrOwner, VisibleToUserMixin, require_role, role_of, visible_to
 from .models import Ad, Proposal
-from .serializers import AdSerializer, ProposalSerializer, ContractorListSerializer, ContractorProfileSerializer, ProposalActionSerializer, UserRoleUpdateSerializer
+from .serializers import AdSerializer, AdAutocompleteSerializer, PriceSuggestionSerializer, ProposalSerializer, ContractorListSerializer, ContractorProfileSerializer, ProposalActionSerializer, UserRoleUpdateSerializer
 from .serializers import CommentSerializer
 from .models import Comment
 from .serializers import RatingSerializer
 from .models import Rating
 from .models import Ticket
-from .serializers import TicketSerializer, TicketMessageSerializer
+from .serializers import TicketSerializer, TicketMessageSerializer, TicketQueueRequestSerializer
 from .models import Schedule
-from .serializers import ScheduleSerializer
+from .serializers import ScheduleSerializer, ScheduleWeekSerializer
 from .models import TicketMessage
+from .models import Notification
+from .search import NormalizedSearchFilter, autocomplete_index
+from .filters import AdFilter
+from .serializers import BatchRequestSerializer, BatchResponseSerializer
+from .serializers import NotificationSerializer, NotificationMarkReadSerializer, UnreadCountSerializer
+from .serializers import TimeseriesQuerySerializer, TimeseriesSerializer
+from .batch import run_batch
+from .notifications import notify_later
+from .jobs import enqueue
+from . import dedup, sharding, snapshots
+from .idempotency import IdempotentCreateMixin, idempotent
+from .sharding import ShardedViewMixin
 
 
 @extend_schema_view(
@@ -40,24 +55,43 @@ from .models import TicketMessage
         ],
     )
 )
-class AdListCreateView(generics.ListCreateAPIView):
+class AdListCreateView(ShardedViewMixin, IdempotentCreateMixin, generics.ListCreateAPIView):
     queryset = Ad.objects.all().order_by('-created_at')
     serializer_class = AdSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
-    search_fields = ['title', 'description']
-    filterset_fields = ['status', 'creator__id', 'category', 'location']
+    filter_backends = [NormalizedSearchFilter, filters.OrderingFilter, DjangoFilterBackend]
+    search_fields = ['search_text']
+    filterset_class = AdFilter
+    # new ads are placed by the router; ?location= narrows a list to one shard
+    shard_kwargs = ()
+    shard_city_param = 'location'
 
     def perform_create(self, serializer):
-        # Only customers can create ads
-        if not hasattr(self.request.user, 'role') or self.request.user.role != 'customer':
-            from rest_framework.exceptions import PermissionDenied
-            raise PermissionDenied('Only customers can create ads')
-        serializer.save(creator=self.request.user)
+        require_role(self.request.user, 'customer', 'Only customers can create ads')
+        ad = serializer.save(creator=self.request.user)
+        # reposts of an open ad are linked to it instead of competing for proposals
+        with sharding.on_shard(ad._state.db):
+            dedup.flag_duplicate(ad)
+
+    def list(self, request, *args, **kwargs):
+        # a page merged from several shards is serialized live
+        if not isinstance(request.accepted_renderer, JSONRenderer) or sharding.fans_out():
+            return super().list(request, *args, **kwargs)
+        # page over ids only; the ads themselves come pre-rendered from their snapshots
+        qs = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        page = self.paginate_queryset(qs.values_list('id', flat=True))
+        ids = list(page if page is not None else qs.values_list('id', flat=True))
+        items = snapshots.bodies(ids, self.get_serializer_context())
+        if page is None:
+            return HttpResponse(b'[' + b','.join(items) + b']', content_type='application/json')
+        envelope = self.get_paginated_response([]).data
+        return HttpResponse(snapshots.splice_page(envelope, items), content_type='application/json')
 
     def get_queryset(self):
-        qs = super().get_queryset()
+        qs = AdSerializer.prefetch_children(super().get_queryset())
         status_param = self.request.query_params.get('status')
         title = self.request.query_params.get('title')
+        if self.request.query_params.get('exclude_duplicates') in ('1', 'true'):
+            qs = qs.filter(duplicate_of__isnull=True)
         if status_param:
             qs = qs.filter(status=status_param)
         if title:
@@ -65,11 +99,68 @@ class AdListCreateView(generics.ListCreateAPIView):
         return qs
 
 
-class AdDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Ad.objects.all()
+@extend_schema(
+    summary='Autocomplete ad titles and categories',
+    parameters=[OpenApiParameter('q', str, description='Prefix typed so far'), OpenApiParameter('limit', int)],
+)
+class AdAutocompleteView(APIView):
+    serializer_class = AdAutocompleteSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            limit = 10
+        return Response(autocomplete_index.suggest(request.query_params.get('q', ''), limit=limit))
+
+
+@extend_schema(
+    summary='Suggest a budget from accepted proposal prices',
+    parameters=[OpenApiParameter('category', str, required=True), OpenApiParameter('location', str)],
+)
+class AdPriceSuggestionView(APIView):
+    serializer_class = PriceSuggestionSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        from .pricing import suggest
+        category = request.query_params.get('category', '')
+        location = request.query_params.get('location', '')
+        if not category:
+            return Response({'category': ['This parameter is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        suggestion = suggest(category, location)
+        if suggestion is None:
+            return Response({'detail': 'Not enough accepted proposals for this category yet.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'category': category, 'location': location, **suggestion})
+
+
+class AdDetailView(ShardedViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    queryset = AdSerializer.prefetch_children(Ad.objects.all())
     serializer_class = AdSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
 
+    def retrieve(self, request, *args, **kwargs):
+        from django.http import Http404
+        if isinstance(request.accepted_renderer, JSONRenderer):
+            # the bare row is enough to check permissions before serving the stored bytes
+            ad = self.filter_queryset(self.get_queryset()).prefetch_related(None).filter(pk=kwargs['pk']).first()
+            if ad is not None:
+                self.check_object_permissions(request, ad)
+                body = snapshots.with_proposals(snapshots.fresh_bodies([ad.pk]), self.get_serializer_context()).get(ad.pk)
+                if body is not None:
+                    return HttpResponse(body, content_type='application/json')
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # finished ads may have been moved to the archive by archive_ads
+            from .models import ArchivedAd
+            from .serializers import ArchivedAdSerializer
+            archived = ArchivedAdSerializer.prefetch_children(ArchivedAd.objects.filter(pk=kwargs['pk'])).first()
+            if archived is None:
+                raise
+            return Response(ArchivedAdSerializer(archived, context=self.get_serializer_context()).data)
+
 
 @extend_schema_view(
     post=extend_schema(
@@ -87,74 +178,80 @@ class AdDetailView(generics.RetrieveUpdateDestroyAPIView):
         ],
     )
 )
-class ProposalListCreateView(generics.ListCreateAPIView):
+class ProposalListCreateView(ShardedViewMixin, VisibleToUserMixin, IdempotentCreateMixin, generics.ListCreateAPIView):
     queryset = Proposal.objects.all().order_by('-created_at')
     serializer_class = ProposalSerializer
     filter_backends = [filters.OrderingFilter, DjangoFilterBackend]
     filterset_fields = ['ad', 'accepted', 'completed', 'contractor']
+    # without ?ad= a contractor's or customer's proposals are merged from every shard
+    shard_kwargs = ()
+    shard_fields = ('ad',)
 
     def perform_create(self, serializer):
-        # Only contractors can create proposals
-        if not hasattr(self.request.user, 'role') or self.request.user.role != 'contractor':
-            from rest_framework.exceptions import PermissionDenied
-            raise PermissionDenied('Only contractors can create proposals')
-        serializer.save(contractor=self.request.user)
-    
-    def get_queryset(self):
-        user = self.request.user
-        if not user.is_authenticated:
-            return Proposal.objects.none()
-        if getattr(user, 'role', None) == 'contractor':
-            return Proposal.objects.filter(contractor=user).order_by('-created_at')
-        if getattr(user, 'role', None) == 'customer':
-            # show proposals for ads created by this customer
-            return Proposal.objects.filter(ad__creator=user).order_by('-created_at')
-        # support or admin or other roles see all
-        return Proposal.objects.all().order_by('-created_at')
-
-
-class ProposalDetailView(generics.RetrieveUpdateDestroyAPIView):
+        require_role(self.request.user, 'contractor', 'Only contractors can create proposals')
+        proposal = serializer.save(contractor=self.request.user)
+        notify_later([proposal.ad.creator_id], 'proposal_created', actor=self.request.user, target_id=proposal.ad_id,
+                     text=f'New proposal on "{proposal.ad.title}"')
+
+
+class ProposalDetailView(ShardedViewMixin, VisibleToUserMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Proposal.objects.all()
     serializer_class = ProposalSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
 
 
 @extend_schema(summary='Accept a proposal')
-class ProposalAcceptView(APIView):
+class ProposalAcceptView(ShardedViewMixin, APIView):
     serializer_class = ProposalActionSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request, pk):
         try:
-            proposal = Proposal.objects.get(pk=pk)
+            proposal = Proposal.objects.select_related('ad__category').get(pk=pk)
         except Proposal.DoesNotExist:
             return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
 
         ad = proposal.ad
-        if ad.creator != request.user:
+        if ad.creator_id != request.user.id:
             return Response({'detail': 'Not permitted.'}, status=status.HTTP_403_FORBIDDEN)
+        if ad.status != 'open':
+            return Response({'detail': 'Ad is no longer open.'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Accept the proposal
-        proposal.accepted = True
-        proposal.save()
-        ad.status = 'assigned'
-        ad.save()
+        from django.db import router, transaction
+        from django.utils import timezone
+        with transaction.atomic(using=router.db_for_write(Ad)):
+            # conditional update so a repeated or concurrent accept goes through (and records its price) once
+            if not Ad.objects.filter(pk=ad.pk, status='open').update(status='assigned'):
+                return Response({'detail': 'Ad is no longer open.'}, status=status.HTTP_400_BAD_REQUEST)
+            # the UPDATE bypasses the post_save signal that refreshes snapshots
+            snapshots.invalidate([ad.pk])
+            newly_accepted = not proposal.accepted
+            proposal.accepted = True
+            proposal.accepted_at = proposal.accepted_at or timezone.now()
+            proposal.save()
+        if newly_accepted and proposal.price is not None and ad.category_id is not None:
+            enqueue('core.record_accepted_price', category=ad.category.name, location=ad.location, price=str(proposal.price))
+        notify_later([proposal.contractor_id], 'proposal_accepted', actor=request.user, target_id=ad.id,
+                     text=f'Your proposal for "{ad.title}" was accepted')
         return Response({'detail': 'Proposal accepted.'})
 
 
 @extend_schema(summary='Mark proposal as completed')
-class ProposalCompleteView(APIView):
+class ProposalCompleteView(ShardedViewMixin, APIView):
     serializer_class = ProposalActionSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request, pk):
         try:
-            proposal = Proposal.objects.get(pk=pk)
+            proposal = Proposal.objects.select_related('ad').get(pk=pk)
         except Proposal.DoesNotExist:
             return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
 
         # Only contractor who made the proposal can mark it as completed
-        if proposal.contractor != request.user:
+        if proposal.contractor_id != request.user.id:
             return Response({'detail': 'Not permitted.'}, status=status.HTTP_403_FORBIDDEN)
 
         if not proposal.accepted:
@@ -162,23 +259,27 @@ class ProposalCompleteView(APIView):
 
         proposal.completed = True
         proposal.save()
+        ad = proposal.ad
+        notify_later([ad.creator_id], 'proposal_completed', actor=request.user, target_id=ad.id,
+                     text=f'"{ad.title}" was marked as completed')
         return Response({'detail': 'Proposal marked as completed.'})
 
 
 @extend_schema(summary='Confirm completion of a proposal')
-class ProposalConfirmCompletionView(APIView):
+class ProposalConfirmCompletionView(ShardedViewMixin, APIView):
     serializer_class = ProposalActionSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request, pk):
         try:
-            proposal = Proposal.objects.get(pk=pk)
+            proposal = Proposal.objects.select_related('ad').get(pk=pk)
         except Proposal.DoesNotExist:
             return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
 
         ad = proposal.ad
         # Only ad owner can confirm completion
-        if ad.creator != request.user:
+        if ad.creator_id != request.user.id:
             return Response({'detail': 'Not permitted.'}, status=status.HTTP_403_FORBIDDEN)
 
         if not proposal.completed:
@@ -189,21 +290,26 @@ class ProposalConfirmCompletionView(APIView):
         ad.status = 'done'
         ad.save()
         proposal.save()
+        notify_later([proposal.contractor_id], 'proposal_confirmed', actor=request.user, target_id=ad.id,
+                     text=f'Completion of "{ad.title}" was confirmed')
         return Response({'detail': 'Proposal confirmed. Ad marked as done.'})
 
 
-class AdCommentsListCreateView(generics.ListCreateAPIView):
+class AdCommentsListCreateView(ShardedViewMixin, IdempotentCreateMixin, generics.ListCreateAPIView):
     serializer_class = CommentSerializer
+    shard_kwargs = ('ad_id',)
 
     def get_queryset(self):
         ad_id = self.kwargs.get('ad_id')
         return Comment.objects.filter(ad_id=ad_id).order_by('-created_at')
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        comment = serializer.save(author=self.request.user)
+        notify_later([comment.ad.creator_id], 'comment_created', actor=self.request.user, target_id=comment.ad_id,
+                     text=f'New comment on "{comment.ad.title}"')
 
 
-class CommentDetailView(generics.RetrieveUpdateDestroyAPIView):
+class CommentDetailView(ShardedViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
@@ -226,8 +332,10 @@ class CommentDetailView(generics.RetrieveUpdateDestroyAPIView):
         ],
     )
 )
-class RatingListCreateView(generics.ListCreateAPIView):
+class RatingListCreateView(ShardedViewMixin, IdempotentCreateMixin, generics.ListCreateAPIView):
     serializer_class = RatingSerializer
+    shard_kwargs = ()
+    shard_fields = ('ad',)
 
     def get_queryset(self):
         contractor_id = self.kwargs.get('contractor_id')
@@ -246,10 +354,7 @@ class RatingListCreateView(generics.ListCreateAPIView):
         return qs
 
     def perform_create(self, serializer):
-        # Only customers should be able to rate
-        if not hasattr(self.request.user, 'role') or self.request.user.role != 'customer':
-            from rest_framework.exceptions import PermissionDenied
-            raise PermissionDenied('Only customers can rate contractors')
+        require_role(self.request.user, 'customer', 'Only customers can rate contractors')
         # Ensure contractor is a user with contractor role
         contractor_id = self.request.data.get('contractor')
         ad_id = self.request.data.get('ad')
@@ -272,7 +377,9 @@ class RatingListCreateView(generics.ListCreateAPIView):
             except Ad.DoesNotExist:
                 from rest_framework.exceptions import NotFound
                 raise NotFound('Ad not found')
-        serializer.save(rater=self.request.user, contractor=contractor, ad=ad_obj)
+        rating = serializer.save(rater=self.request.user, contractor=contractor, ad=ad_obj)
+        notify_later([contractor.id], 'rating_created', actor=self.request.user, target_id=rating.ad_id,
+                     text=f'You received a {rating.score}-star rating')
 
 
 @extend_schema_view(
@@ -290,15 +397,71 @@ class RatingListCreateView(generics.ListCreateAPIView):
         ],
     )
 )
-class TicketListCreateView(generics.ListCreateAPIView):
+class TicketListCreateView(IdempotentCreateMixin, generics.ListCreateAPIView):
     serializer_class = TicketSerializer
-    queryset = Ticket.objects.all().order_by('-created_at')
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['status', 'assignee']
+
+    def get_queryset(self):
+        user = self.request.user
+        qs = visible_to(Ticket.objects.all().order_by('-created_at'), user)
+        if role_of(user) == 'support' and self.request.query_params.get('unassigned'):
+            qs = qs.filter(assignee__isnull=True)
+        return qs
 
     def perform_create(self, serializer):
         serializer.save(creator=self.request.user)
 
 
-class TicketDetailView(generics.RetrieveUpdateDestroyAPIView):
+@extend_schema(
+    summary='Take the next unassigned ticket from the queue (support only)',
+    request=TicketQueueRequestSerializer,
+    responses={200: TicketSerializer, 204: None},
+)
+class TicketQueueView(APIView):
+    serializer_class = TicketSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    # candidates tried per request when the database cannot SKIP LOCKED
+    CAS_ATTEMPTS = 5
+
+    @idempotent
+    def post(self, request):
+        from django.db import connection, transaction
+        from django.utils import timezone
+        from .models import SupportAgentLoad
+        if role_of(request.user) != 'support':
+            return Response({'detail': 'Only support users can take tickets from the queue.'}, status=status.HTTP_403_FORBIDDEN)
+        options = TicketQueueRequestSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+        if options.validated_data['claim']:
+            agent_id = request.user.id
+        else:
+            agent_id = SupportAgentLoad.least_loaded_agent_id() or request.user.id
+
+        unassigned = Ticket.objects.filter(status='open', assignee__isnull=True).order_by('created_at')
+        ticket = None
+        if connection.features.has_select_for_update_skip_locked:
+            with transaction.atomic():
+                ticket = unassigned.select_for_update(skip_locked=True).first()
+                if ticket is not None:
+                    ticket.assignee_id = agent_id
+                    ticket.status = 'in_progress'
+                    ticket.save(update_fields=['assignee', 'status', 'updated_at'])
+        else:
+            # no row locks (SQLite): compare-and-swap on the still-unassigned row
+            for candidate_id in unassigned.values_list('id', flat=True)[:self.CAS_ATTEMPTS]:
+                if unassigned.filter(pk=candidate_id).update(assignee_id=agent_id, status='in_progress', updated_at=timezone.now()):
+                    SupportAgentLoad.adjust(agent_id, 1)
+                    ticket = Ticket.objects.get(pk=candidate_id)
+                    break
+        if ticket is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(TicketSerializer(ticket, context={'request': request}).data)
+
+
+class TicketDetailView(VisibleToUserMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Ticket.objects.all()
     serializer_class = TicketSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsSupportOrOwner]
@@ -307,10 +470,7 @@ class TicketDetailView(generics.RetrieveUpdateDestroyAPIView):
         # Only support users may set assignee or close the ticket; owner can update title/description
         assignee_id = self.request.data.get('assignee')
         if assignee_id:
-            # Only support role can assign
-            if getattr(self.request.user, 'role', None) != 'support':
-                from rest_framework.exceptions import PermissionDenied
-                raise PermissionDenied('Only support users can assign tickets')
+            require_role(self.request.user, 'support', 'Only support users can assign tickets')
             from django.contrib.auth import get_user_model
             User = get_user_model()
             try:
@@ -337,18 +497,23 @@ class TicketDetailView(generics.RetrieveUpdateDestroyAPIView):
         ],
     )
 )
-class TicketMessageListCreateView(generics.ListCreateAPIView):
+class TicketMessageListCreateView(IdempotentCreateMixin, generics.ListCreateAPIView):
     serializer_class = TicketMessageSerializer
 
     def get_queryset(self):
         ticket_id = self.kwargs.get('ticket_id')
-        return TicketMessage.objects.filter(ticket_id=ticket_id).order_by('created_at')
+        qs = visible_to(TicketMessage.objects.filter(ticket_id=ticket_id), self.request.user).order_by('created_at')
+        since_id = self.request.query_params.get('since_id')
+        if since_id:
+            try:
+                since_id = int(since_id)
+            except ValueError:
+                raise serializers.ValidationError({'since_id': 'since_id must be an integer.'})
+            qs = qs.filter(id__gt=since_id).order_by('id')
+        return qs
 
     def perform_create(self, serializer):
-        # Only support users can reply to tickets
-        if getattr(self.request.user, 'role', None) != 'support':
-            from rest_framework.exceptions import PermissionDenied
-            raise PermissionDenied('Only support users can reply to tickets')
+        require_role(self.request.user, 'support', 'Only support users can reply to tickets')
         ticket_id = self.kwargs.get('ticket_id')
         try:
             ticket = Ticket.objects.get(pk=ticket_id)
@@ -356,9 +521,97 @@ class TicketMessageListCreateView(generics.ListCreateAPIView):
             from rest_framework.exceptions import NotFound
             raise NotFound('Ticket not found')
         serializer.save(author=self.request.user, ticket=ticket)
+        notify_later([ticket.creator_id], 'ticket_reply', actor=self.request.user, target_id=ticket.id,
+                     text=f'New reply on ticket "{ticket.title}"')
 
 
-class ScheduleListCreateView(generics.ListCreateAPIView):
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+@extend_schema(
+    summary='Stream new ticket messages (Server-Sent Events or long-poll)',
+    parameters=[
+        OpenApiParameter('since_id', int, description='Only deliver messages with a larger id'),
+        OpenApiParameter('mode', str, enum=['sse', 'poll'], description='sse (default) keeps the connection open; poll returns after the first new messages or the timeout'),
+        OpenApiParameter('timeout', int, description='Long-poll wait in seconds'),
+    ],
+)
+class TicketMessageStreamView(APIView):
+    serializer_class = TicketMessageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def get(self, request, ticket_id):
+        from django.conf import settings
+        from django.http import StreamingHttpResponse
+        from .pubsub import ReleasingIterator, ticket_messages
+        try:
+            ticket = Ticket.objects.only('id', 'creator_id', 'assignee_id').get(pk=ticket_id)
+        except Ticket.DoesNotExist:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        user = request.user
+        if role_of(user) != 'support' and user.id not in (ticket.creator_id, ticket.assignee_id):
+            return Response({'detail': 'Not permitted.'}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            since_id = int(request.query_params.get('since_id') or request.headers.get('Last-Event-ID') or 0)
+        except ValueError:
+            return Response({'detail': 'since_id must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        release = ticket_messages.subscribe()
+        if release is None:
+            return Response({'detail': 'Too many open streams, retry later.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+
+        def fetch(after_id):
+            qs = TicketMessage.objects.filter(ticket_id=ticket_id, id__gt=after_id).order_by('id')
+            return TicketMessageSerializer(qs, many=True, context={'request': request}).data
+
+        if request.query_params.get('mode') == 'poll':
+            try:
+                timeout = min(float(request.query_params.get('timeout', 25)), getattr(settings, 'TICKET_STREAM_POLL_MAX_SECONDS', 30))
+                messages = fetch(since_id)
+                if not messages:
+                    # fetched again even on timeout: a message posted through another
+                    # worker process never wakes this process's hub
+                    ticket_messages.wait(ticket_id, since_id, timeout)
+                    messages = fetch(since_id)
+                return Response(messages)
+            finally:
+                release()
+
+        heartbeat = getattr(settings, 'TICKET_STREAM_HEARTBEAT_SECONDS', 15)
+        max_seconds = getattr(settings, 'TICKET_STREAM_MAX_SECONDS', 300)
+
+        def events():
+            import json
+            import time
+            from rest_framework.utils.encoders import JSONEncoder
+            deadline = time.monotonic() + max_seconds
+            last_id = since_id
+            yield 'retry: 3000\n\n'
+            woken = True
+            while time.monotonic() < deadline:
+                # the table is read after every heartbeat too, which is how messages
+                # posted through another worker process arrive
+                messages = fetch(last_id)
+                for message in messages:
+                    last_id = message['id']
+                    yield f"id: {last_id}\nevent: message\ndata: {json.dumps(message, cls=JSONEncoder)}\n\n"
+                if not messages and not woken:
+                    yield ': heartbeat\n\n'
+                woken = ticket_messages.wait(ticket_id, last_id, min(heartbeat, max(deadline - time.monotonic(), 0)))
+
+        response = StreamingHttpResponse(ReleasingIterator(events(), release), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class ScheduleListCreateView(IdempotentCreateMixin, generics.ListCreateAPIView):
     serializer_class = ScheduleSerializer
 
     def get_queryset(self):
@@ -368,13 +621,45 @@ class ScheduleListCreateView(generics.ListCreateAPIView):
         return Schedule.objects.all().order_by('contractor__id', 'day_of_week')
 
     def perform_create(self, serializer):
-        # Only contractors can create schedules for themselves
-        if not hasattr(self.request.user, 'role') or self.request.user.role != 'contractor':
-            from rest_framework.exceptions import PermissionDenied
-            raise PermissionDenied('Only contractors can create schedules')
+        require_role(self.request.user, 'contractor', 'Only contractors can create schedules')
         serializer.save(contractor=self.request.user)
 
 
+@extend_schema_view(
+    put=extend_schema(
+        summary="Replace a contractor's weekly schedule (contractor only)",
+        examples=[
+            OpenApiExample(
+                'Split shifts example',
+                value={
+                    'slots': [
+                        {'day_of_week': 0, 'start_time': '08:00', 'end_time': '12:00', 'location': 'Tehran'},
+                        {'day_of_week': 0, 'start_time': '14:00', 'end_time': '18:00', 'location': 'Tehran'},
+                        {'day_of_week': 1, 'start_time': '08:00', 'end_time': '12:00', 'location': 'Karaj'},
+                    ]
+                },
+                request_only=True,
+            ),
+        ],
+    )
+)
+class ScheduleBulkUpsertView(generics.GenericAPIView):
+    serializer_class = ScheduleWeekSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def put(self, request, contractor_id):
+        if role_of(request.user) != 'contractor' or request.user.id != contractor_id:
+            from rest_framework.exceptions import PermissionDenied
+            raise PermissionDenied('Contractors can only set their own schedule')
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        rows = serializer.save(contractor=request.user)
+        return Response({
+            **serializer.stats,
+            'results': ScheduleSerializer(rows, many=True, context=self.get_serializer_context()).data,
+        })
+
+
 class ScheduleDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Schedule.objects.all()
     serializer_class = ScheduleSerializer
@@ -390,10 +675,15 @@ class ContractorProfileView(generics.RetrieveAPIView):
         from .serializers import ContractorProfileSerializer
         User = get_user_model()
         try:
-            user = User.objects.annotate(avg_rating=Avg('ratings_received__score'), ratings_count=Count('ratings_received')).get(pk=pk)
+            if sharding.enabled():
+                # ratings live on the shards, next to their ads
+                user = User.objects.get(pk=pk)
+                user.avg_rating, user.ratings_count = sharding.rating_totals([user.pk]).get(user.pk, (None, 0))
+            else:
+                user = User.objects.annotate(avg_rating=Avg('ratings_received__score'), ratings_count=Count('ratings_received')).get(pk=pk)
         except User.DoesNotExist:
             return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
-        serializer = ContractorProfileSerializer(user)
+        serializer = ContractorProfileSerializer(user, context={'request': request})
         # inject the annotated fields into data
         data = serializer.data
         data['avg_rating'] = float(user.avg_rating) if user.avg_rating is not None else None
@@ -406,19 +696,21 @@ class CustomerProfileView(generics.RetrieveAPIView):
 
     def get(self, request, pk):
         from django.contrib.auth import get_user_model
-        from django.db.models import Count
         User = get_user_model()
+        from .serializers import ad_history
         try:
-            user = User.objects.annotate(ad_count=Count('ads')).get(pk=pk)
+            user = User.objects.get(pk=pk)
         except User.DoesNotExist:
             return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        ads = ad_history(user, {'request': request})
         data = {
             'id': user.id,
             'username': user.username,
             'email': user.email,
             'role': user.role,
-            'ad_count': user.ad_count,
-            'ads': AdSerializer(user.ads.all().order_by('-created_at'), many=True).data,
+            # the history holds every live and archived ad, wherever they are stored
+            'ad_count': len(ads),
+            'ads': ads,
         }
         return Response(data)
 
@@ -432,10 +724,12 @@ class ContractorListView(generics.ListAPIView):
         from django.contrib.auth import get_user_model
         User = get_user_model()
         from django.db.models import Avg, Count
-        qs = User.objects.filter(role='contractor').annotate(avg_rating=Avg('ratings_received__score'), ratings_count=Count('ratings_received'))
         min_avg = self.request.query_params.get('min_avg')
         min_reviews = self.request.query_params.get('min_reviews')
         order_by = self.request.query_params.get('order_by')
+        if sharding.enabled():
+            return self._sharded_contractors(User, min_avg, min_reviews, order_by)
+        qs = User.objects.filter(role='contractor').annotate(avg_rating=Avg('ratings_received__score'), ratings_count=Count('ratings_received'))
         if min_avg:
             qs = qs.filter(avg_rating__gte=float(min_avg))
         if min_reviews:
@@ -447,6 +741,26 @@ class ContractorListView(generics.ListAPIView):
             qs = qs.order_by('-avg_rating', '-ratings_count', 'id')
         return qs
 
+    def _sharded_contractors(self, User, min_avg, min_reviews, order_by):
+        # the ratings are spread over the shards, so the averages are combined here
+        totals = sharding.rating_totals()
+        contractors = list(User.objects.filter(role='contractor').order_by('id'))
+        for user in contractors:
+            user.avg_rating, user.ratings_count = totals.get(user.pk, (None, 0))
+        if min_avg:
+            contractors = [user for user in contractors if user.avg_rating is not None and user.avg_rating >= float(min_avg)]
+        if min_reviews:
+            contractors = [user for user in contractors if user.ratings_count >= int(min_reviews)]
+        sort_keys = {
+            'avg_rating': lambda user: (user.avg_rating is None, -(user.avg_rating or 0)),
+            'ratings_count': lambda user: -user.ratings_count,
+        }
+        if order_by in sort_keys:
+            contractors.sort(key=sort_keys[order_by])
+        else:
+            contractors.sort(key=lambda user: (user.avg_rating is None, -(user.avg_rating or 0), -user.ratings_count, user.id))
+        return contractors
+
     def get(self, request):
         from django.db.models import Avg, Count
         qs = self.get_queryset()
@@ -481,3 +795,99 @@ class UserRoleUpdateView(APIView):
         user.save()
         from users.serializers import UserSerializer
         return Response(UserSerializer(user).data)
+
+
+@extend_schema(
+    summary='Run several API requests in one round trip',
+    request=BatchRequestSerializer,
+    responses=BatchResponseSerializer,
+    examples=[
+        OpenApiExample(
+            'Ad detail screen',
+            value={
+                'parallel': True,
+                'requests': [
+                    {'method': 'GET', 'path': '/api/ads/1/'},
+                    {'method': 'GET', 'path': '/api/ads/1/comments/'},
+                    {'method': 'GET', 'path': '/api/contractors/3/profile/'},
+                    {'method': 'GET', 'path': '/api/contractors/3/ratings/'},
+                    {'method': 'GET', 'path': '/api/contractors/3/schedule/'},
+                ],
+            },
+            request_only=True,
+        ),
+    ],
+)
+class BatchView(APIView):
+    permission_classes = [permissions.AllowAny]
+    throttle_scope = 'batch'
+
+    @idempotent
+    def post(self, request):
+        serializer = BatchRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return Response({'responses': run_batch(request, data['requests'], parallel=data['parallel'])})
+
+
+class NotificationListView(generics.ListAPIView):
+    serializer_class = NotificationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return Notification.objects.none()
+        qs = Notification.objects.filter(recipient=self.request.user).order_by('-created_at')
+        if self.request.query_params.get('unread'):
+            qs = qs.filter(read=False)
+        return qs
+
+
+@extend_schema(summary='Unread notification count')
+class NotificationUnreadCountView(APIView):
+    serializer_class = UnreadCountSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        from .notifications import unread_count
+        return Response({'unread': unread_count(request.user.id)})
+
+
+@extend_schema(summary='Mark notifications as read', request=NotificationMarkReadSerializer, responses=UnreadCountSerializer)
+class NotificationMarkReadView(APIView):
+    serializer_class = NotificationMarkReadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        from .notifications import mark_read, unread_count
+        serializer = NotificationMarkReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        mark_read(request.user.id, serializer.validated_data.get('ids'))
+        return Response({'unread': unread_count(request.user.id)})
+
+
+@extend_schema(
+    summary='Daily marketplace metrics from the pre-aggregated rollups (staff/support)',
+    parameters=[
+        OpenApiParameter('metric', str, required=True, enum=['ads_created', 'proposals_created', 'proposals_accepted', 'acceptance_rate', 'avg_price']),
+        OpenApiParameter('category', str),
+        OpenApiParameter('from', OpenApiTypes.DATE),
+        OpenApiParameter('to', OpenApiTypes.DATE),
+    ],
+    responses=TimeseriesSerializer,
+)
+class StatsTimeseriesView(APIView):
+    serializer_class = TimeseriesSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        from .stats import timeseries
+        user = request.user
+        if not (user.is_staff or role_of(user) in ('support', 'admin')):
+            return Response({'detail': 'Not permitted.'}, status=status.HTTP_403_FORBIDDEN)
+        query = TimeseriesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        category = params.get('category')
+        points = timeseries(params['metric'], params['date_from'], params['date_to'], category=category)
+        return Response(TimeseriesSerializer({'metric': params['metric'], 'category': category, 'points': points}).data)
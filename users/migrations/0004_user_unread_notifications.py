@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:04
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_unread(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    if alias in getattr(settings, 'DB_SHARDS', []):
+        # notifications live on default only
+        return
+    User = apps.get_model('users', 'User')
+    Notification = apps.get_model('core', 'Notification')
+    unread = (
+        Notification.objects.using(alias)
+        .filter(recipient=OuterRef('pk'), read=False)
+        .values('recipient')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    User.objects.using(alias).update(unread_notifications=Coalesce(Subquery(unread), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_alter_user_email_alter_user_phone_number'),
+        ('core', '0011_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='unread_notifications',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_unread, migrations.RunPython.noop),
+    ]
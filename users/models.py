@@ -13,6 +13,15 @@ class User(AbstractUser):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='customer')
     email = models.EmailField('email address', unique=True, blank=True, null=True)
     phone_number = models.CharField(max_length=30, blank=True, null=True, unique=True)
+    # kept in step with core.Notification by core.notifications, so the badge is a column read
+    unread_notifications = models.PositiveIntegerField(default=0, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so the post_save signal only syncs support agent load when the role changes
+        instance._loaded_role = instance.__dict__.get('role')
+        return instance
 
     def __str__(self):
         return f"{self.username} ({self.role})"
@@ -4,6 +4,7 @@ from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from drf_spectacular.utils import extend_schema, OpenApiExample
+from core.throttling import LoginIdentifierThrottle, LoginIPThrottle
 from .serializers import LoginRequestSerializer, UserSerializer
 from .models import User
 
@@ -72,6 +73,8 @@ class RegisterView(generics.CreateAPIView):
 )
 class LoginView(APIView):
     permission_classes = [permissions.AllowAny]
+    # brute-force protection: attempts per client IP and failed attempts per account identifier
+    throttle_classes = [LoginIPThrottle, LoginIdentifierThrottle]
 
     def post(self, request):
         serializer = LoginRequestSerializer(data=request.data)
@@ -94,6 +97,7 @@ class LoginView(APIView):
             Q(username=identifier) | Q(email=identifier) | Q(phone_number=identifier)
         ).first()
         if not user or not user.check_password(password):
+            LoginIdentifierThrottle.record_failure(request, self)
             return Response(
                 {'detail': 'Invalid credentials'},
                 status=status.HTTP_400_BAD_REQUEST,